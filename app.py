@@ -1,5 +1,6 @@
 import streamlit as st
-from utils import PROJECTS, load_data, auto_categorize, estimate_inventory, natural_key, mark_penthouse
+import pandas as pd
+from utils import PROJECTS, load_data, load_data_chunked, merge_datasets, STREAM_THRESHOLD_BYTES, delta_rows, auto_categorize, sorted_uniques, mark_penthouse, get_area_bins
 
 # --- Import Modules ---
 import tab1_market
@@ -7,18 +8,42 @@ import tab2_tower
 import tab3_avm
 import tab4_history
 import tab5_settings  # [新增] 引入 Tab 5
+import tab0_portfolio
+import utils_store
+from utils_units import estimate_inventory
+from utils_prefetch import get_refresher
+
+# [V248] 写时复制：各会话拿到的浅副本共享列缓冲区，只有被修改 / 新增的列才占用会话自己的内存
+# (pandas 3 起默认开启；2.x 需显式打开。须在后台预热加载数据之前设置)
+if int(pd.__version__.split('.')[0]) < 3: pd.set_option('mode.copy_on_write', True)
+
+# [V244] 进程启动时在后台预热全部云端项目，之后定时刷新
+refresher = get_refresher()
 
 # ==================== 侧边栏 ====================
 with st.sidebar:
     st.header("1. 项目切换")
-    selected_project = st.selectbox("选择要分析的项目", list(PROJECTS.keys()))
-    sheet_url = PROJECTS[selected_project]
-    uploaded_file = None
-    project_name = selected_project
+    # [V245] 有云端项目时提供组合总览入口
+    PORTFOLIO_OPTION = "🗂️ 全部项目总览"
+    cloud_projects = {name: url for name, url in PROJECTS.items() if url}
+    # [V249] 本地成交库 (utils_store import 导入) 中的项目
+    STORE_PREFIX = "🗃️ "
+    store_projects = utils_store.list_projects()
+    project_options = list(PROJECTS.keys()) + [STORE_PREFIX + p for p in store_projects] + ([PORTFOLIO_OPTION] if cloud_projects else [])
+    selected_project = st.selectbox("选择要分析的项目", project_options)
+    sheet_url = PROJECTS.get(selected_project)
+    store_project = selected_project[len(STORE_PREFIX):] if selected_project.startswith(STORE_PREFIX) else None
+    uploaded_files = []
+    project_name = store_project or selected_project
 
     if selected_project == "📂 手动上传 CSV":
-        uploaded_file = st.file_uploader("拖入 CSV 文件", type=['csv'])
-        if uploaded_file: project_name = uploaded_file.name.replace(".csv", "")
+        # [V241] 支持同时上传多个 (可能重叠的) 导出文件，合并后自动去重
+        uploaded_files = st.file_uploader("拖入 CSV 文件 (可多选)", type=['csv'], accept_multiple_files=True) or []
+        if uploaded_files: project_name = uploaded_files[0].name.replace(".csv", "")
+    elif store_project:
+        st.success(f"🗃️ 本地成交库: {store_project}")
+    elif selected_project == PORTFOLIO_OPTION:
+        st.success(f"☁️ 已连接 {len(cloud_projects)} 个云端项目")
     else:
         st.success(f"☁️ 已连接云端: {selected_project}")
 
@@ -27,9 +52,39 @@ with st.sidebar:
 
     df = None
     if selected_project == "📂 手动上传 CSV":
-        if uploaded_file: df = load_data(uploaded_file)
+        named_frames = []
+        for uploaded_file in uploaded_files:
+            # [V240] 大文件走分块流式读取，避免整表读入内存
+            if uploaded_file.size > STREAM_THRESHOLD_BYTES:
+                progress_bar = st.progress(0.0, text=f"正在分块读取 {uploaded_file.name}...")
+                file_df = load_data_chunked(uploaded_file, progress=lambda frac, text: progress_bar.progress(frac, text=text))
+                progress_bar.empty()
+            else:
+                file_df = load_data(uploaded_file)
+            if file_df is None: st.warning(f"⚠️ 无法解析: {uploaded_file.name}")
+            named_frames.append((uploaded_file.name, file_df))
+        if len(named_frames) == 1:
+            df = named_frames[0][1]
+        elif len(named_frames) > 1:
+            df, merge_report = merge_datasets(named_frames)
+            if df is not None:
+                st.caption(f"🔗 已合并 {len(merge_report)} 个文件，共 {len(df):,} 笔成交")
+                for r in merge_report:
+                    st.caption(f"• {r['file']}: {r['rows']:,} 行，去除重复 {r['duplicates']:,} 行")
+    elif store_project:
+        # 加载范围下推到读取层：只读取所需年份的分区
+        load_range = st.selectbox("加载范围", list(utils_store.LOAD_RANGES), index=0)
+        df = utils_store.load_project(store_project, start=utils_store.range_start(load_range))
+        if df is None: st.warning("⚠️ 该范围内无成交数据")
     elif sheet_url:
-        df = load_data(sheet_url)
+        # [V244] 立即返回最近一次成功加载的数据，过期时由后台线程刷新
+        df = refresher.get(sheet_url)
+        # [V242] 增量读取时提示新增成交数；[V261] 每个数据版本只在首次显示时提示一次，之后的重绘不再重复
+        new_rows = delta_rows(df) if df is not None else []
+        seen = st.session_state.setdefault('delta_seen', {})
+        if len(new_rows) and seen.get(sheet_url) != df.attrs.get('dataset_key'):
+            st.caption(f"🆕 增量更新: 新增 {len(new_rows):,} 笔成交")
+        if df is not None: seen[sheet_url] = df.attrs.get('dataset_key')
 
     if df is not None:
         cat_ops = ["按户型面积段 (自动分箱)", "按楼座 (Block)"]
@@ -50,11 +105,11 @@ with st.sidebar:
 # ==================== 主界面 ====================
 if df is not None:
     # 1. 基础处理
-    df['Category'] = auto_categorize(df, category_method)
+    df['Category'] = auto_categorize(df, category_method, get_area_bins(project_name))
     df['Is_Special'] = mark_penthouse(df)
 
     # 2. 库存数据准备
-    unique_cats = sorted(df['Category'].unique(), key=natural_key)
+    unique_cats = sorted_uniques(df['Category'])
     inventory_map = {}
     
     estimated_counts = {}
@@ -97,5 +152,8 @@ if df is not None:
     with t4: tab4_history.render(df)
     with t5: tab5_settings.render() # [新增]
 
+elif selected_project == PORTFOLIO_OPTION:
+    tab0_portfolio.render(cloud_projects, chart_color, chart_font_size)
+
 else:
     st.info("👈 请在左侧选择项目或上传 CSV 文件。")
@@ -0,0 +1,41 @@
+"""[user-023] 单个单位估值基准：逐行 apply 的旧 calculate_avm / 基于 AVMContext 的 calculate_avm (冷: 含上下文构建；热: 上下文已缓存)。
+用法: python bench/bench_avm.py [行数] [估值次数]   (默认 100000 / 30)"""
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+
+import numpy as np
+import utils
+import utils_cache
+import utils_units
+from legacy_avm import calculate_avm as legacy_calculate_avm
+from synthetic import make_csv
+from tab3_avm import calculate_avm
+
+def _ms_each(fn, targets):
+    started = time.perf_counter()
+    for blk, floor, stack in targets: fn(blk, floor, stack)
+    return (time.perf_counter() - started) / len(targets) * 1000
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = utils.load_data(io.BytesIO(make_csv(n, seed=1)))
+    units = utils_units.unit_master(df).units
+    picks = np.random.default_rng(0).choice(len(units), k, replace=False)
+    targets = [(str(units['BLK'].iat[i]), int(units['Floor_Num'].iat[i]), str(units['Stack'].iat[i])) for i in picks]
+
+    legacy = _ms_each(lambda b, f, s: legacy_calculate_avm(df, b, f, s), targets)
+    utils_cache.DERIVED_CACHE.invalidate()
+    started = time.perf_counter()
+    calculate_avm(df, *targets[0])
+    cold = (time.perf_counter() - started) * 1000
+    warm = _ms_each(lambda b, f, s: calculate_avm(df, b, f, s), targets)
+    print(f"{len(df):,} rows, {k} valuations")
+    print(f"  {legacy:10.3f} ms  逐行 apply 的旧 calculate_avm (每次)")
+    print(f"  {cold:10.3f} ms  calculate_avm 首次 (含 AVMContext 构建)")
+    print(f"  {warm:10.3f} ms  calculate_avm (上下文已缓存，每次)")
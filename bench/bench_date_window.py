@@ -0,0 +1,31 @@
+"""[user-021] 日期范围筛选基准：逐行 .dt.date 比较 / datetime64 掩码 / 日期索引切片 (utils_time.date_window)。
+用法: python bench/bench_date_window.py [行数]   (默认 1000000)"""
+import io
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+
+import pandas as pd
+import utils
+import utils_time
+from synthetic import make_csv
+
+def _ms(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1000
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = utils.load_data(io.BytesIO(make_csv(n, seed=1)))
+    start, end = pd.Timestamp("2018-01-01"), pd.Timestamp("2020-12-31")
+    dates = df['Sale Date']
+    cases = {
+        ".dt.date 逐行比较 (旧 Tab 1)": (lambda: df[(dates.dt.date >= start.date()) & (dates.dt.date <= end.date())], 1),
+        "datetime64 掩码": (lambda: df[(dates >= start) & (dates <= end)], 10),
+        "date_window (两次二分 + 切片)": (lambda: utils_time.date_window(df, start, end), 1000),
+    }
+    print(f"{len(df):,} rows, window {start.date()} .. {end.date()} ({len(utils_time.date_window(df, start, end)):,} rows)")
+    for name, (fn, number) in cases.items():
+        print(f"  {_ms(fn, number):10.3f} ms  {name}")
@@ -0,0 +1,30 @@
+"""[user-014] 库存推定基准：逐座逐 Stack 循环的旧实现 / 向量化的 utils_units.estimate_inventory (冷: 含 UnitMaster 构建；热: UnitMaster 已缓存)。
+用法: python bench/bench_inventory.py"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+
+import utils_cache
+from legacy_inventory import estimate_inventory as legacy_estimate_inventory
+from synthetic import make_estate
+from utils_units import estimate_inventory
+
+def _ms(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1000
+
+def _cold(df):
+    # 每次先清掉派生缓存，计入 UnitMaster 的构建时间
+    utils_cache.DERIVED_CACHE.invalidate()
+    return estimate_inventory(df, 'Category')
+
+if __name__ == '__main__':
+    for n, n_blocks, n_stacks in [(20_000, 10, 8), (100_000, 45, 12), (300_000, 80, 16)]:
+        df = make_estate(n, n_blocks, n_stacks, seed=1, categorical=True)
+        assert _cold(df) == legacy_estimate_inventory(df.copy(), 'Category')
+        print(f"{n:,} rows, {n_blocks} blocks x {n_stacks} stacks")
+        print(f"  {_ms(lambda: legacy_estimate_inventory(df.copy(), 'Category'), 1):10.3f} ms  逐座逐 Stack 循环 (旧)")
+        print(f"  {_ms(lambda: _cold(df), 3):10.3f} ms  estimate_inventory (向量化，冷)")
+        print(f"  {_ms(lambda: estimate_inventory(df, 'Category'), 10):10.3f} ms  estimate_inventory (向量化，热)")
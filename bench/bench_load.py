@@ -0,0 +1,29 @@
+"""[user-001] 清洗管道基准：旧的逐行实现 (tests/legacy_clean.py) 与 clean_data 的读取 + 清洗耗时。
+用法: python bench/bench_load.py [行数 ...]   (默认 10000 100000)"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+
+import utils
+from legacy_clean import legacy_clean, legacy_read
+from synthetic import make_csv
+
+def _new(raw):
+    df, schema = utils.read_raw_frame(raw)
+    if schema: df.rename(columns=schema['rename'], inplace=True)
+    return utils.clean_data(df, date_format=utils.guess_date_format(df['Sale Date']))
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+if __name__ == '__main__':
+    for n in [int(a) for a in sys.argv[1:]] or [10_000, 100_000]:
+        raw = make_csv(n, seed=1, style="unit")
+        old = _timed(lambda: legacy_clean(legacy_read(raw)))
+        new = _timed(_new, raw)
+        print(f"{n:>9,} rows   legacy {old:7.2f}s   clean_data {new:7.2f}s   x{old / new:.1f}")
@@ -0,0 +1,33 @@
+"""[user-010] 内存占用基准：清洗后未压缩的数据帧 / compact_frame 的紧凑列类型，memory_usage(deep=True) 与会话副本 copy() 耗时。
+用法: python bench/bench_memory.py [行数]   (默认 500000)"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+
+import pandas as pd
+import utils
+from synthetic import make_csv
+
+def _cleaned(raw):
+    df, schema = utils.read_raw_frame(raw)
+    if schema: df.rename(columns=schema['rename'], inplace=True)
+    return utils.clean_data(df, date_format=utils.guess_date_format(df['Sale Date']))
+
+def _mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    legacy = _cleaned(make_csv(n, seed=1))
+    compact = utils.compact_frame(legacy.copy())
+    copy_ms = {name: min(timeit.repeat(df.copy, number=1, repeat=3)) * 1000 for name, df in [('legacy', legacy), ('compact', compact)]}
+    print(f"{n:,} rows (pandas {pd.__version__}, memory_usage deep)")
+    print(f"  legacy  {_mb(legacy):8.1f} MB   copy() {copy_ms['legacy']:7.1f} ms")
+    print(f"  compact {_mb(compact):8.1f} MB   copy() {copy_ms['compact']:7.1f} ms")
+    per_col = pd.DataFrame({'legacy MB': legacy.memory_usage(deep=True, index=False) / 1024 ** 2,
+                            'compact MB': compact.memory_usage(deep=True, index=False) / 1024 ** 2,
+                            'legacy dtype': legacy.dtypes.astype(str), 'compact dtype': compact.dtypes.astype(str)})
+    print(per_col.sort_values('legacy MB', ascending=False).round(2).to_string())
@@ -0,0 +1,99 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+import utils_resale
+import utils_time
+from utils_prefetch import get_refresher
+
+PORTFOLIO_WORKERS = 8
+
+# 各项目汇总结果按 (URL, 加载时间) 缓存，数据未刷新时不重复计算
+_SUMMARY_CACHE = {}
+_SUMMARY_LOCK = threading.Lock()
+
+def project_summary(df):
+    """单个项目的汇总指标 (口径与 Tab 1 一致：持有<30天剔除，持有<6个月不计年化)"""
+    last_date = df['Sale Date'].max()
+    recent = utils_time.date_window(df, start=last_date - pd.DateOffset(months=12))
+    resales = utils_resale.valid_resales(utils_resale.resale_pairs(df))
+    gain, ann = resales['Gain'], resales['Annualized'].to_numpy()
+    return {
+        '成交量': len(df),
+        '单位数': df['Unit_ID'].nunique(),
+        '均价 (psf)': df['Unit Price ($ psf)'].mean(),
+        '近12个月均价 (psf)': recent['Unit Price ($ psf)'].mean(),
+        '近12个月成交': len(recent),
+        '转售笔数': len(resales),
+        '盈利占比 (%)': (gain > 0).mean() * 100 if len(gain) else np.nan,
+        '平均年化回报 (%)': np.nanmean(ann) if np.isfinite(ann).any() else np.nan,
+        '最近成交': last_date.date() if pd.notna(last_date) else None,
+    }
+
+def _load_one(refresher, name, url):
+    started = time.perf_counter()
+    df, loaded_at = refresher.get_entry(url)
+    if df is None: return {'项目': name, '状态': '加载失败'}, time.perf_counter() - started
+    key = (url, loaded_at)
+    with _SUMMARY_LOCK: summary = _SUMMARY_CACHE.get(key)
+    if summary is None:
+        summary = project_summary(df)
+        with _SUMMARY_LOCK:
+            for old_key in [k for k in _SUMMARY_CACHE if k[0] == url]: del _SUMMARY_CACHE[old_key]
+            _SUMMARY_CACHE[key] = summary
+    return {'项目': name, '状态': 'OK', **summary}, time.perf_counter() - started
+
+def load_portfolio(sources, max_workers=PORTFOLIO_WORKERS):
+    """并发加载全部项目并汇总；返回 (总览表, 各项目耗时)"""
+    refresher = get_refresher()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="portfolio") as pool:
+        results = list(pool.map(lambda item: _load_one(refresher, *item), sources.items()))
+    overview = pd.DataFrame([r for r, _ in results])
+    timings = {name: t for (name, _), (_, t) in zip(sources.items(), results)}
+    return overview, timings
+
+def render(sources, chart_color="#2563eb", chart_font_size=12):
+    st.subheader("🗂️ 项目组合总览 (Portfolio Overview)")
+    if not sources:
+        st.info("未配置云端项目。")
+        return
+
+    started = time.perf_counter()
+    overview, timings = load_portfolio(sources)
+    elapsed = time.perf_counter() - started
+    slowest = max(timings.values()) if timings else 0
+    st.caption(f"并发加载 {len(sources)} 个项目，总耗时 {elapsed:.2f}s (最慢单项目 {slowest:.2f}s)")
+
+    ok = overview[overview['状态'] == 'OK'].copy()
+    failed = overview.loc[overview['状态'] != 'OK', '项目'].tolist()
+    if failed: st.warning(f"⚠️ 以下项目加载失败: {', '.join(failed)}")
+    if ok.empty: return
+
+    sort_col = st.radio("排序依据:", ['成交量', '均价 (psf)', '平均年化回报 (%)'], horizontal=True, key="portfolio_sort")
+    ok = ok.sort_values(sort_col, ascending=False)
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=ok['项目'], y=ok['成交量'], name="Volume", marker_color=chart_color, opacity=0.3, yaxis='y2'))
+    fig.add_trace(go.Scatter(x=ok['项目'], y=ok['均价 (psf)'], name="Avg PSF", mode='markers', marker=dict(size=12, color=chart_color)))
+    fig.add_trace(go.Scatter(x=ok['项目'], y=ok['近12个月均价 (psf)'], name="Avg PSF (12M)", mode='markers', marker=dict(size=10, color="#dc2626", symbol="diamond")))
+    fig.update_layout(
+        title_text="Volume & Avg PSF by Project", hovermode="x unified", legend=dict(x=0.01, y=0.99, bgcolor="rgba(255,255,255,0.8)"),
+        margin=dict(l=20, r=20, t=50, b=20), height=420, font=dict(size=chart_font_size),
+        yaxis=dict(title="Avg Price ($ psf)", side="left"),
+        yaxis2=dict(title="Volume", anchor="x", overlaying="y", side="right", showgrid=False),
+        xaxis=dict(tickangle=-45)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(
+        ok.drop(columns=['状态']), use_container_width=True, hide_index=True,
+        column_config={
+            '均价 (psf)': st.column_config.NumberColumn(format="$%.0f"),
+            '近12个月均价 (psf)': st.column_config.NumberColumn(format="$%.0f"),
+            '盈利占比 (%)': st.column_config.NumberColumn(format="%.1f%%"),
+            '平均年化回报 (%)': st.column_config.NumberColumn(format="%.1f%%"),
+        }
+    )
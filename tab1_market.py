@@ -1,9 +1,9 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+import utils_resale
+import utils_cube
+import utils_trend
 
 # [V237 Update] KPI Card 支持传入主色调
 def kpi_card(label, value, secondary="", color_hex="#111827"):
@@ -33,6 +33,9 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
 
     if "mkt_start_v237" not in st.session_state: st.session_state.mkt_start_v237 = min_db_date
     if "mkt_end_v237" not in st.session_state: st.session_state.mkt_end_v237 = max_db_date
+    # [V249] 切换项目 / 加载范围后，已保存的日期可能超出当前数据范围
+    st.session_state.mkt_start_v237 = min(max(st.session_state.mkt_start_v237, min_db_date), max_db_date)
+    st.session_state.mkt_end_v237 = min(max(st.session_state.mkt_end_v237, min_db_date), max_db_date)
 
     # 2. 宏观 KPI
     total_units = df['Unit_ID'].nunique() if 'Unit_ID' in df.columns else len(df)
@@ -80,18 +83,16 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
     end_date = st.session_state.mkt_end_v237
     if start_date > end_date: st.error("开始日期不能晚于结束日期"); return
     
-    mask = (df['Sale Date'].dt.date >= start_date) & (df['Sale Date'].dt.date <= end_date)
-    filtered_df = df.loc[mask].copy()
-    if filtered_df.empty: st.warning("该时间段内无交易数据。"); return
+    # [V255] 日期范围与图表 / 排行均由按数据集预聚合的月度立方体汇总得到，不再逐笔过滤整表
+    cube = utils_cube.period_cube(df, cat_col)
+    window = cube.window(start_date, end_date)
+    if not window['n_rows'].any(): st.warning("该时间段内无交易数据。"); return
 
     # 4. 图表逻辑
-    if "Yearly" in freq_mode: group_col, x_label = filtered_df['Sale Date'].dt.to_period("Y").astype(str), "Year"
-    elif "Quarterly" in freq_mode: group_col, x_label = filtered_df['Sale Date'].dt.to_period("Q").astype(str), "Quarter"
-    else: group_col, x_label = filtered_df['Sale Date'].dt.to_period("M").astype(str), "Month"
-
-    trend_data = filtered_df.groupby(group_col).agg(Avg_PSF=('Unit Price ($ psf)', 'mean'), Volume=('Unit Price ($ psf)', 'count')).reset_index()
-    trend_data.columns = ['Period', 'Avg PSF', 'Volume']
-    trend_data['Period'] = trend_data['Period'].astype(str)
+    if "Yearly" in freq_mode: freq, x_label = 'Y', "Year"
+    elif "Quarterly" in freq_mode: freq, x_label = 'Q', "Quarter"
+    else: freq, x_label = 'M', "Month"
+    trend_data = cube.trend(window, freq)
 
     fig = go.Figure()
     # [修改] 柱状图使用主色调，但降低透明度
@@ -106,16 +107,20 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
         xaxis=dict(title=x_label, tickangle=-45)
     )
     st.plotly_chart(fig, use_container_width=True)
+
+    # [V261] 滚动 36 个月年化增长率：取自按数据集缓存的月度序列，按月查表，不再重新回归
+    trend = utils_trend.market_trend(df)
+    with st.expander(f"📈 市场年化趋势 (滚动 36 个月)：截至 {end_date:%Y-%m} 为 {trend.at_month(end_date) * 100:+.1f}%", expanded=False):
+        growth = trend.monthly_between(start_date, end_date)
+        fig_growth = go.Figure(go.Scatter(x=growth.index.to_timestamp(), y=growth.to_numpy() * 100, mode='lines', line=dict(color=chart_color, width=2), name="Annual Growth"))
+        fig_growth.update_layout(margin=dict(l=20, r=20, t=20, b=20), height=260, font=dict(size=chart_font_size), yaxis=dict(title="年化增长 (%)", ticksuffix="%"), hovermode="x unified")
+        st.plotly_chart(fig_growth, use_container_width=True)
     st.divider()
 
     # 5. 活跃度分析
     st.markdown("##### 🔥 活跃度分析 (Top Performers)")
     def get_top(col):
-        if col not in filtered_df.columns: return "N/A", 0, 0
-        stats = filtered_df.groupby(col).agg({'Sale Price':'count', 'Unit Price ($ psf)':'mean'}).reset_index()
-        if stats.empty: return "N/A", 0, 0
-        top = stats.sort_values('Sale Price', ascending=False).iloc[0]
-        return top[col], top['Sale Price'], top['Unit Price ($ psf)']
+        return cube.top(window, col)
 
     a1, a2, a3, a4 = st.columns(4)
     b_n, b_c, b_p = get_top('BLK')
@@ -123,13 +128,12 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
     s_n, s_c, s_p = get_top('Stack')
     a2.info(f"**Top Stack: {s_n}**\n\n{s_c}笔 | ${s_p:,.0f}psf")
     
-    if 'Floor_Num' in filtered_df.columns:
-        filtered_df['Floor_Zone'] = filtered_df['Floor_Num'].apply(lambda x: 'Low' if x<=5 else ('Mid' if x<=15 else 'High'))
+    if 'Floor_Zone' in cube.dims:
         f_n, f_c, f_p = get_top('Floor_Zone')
         a3.info(f"**Top 层段: {f_n}**\n\n{f_c}笔 | ${f_p:,.0f}psf")
     else: a3.info("无楼层数据")
     
-    if cat_col in filtered_df.columns:
+    if cat_col in cube.dims:
         c_n, c_c, c_p = get_top(cat_col)
         a4.info(f"**Top 户型: {c_n}**\n\n{c_c}笔 | ${c_p:,.0f}psf")
     else: a4.info("无户型数据")
@@ -137,22 +141,15 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
 
     # 6. 转售与回报
     st.subheader("💰 转售与回报 (Resale & Returns)")
-    full_df_sorted = df.sort_values(['Unit_ID', 'Sale Date']).copy()
-    full_df_sorted['Prev_Price'] = full_df_sorted.groupby('Unit_ID')['Sale Price'].shift(1)
-    full_df_sorted['Prev_Date'] = full_df_sorted.groupby('Unit_ID')['Sale Date'].shift(1)
-    full_df_sorted['Gain'] = full_df_sorted['Sale Price'] - full_df_sorted['Prev_Price']
-    full_df_sorted['Hold_Days'] = (full_df_sorted['Sale Date'] - full_df_sorted['Prev_Date']).dt.days
-    full_df_sorted['Hold_Years'] = full_df_sorted['Hold_Days'] / 365.0
-    full_df_sorted['Annualized'] = np.where(full_df_sorted['Hold_Days'] >= 180, ((full_df_sorted['Sale Price'] / full_df_sorted['Prev_Price']) ** (365 / full_df_sorted['Hold_Days']) - 1) * 100, np.nan)
-    
-    resale_df = full_df_sorted[(full_df_sorted['Sale Date'].dt.date >= start_date) & (full_df_sorted['Sale Date'].dt.date <= end_date) & (full_df_sorted['Prev_Price'].notnull()) & (full_df_sorted['Hold_Days'] >= 30)].copy()
+    # [V254] 转售配对表按数据集只计算一次，这里只按日期切片
+    pairs = utils_resale.resale_pairs(df)
+    resale_df = utils_resale.valid_resales(pairs, start_date, end_date)
 
     if resale_df.empty:
         st.warning("选定时间段内无有效的转售数据。")
     else:
         st.markdown("###### 1. 持有表现")
-        uid_counts = df.groupby('Unit_ID').size()
-        max_turnover = uid_counts.max() - 1 if not uid_counts.empty else 0
+        max_turnover = pairs.groupby('Unit_ID', observed=True).size().max()
         c1, c2, c3 = st.columns(3)
         with c1: st.markdown(kpi_card("平均持有时间", f"{resale_df['Hold_Years'].mean():.1f} 年"), unsafe_allow_html=True)
         with c2: st.markdown(kpi_card("最长 / 最短持有", f"{resale_df['Hold_Years'].max():.1f} / {resale_df['Hold_Years'].min():.1f} 年"), unsafe_allow_html=True)
@@ -180,5 +177,10 @@ def render(df, chart_color="#2563eb", chart_font_size=12, inventory_map=None):
         else:
             with c3: st.markdown(kpi_card("平均亏损", "-", color_hex="#dc2626"), unsafe_allow_html=True)
             with c4: st.markdown(kpi_card("最大亏损", "-", color_hex="#dc2626"), unsafe_allow_html=True)
+
+        st.markdown("###### 4. 回报分布 (Return Distribution)")
+        ssd_paid = resale_df['SSD_Rate'] > 0
+        st.caption(f"选定时间段内 {len(resale_df)} 笔转售中，{int(ssd_paid.sum())} 笔在卖出时需缴纳 SSD (平均税率 {resale_df.loc[ssd_paid, 'SSD_Rate'].mean() * 100 if ssd_paid.any() else 0:.0f}%)")
+        st.dataframe(utils_resale.return_distribution(resale_df).style.format("{:.1f}", na_rep="-"), use_container_width=True)
     st.markdown("---")
     st.caption("ℹ️ **说明**: 持有<30天数据已剔除；持有<6个月不计年化回报。")
\ No newline at end of file
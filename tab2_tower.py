@@ -3,7 +3,10 @@ import streamlit.components.v1 as components
 import pandas as pd
 import time # [关键] 必须引入 time 模块
 from datetime import datetime
-from utils import format_unit, natural_key, calculate_ssd_status 
+from utils import format_unit, format_unit_series, sorted_uniques, calculate_ssd_status 
+import utils_units
+import utils_avm
+import utils_cache
 
 def go_to_valuation(blk, floor, stack):
     st.session_state['avm_target'] = {'blk': blk, 'floor': int(floor), 'stack': stack}
@@ -16,7 +19,8 @@ def shorten_type(type_str):
     return s.replace("Bedroom", "Bed").replace("Maisonette", "Mais").replace("Apartment", "Apt")
 
 def render(df, chart_font_size=12):
-    all_blks = sorted(df['BLK'].unique(), key=natural_key)
+    all_blks = sorted_uniques(df['BLK'])
+    master = utils_units.unit_master(df)
     
     if 'selected_blk' not in st.session_state or str(st.session_state.selected_blk) not in all_blks:
         st.session_state.selected_blk = str(all_blks[0])
@@ -53,20 +57,8 @@ def render(df, chart_font_size=12):
     """, unsafe_allow_html=True)
 
     selected_blk = st.session_state.selected_blk
-    blk_df = df[df['BLK'] == selected_blk].copy()
-    all_stacks = sorted(blk_df['Stack'].unique(), key=natural_key)
-    floors = sorted(blk_df['Floor_Num'].dropna().unique().astype(int), reverse=True)
-    tx_map = blk_df.sort_values('Sale Date').groupby(['Floor_Num', 'Stack']).tail(1).set_index(['Floor_Num', 'Stack']).to_dict('index')
-
-    stack_info_map = {}
-    for s in all_stacks:
-        s_data = blk_df[blk_df['Stack'] == s]
-        if not s_data.empty:
-            valid_types = s_data[~s_data['Type'].isin(['-', 'nan', 'NaN', '', '0', 'N/A'])]['Type']
-            mode_type = valid_types.mode()[0] if not valid_types.empty else "-"
-            mode_area = s_data['Area (sqft)'].mode()[0] if not s_data['Area (sqft)'].empty else 0
-            stack_info_map[s] = {'type': mode_type, 'area': mode_area}
-        else: stack_info_map[s] = {'type': "-", 'area': 0}
+    # [V257] 楼座的 Stack / 楼层及每个格子的户型、面积、最近成交都从单位主表按键读取
+    all_stacks, floors = master.block_layout(selected_blk)
 
     st.markdown("---")
     chunk_size = 10
@@ -79,16 +71,10 @@ def render(df, chart_font_size=12):
             for i, s in enumerate(current_stacks):
                 with cols[i]:
                     unit_no = format_unit(f, s)
-                    tx_data = tx_map.get((f, s))
-                    if tx_data:
-                        u_type = shorten_type(str(tx_data.get('Type', '-')))
-                        u_area = int(tx_data.get('Area (sqft)', 0))
-                        _, ssd_icon, _, _ = calculate_ssd_status(tx_data['Sale Date'])
-                    else:
-                        defaults = stack_info_map.get(s, {})
-                        u_type = shorten_type(str(defaults.get('type', '-')))
-                        u_area = int(defaults.get('area', 0))
-                        ssd_icon = "" 
+                    area, u_type, source, _, last_date = master.spec(selected_blk, f, s)
+                    u_type = shorten_type(str(u_type))
+                    u_area = int(area) if pd.notna(area) else 0
+                    ssd_icon = calculate_ssd_status(last_date)[1] if source == 'History' else ""
                     
                     area_str = f"{u_area:,}sf" if u_area > 0 else "-"
                     label = f"{unit_no} {ssd_icon}\n{u_type} | {area_str}" if ssd_icon else f"{unit_no}\n{u_type} | {area_str}"
@@ -99,11 +85,12 @@ def render(df, chart_font_size=12):
     st.markdown("---")
     
     with st.expander("🚀 全局机会扫描 (即将解禁 / Opportunity Scan)", expanded=False):
-        latest_txs = df.sort_values('Sale Date').groupby(['BLK', 'Floor_Num', 'Stack']).tail(1).copy()
+        units = master.units
+        latest_txs = units.loc[units['Tx_Count'].to_numpy() > 0].sort_values('Last_Date', kind='stable')
         opp_list, watch_list = [], []
         
         for _, row in latest_txs.iterrows():
-            _, emoji, _, months = calculate_ssd_status(row['Sale Date'])
+            _, emoji, _, months = calculate_ssd_status(row['Last_Date'])
             if emoji in ["🟨", "🟧"]:
                 blk_val, f_val, s_val = row['BLK'], row['Floor_Num'], row['Stack']
                 unit_str = format_unit(f_val, s_val)
@@ -127,3 +114,33 @@ def render(df, chart_font_size=12):
             if not watch_list: st.caption("暂无")
             for item in watch_list:
                 st.button(item['label'], key=item['key'], help=item['help'], use_container_width=True, on_click=go_to_valuation, args=(item['b'], item['f'], item['s']))
+
+    # [V259] 批量估值：当前楼座或全盘所有单位一次估完，可按任意列排序 / 导出 (用于扫楼 / 派信)
+    with st.expander("💰 批量估值 (Batch Valuation)", expanded=False):
+        c1, c2 = st.columns([1, 1])
+        with c1: scope = st.radio("范围", [f"BLK {selected_blk}", "全盘"], horizontal=True, key="batch_avm_scope")
+        # 点击按钮时记下估值时间；同一数据集 / 范围的后续重绘直接取缓存的结果，切换后需重新点击
+        dataset_key = df.attrs.get('dataset_key')
+        with c2:
+            if st.button("生成估值表", key="batch_avm_run"): st.session_state['batch_avm_at'] = (dataset_key, scope, pd.Timestamp.now())
+        requested = st.session_state.get('batch_avm_at')
+        if dataset_key is not None and requested is not None and requested[:2] == (dataset_key, scope):
+            units = master.units if scope == "全盘" else master.units.loc[(master.units['BLK'].astype(str) == str(selected_blk)).to_numpy()]
+            valued = utils_cache.derived(df, 'batch_valuation', lambda: utils_avm.value_units(df, units, now=requested[2], workers=utils_avm.BATCH_WORKERS if len(units) > 2000 else None),
+                                         scope, requested[2])
+            table = pd.DataFrame({
+                '楼座': valued['BLK'].astype(str), '单位': format_unit_series(valued['Floor_Num'], valued['Stack'].astype(str)),
+                '户型': valued['Type'].astype(str), '面积 (sqft)': valued['Area (sqft)'],
+                '预估总价 ($M)': valued['Est_Price'] / 1e6, '预估尺价 (psf)': valued['Est_PSF'],
+                '上次成交 ($M)': valued['Last_Price'] / 1e6, '上次成交日期': valued['Last_Date'],
+                '增值 (%)': valued['Gain_Pct'], 'SSD (%)': valued['SSD_Rate'] * 100, '净增值 ($M)': valued['Net_Gain'] / 1e6,
+            })
+            st.caption(f"共 {len(table):,} 个单位，其中 {int(valued['Est_PSF'].notna().sum()):,} 个有估值；点击表头排序")
+            st.dataframe(table, use_container_width=True, hide_index=True, column_config={
+                '面积 (sqft)': st.column_config.NumberColumn(format="%d"),
+                '预估总价 ($M)': st.column_config.NumberColumn(format="%.2f"), '预估尺价 (psf)': st.column_config.NumberColumn(format="%.0f"),
+                '上次成交 ($M)': st.column_config.NumberColumn(format="%.2f"), '上次成交日期': st.column_config.DateColumn(format="YYYY-MM-DD"),
+                '增值 (%)': st.column_config.NumberColumn(format="%.1f"), 'SSD (%)': st.column_config.NumberColumn(format="%.0f"),
+                '净增值 ($M)': st.column_config.NumberColumn(format="%.2f"),
+            })
+            st.download_button("📥 导出 CSV", table.to_csv(index=False).encode('utf-8-sig'), file_name=f"valuation_{'all' if scope == '全盘' else selected_blk}.csv", mime="text/csv", key="batch_avm_csv")
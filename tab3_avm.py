@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
 import time 
 import io
 import urllib.parse
 import utils_address 
+import utils_units
+import utils_avm
+import utils_backtest
+import utils_resale
 
 from utils import (
     AGENT_PROFILE, 
@@ -14,7 +17,6 @@ from utils import (
     format_unit_masked, 
     render_gauge,
     render_transaction_table,
-    calculate_market_trend,
     calculate_ssd_status
 )
 
@@ -36,97 +38,34 @@ def get_address_template(project_name, blk, unit_str):
     return f"Block {blk} {street}\n{unit_str} {project_name}\n{postal_str}"
 
 def get_unit_specs(df, target_blk, target_floor, target_stack):
-    df['Floor_Int'] = pd.to_numeric(df['Floor_Num'], errors='coerce').fillna(0).astype(int)
-    this_unit = df[(df['BLK'] == target_blk) & (df['Stack'] == target_stack) & (df['Floor_Int'] == int(target_floor))]
-    if not this_unit.empty:
-        rec = this_unit.sort_values('Sale Date', ascending=False).iloc[0]
-        return rec['Area (sqft)'], rec['Type'], 'History', rec['Sale Price'], rec['Sale Date']
-    same_stack = df[(df['BLK'] == target_blk) & (df['Stack'] == target_stack)]
-    if not same_stack.empty:
-        mode_area = same_stack['Area (sqft)'].mode()
-        area = mode_area[0] if not mode_area.empty else same_stack['Area (sqft)'].mean()
-        mode_type = same_stack['Type'].mode()
-        u_type = mode_type[0] if not mode_type.empty else "N/A"
-        return area, u_type, 'Stack Inference', 0, None
-    default_area = df['Area (sqft)'].median() if not df.empty else 1000
-    default_type = df['Type'].mode()[0] if not df.empty else "3 Bedroom"
-    return default_area, default_type, 'Global Default', 0, None
+    # [V257] 从按数据集缓存的单位主表按键读取，不再每次筛选整表
+    return utils_units.unit_master(df).spec(target_blk, target_floor, target_stack)
 
-def calculate_dynamic_floor_rate(comps):
-    default_rate = 0.005 
-    valid_data = comps[['Floor_Int', 'Unit Price ($ psf)']].dropna()
-    if len(valid_data) < 3 or valid_data['Floor_Int'].nunique() < 2: return default_rate
-    x, y = valid_data['Floor_Int'], valid_data['Unit Price ($ psf)']
-    try:
-        slope, intercept = np.polyfit(x, y, 1)
-        avg_psf = y.mean()
-        if avg_psf == 0: return default_rate
-        return max(-0.002, min(0.015, slope / avg_psf))
-    except: return default_rate
-
-def calculate_avm(df, target_blk, target_floor, target_stack, override_area=None, override_type=None):
-    df = df.copy()
-    df['Floor_Int'] = pd.to_numeric(df['Floor_Num'], errors='coerce').fillna(0).astype(int)
-    market_annual_growth = calculate_market_trend(df)
+def calculate_avm(df, target_blk, target_floor, target_stack, override_area=None, override_type=None, time_index=None):
+    # [V258] 参考成交 / 楼层 / 趋势都取自按数据集缓存的 AVMContext，只对参考成交本身建表
+    ctx = utils_avm.avm_context(df)
     last_tx_price, last_tx_date = 0, None
     
     if override_area is not None and override_type is not None:
         est_area, target_type = override_area, override_type
         _, _, _, hist_price, hist_date = get_unit_specs(df, target_blk, target_floor, target_stack)
         if hist_price > 0: last_tx_price, last_tx_date = hist_price, hist_date
-        base_info_source = df[df['BLK'] == target_blk]
-        if base_info_source.empty: base_info_source = df
-        info_tenure = base_info_source['Tenure'].mode()[0] if not base_info_source['Tenure'].empty else '-'
-        info_from = base_info_source['Tenure From'].mode()[0] if not base_info_source['Tenure From'].empty else '-'
-        info_subtype = base_info_source['Sub Type'].mode()[0] if not base_info_source['Sub Type'].empty else '-'
+        info_tenure, info_from, info_subtype = ctx.block_info(target_blk)
     else:
         est_area, target_type, _, last_tx_price, last_tx_date = get_unit_specs(df, target_blk, target_floor, target_stack)
-        rec_matches = df[(df['BLK']==target_blk) & (df['Stack']==target_stack)]
-        if not rec_matches.empty:
-            rec = rec_matches.iloc[0]
-            info_tenure = str(rec.get('Tenure', '-'))
-            info_from = str(rec.get('Tenure From', '-'))
-            info_subtype = str(rec.get('Sub Type', '-'))
-        else:
-            info_tenure, info_from, info_subtype = '-', '-', '-'
-
-    required_comps = 5
-    thresholds = [0.05, 0.10, 0.15, 0.20]
-    comps, used_threshold = pd.DataFrame(), 0.0
-    for t in thresholds:
-        min_area, max_area = est_area * (1 - t), est_area * (1 + t)
-        current_comps = df[(df['Area (sqft)'] >= min_area) & (df['Area (sqft)'] <= max_area)].copy()
-        if len(current_comps) >= required_comps:
-            comps, used_threshold = current_comps, t
-            break
-    if comps.empty and 'current_comps' in locals(): comps, used_threshold = current_comps, 0.20
-    if len(comps) < 2 and target_type != "N/A":
-        comps = df[df['Type'] == target_type].copy(); used_threshold = 9.99 
-
-    limit_date = datetime.now() - pd.DateOffset(months=36)
-    recent_comps = comps[comps['Sale Date'] >= limit_date].copy()
-    if recent_comps.empty:
-        limit_date = datetime.now() - pd.DateOffset(months=60)
-        recent_comps = comps[comps['Sale Date'] >= limit_date].copy()
-    if recent_comps.empty: return None, None, {}, pd.DataFrame(), 0, 0, 0, 0
+        info_tenure, info_from, info_subtype = ctx.stack_info(target_blk, target_stack)
 
-    floor_adj_rate = calculate_dynamic_floor_rate(recent_comps)
-    recent_comps['Floor_Int'] = pd.to_numeric(recent_comps['Floor_Num'], errors='coerce').fillna(1)
-    
-    def apply_adjustment(row):
-        floor_multiplier = 1 + (target_floor - row['Floor_Int']) * floor_adj_rate
-        years_ago = (datetime.now() - row['Sale Date']).days / 365.0
-        time_multiplier = 1 + (market_annual_growth * years_ago)
-        return row['Unit Price ($ psf)'] * floor_multiplier * time_multiplier
+    result = ctx.value(target_floor, est_area, target_type, time_index=time_index)
+    if result is None: return None, None, {}, pd.DataFrame(), 0, 0, 0, 0
 
-    recent_comps['Adj_PSF'] = recent_comps.apply(apply_adjustment, axis=1)
-    recent_comps['Days_Diff'] = (datetime.now() - recent_comps['Sale Date']).dt.days
-    recent_comps['Weight'] = 1 / (recent_comps['Days_Diff'] + 30)
+    recent_comps = df.iloc[result['rows']]
+    adjustments = pd.DataFrame({'Floor_Int': ctx.floor_adj[result['rows']], 'Adj_PSF': result['adj_psf'], 'Days_Diff': result['days'], 'Weight': result['weight']}, index=recent_comps.index)
+    recent_comps = pd.concat([recent_comps, adjustments], axis=1)
     
-    weighted_psf = (recent_comps['Adj_PSF'] * recent_comps['Weight']).sum() / recent_comps['Weight'].sum()
-    est_price = weighted_psf * est_area
+    weighted_psf = result['psf']
+    est_price = result['price']
     extra_info = {'tenure': info_tenure, 'from': info_from, 'subtype': info_subtype, 'type': target_type, 'last_price': last_tx_price, 'last_date': last_tx_date}
-    return est_price, weighted_psf, extra_info, recent_comps, est_area, floor_adj_rate, market_annual_growth, used_threshold
+    return est_price, weighted_psf, extra_info, recent_comps, est_area, result['floor_rate'], result['growth'], result['threshold']
 
 def generate_pdf_letter(project_name, blk, floor, stack, area, u_type, est_price, est_psf, comps_df, mailing_address, recipient_name="Dear Homeowner", last_price=0, last_date=None):
     # (保持原有 PDF 逻辑不变)
@@ -200,15 +139,39 @@ def generate_pdf_letter(project_name, blk, floor, stack, area, u_type, est_price
     return buffer
 
 # [V237 Update] render 接收 chart_color
+def render_backtest(df):
+    """[V260] 估值回测：每笔历史成交只用此前的数据估值，按分类 / 楼座汇总误差 (结果按数据集缓存)"""
+    with st.expander("🎯 估值回测 (Backtest)", expanded=False):
+        st.caption("按时间顺序重放全部成交：每笔以成交日为估值日、只用此前的成交估值，与实际成交价比较")
+        # 只在点击按钮后运行，之后同一数据集的重绘直接显示缓存结果；切换 / 更新数据集后需重新点击
+        dataset_key = df.attrs.get('dataset_key')
+        if st.button("运行回测", key="avm_backtest_run"): st.session_state['avm_backtest_key'] = dataset_key
+        if dataset_key is None or st.session_state.get('avm_backtest_key') != dataset_key: return
+        results = utils_backtest.backtest(df)
+        if 'Category' in df.columns: results = results.assign(Category=df['Category'].to_numpy()[results['Row'].to_numpy()])
+        overall = utils_backtest.accuracy(results).iloc[0]
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("MAPE", f"{overall['MAPE']:.1f}%")
+        c2.metric("误差中位数", f"{overall['Median_Error']:+.1f}%", help="正为高估，负为低估")
+        c3.metric(f"±{utils_backtest.HIT_BAND}% 命中率", f"{overall['Hit_Rate']:.1f}%")
+        c4.metric("已估值成交", f"{int(overall['N']):,}", help=f"覆盖 {overall['Coverage']:.1f}% (此前没有参考成交的不计)")
+        config = {'N': st.column_config.NumberColumn("笔数", format="%d"), 'Coverage': st.column_config.NumberColumn("覆盖 (%)", format="%.1f"),
+                  'MAPE': st.column_config.NumberColumn("MAPE (%)", format="%.1f"), 'Median_Error': st.column_config.NumberColumn("误差中位数 (%)", format="%+.1f"),
+                  'Median_APE': st.column_config.NumberColumn("绝对误差中位数 (%)", format="%.1f"), 'Hit_Rate': st.column_config.NumberColumn("命中率 (%)", format="%.1f")}
+        views = [c for c in ['Category', 'BLK', 'Type'] if c in results.columns]
+        for tab, col in zip(st.tabs([{'Category': "按分类", 'BLK': "按楼座", 'Type': "按户型"}[c] for c in views]), views):
+            with tab: st.dataframe(utils_backtest.accuracy(results, col), use_container_width=True, hide_index=True, column_config=config)
+
 def render(df_raw, project_name="Project", chart_font_size=12, chart_color="#2563eb"):
     st.subheader("🤖 智能估值 (AVM)")
+    render_backtest(df_raw)
     target = st.session_state.get('avm_target', None)
     if not target:
         st.info("👈 请先在 **楼宇透视 (Tab 2)** 点击任意单位，即可在此查看估值详情。")
         return
 
     blk, floor, stack = target['blk'], target['floor'], target['stack']
-    df = df_raw.copy()
+    df = df_raw
     
     sys_area, sys_type, _, _, _ = get_unit_specs(df, blk, floor, stack)
     all_types = sorted(df['Type'].unique().tolist())
@@ -221,9 +184,13 @@ def render(df_raw, project_name="Project", chart_font_size=12, chart_color="#256
         c_cal1, c_cal2 = st.columns(2)
         with c_cal1: input_area = st.number_input("面积 (sqft)", value=input_area, step=10, key=f"cal_area_{widget_key_suffix}")
         with c_cal2: input_type = st.selectbox("户型 (Type)", options=all_types, index=all_types.index(input_type) if input_type in all_types else 0, key=f"cal_type_{widget_key_suffix}")
-    
+        # [V261] 时间调整可改用重复交易指数 (按季度，数据集缓存)，代替近 36 个月的线性趋势
+        time_mode = st.radio("时间调整", ["线性趋势", "重复交易指数"], horizontal=True, key="cal_time_mode")
+    time_index = utils_resale.repeat_sales_index(df) if time_mode == "重复交易指数" else None
+    if time_index is not None and time_index.empty: st.caption("⚠️ 转售配对不足，无法建立重复交易指数，参考成交不做时间调整")
+
     est_price, est_psf, extra_info, comps, area, floor_adj, market_growth, used_threshold = calculate_avm(
-        df, blk, floor, stack, override_area=input_area, override_type=input_type
+        df, blk, floor, stack, override_area=input_area, override_type=input_type, time_index=time_index
     )
     
     if est_price is None: st.error(f"⚠️ 数据严重不足，无法估值。"); return
@@ -274,10 +241,7 @@ def render(df_raw, project_name="Project", chart_font_size=12, chart_color="#256
     st.divider()
 
     # 历史记录
-    df_temp = df.copy()
-    df_temp['Floor_Int'] = pd.to_numeric(df_temp['Floor_Num'], errors='coerce').fillna(0).astype(int)
-    target_floor_int = int(floor)
-    unit_history = df_temp[(df_temp['BLK'] == blk) & (df_temp['Stack'] == stack) & (df_temp['Floor_Int'] == target_floor_int)].copy()
+    unit_history = df.iloc[utils_avm.avm_context(df).unit_rows(blk, floor, stack)]
     if not unit_history.empty:
         st.markdown("#### 📜 该单元历史交易 (Unit Transaction History)")
         render_transaction_table(unit_history)
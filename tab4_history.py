@@ -21,7 +21,7 @@ def render(df):
         except AttributeError:
             sel_types = c2.multiselect("户型 (Type)", all_types, key="filter_type_multi")
         
-    filtered_df = df.copy()
+    filtered_df = df.copy(deep=False)
     if sel_blks: filtered_df = filtered_df[filtered_df['BLK'].isin(sel_blks)]
     if sel_types: filtered_df = filtered_df[filtered_df[type_col].isin(sel_types)]
     
@@ -1,5 +1,8 @@
 import streamlit as st
 import utils_address
+import utils_cache
+from utils import clear_data_cache
+from utils_prefetch import get_refresher
 import time
 import pandas as pd
 
@@ -102,3 +105,28 @@ def render():
                 st.rerun()
     else:
         st.info("暂无数据可复制，请先在上方添加一行。")
+
+    st.markdown("---")
+
+    # 5. [V238] 数据缓存管理
+    st.subheader("🗄️ 数据缓存 (Data Cache)")
+    stats = utils_cache.cache_stats()
+    st.caption(f"磁盘缓存: {stats['entries']} 个数据集 | {stats['bytes']/1024**2:,.1f} MB / 上限 {stats['max_bytes']/1024**2:,.0f} MB。云端表格缓存 {utils_cache.URL_MAX_AGE // 60} 分钟后向服务器校验，未变化则不重新下载。")
+    mem = utils_cache.FRAME_CACHE.stats()
+    hit_rate = f"{mem['hit_rate']*100:.0f}%" if mem['hit_rate'] is not None else "-"
+    st.caption(f"内存缓存: {mem['entries']} 个数据集 | {mem['bytes']/1024**2:,.1f} MB / 上限 {mem['max_bytes']/1024**2:,.0f} MB | 命中率 {hit_rate} ({mem['hits']} / {mem['hits'] + mem['misses']}) | 淘汰 {mem['evictions']} 次，其中溢出到磁盘 {mem['spills']} 次")
+    derived = utils_cache.DERIVED_CACHE.stats()
+    st.caption(f"派生结果缓存: {derived['entries']} 项 | 约 {derived['bytes']/1024**2:,.1f} MB / 上限 {derived['max_bytes']/1024**2:,.0f} MB | 淘汰 {derived['evictions']} 次")
+    if st.button("🧹 清除数据缓存 (Clear Cache)"):
+        clear_data_cache()
+        st.toast("✅ 缓存已清除，下次加载将重新下载并清洗数据")
+        time.sleep(1)
+        st.rerun()
+
+    # 6. [V244] 后台刷新状态
+    st.subheader("🔄 后台刷新 (Background Refresh)")
+    refresher = get_refresher()
+    st.caption(f"全部云端项目在启动时预热，并每 {refresher.interval // 60} 分钟在后台刷新；页面始终先显示最近一次成功加载的数据。")
+    refresh_stats = refresher.stats_frame()
+    if refresh_stats.empty: st.info("未配置云端项目。")
+    else: st.dataframe(refresh_stats, use_container_width=True, hide_index=True)
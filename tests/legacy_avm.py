@@ -0,0 +1,87 @@
+# V258 以前 Tab 3 的单个单位估值 (逐行 apply、每个阈值扫描整表)，原样保留作为 tab3_avm.calculate_avm 的对照基准，不要修改
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import utils_time
+import utils_units
+from utils import calculate_market_trend
+
+def get_unit_specs(df, target_blk, target_floor, target_stack):
+    # [V257] 从按数据集缓存的单位主表按键读取，不再每次筛选整表
+    return utils_units.unit_master(df).spec(target_blk, target_floor, target_stack)
+
+def calculate_dynamic_floor_rate(comps):
+    default_rate = 0.005 
+    valid_data = comps[['Floor_Int', 'Unit Price ($ psf)']].dropna()
+    if len(valid_data) < 3 or valid_data['Floor_Int'].nunique() < 2: return default_rate
+    x, y = valid_data['Floor_Int'], valid_data['Unit Price ($ psf)']
+    try:
+        slope, intercept = np.polyfit(x, y, 1)
+        avg_psf = y.mean()
+        if avg_psf == 0: return default_rate
+        return max(-0.002, min(0.015, slope / avg_psf))
+    except: return default_rate
+
+def calculate_avm(df, target_blk, target_floor, target_stack, override_area=None, override_type=None):
+    df = df.copy(deep=False)
+    df['Floor_Int'] = pd.to_numeric(df['Floor_Num'], errors='coerce').fillna(0).astype(int)
+    market_annual_growth = calculate_market_trend(df)
+    last_tx_price, last_tx_date = 0, None
+    
+    if override_area is not None and override_type is not None:
+        est_area, target_type = override_area, override_type
+        _, _, _, hist_price, hist_date = get_unit_specs(df, target_blk, target_floor, target_stack)
+        if hist_price > 0: last_tx_price, last_tx_date = hist_price, hist_date
+        base_info_source = df[df['BLK'] == target_blk]
+        if base_info_source.empty: base_info_source = df
+        info_tenure = base_info_source['Tenure'].mode()[0] if not base_info_source['Tenure'].empty else '-'
+        info_from = base_info_source['Tenure From'].mode()[0] if not base_info_source['Tenure From'].empty else '-'
+        info_subtype = base_info_source['Sub Type'].mode()[0] if not base_info_source['Sub Type'].empty else '-'
+    else:
+        est_area, target_type, _, last_tx_price, last_tx_date = get_unit_specs(df, target_blk, target_floor, target_stack)
+        rec_matches = df[(df['BLK']==target_blk) & (df['Stack']==target_stack)]
+        if not rec_matches.empty:
+            rec = rec_matches.iloc[0]
+            info_tenure = str(rec.get('Tenure', '-'))
+            info_from = str(rec.get('Tenure From', '-'))
+            info_subtype = str(rec.get('Sub Type', '-'))
+        else:
+            info_tenure, info_from, info_subtype = '-', '-', '-'
+
+    required_comps = 5
+    thresholds = [0.05, 0.10, 0.15, 0.20]
+    comps, used_threshold = pd.DataFrame(), 0.0
+    for t in thresholds:
+        min_area, max_area = est_area * (1 - t), est_area * (1 + t)
+        current_comps = df[(df['Area (sqft)'] >= min_area) & (df['Area (sqft)'] <= max_area)].copy()
+        if len(current_comps) >= required_comps:
+            comps, used_threshold = current_comps, t
+            break
+    if comps.empty and 'current_comps' in locals(): comps, used_threshold = current_comps, 0.20
+    if len(comps) < 2 and target_type != "N/A":
+        comps = df[df['Type'] == target_type].copy(); used_threshold = 9.99 
+
+    limit_date = datetime.now() - pd.DateOffset(months=36)
+    recent_comps = utils_time.date_window(comps, start=limit_date).copy()
+    if recent_comps.empty:
+        limit_date = datetime.now() - pd.DateOffset(months=60)
+        recent_comps = utils_time.date_window(comps, start=limit_date).copy()
+    if recent_comps.empty: return None, None, {}, pd.DataFrame(), 0, 0, 0, 0
+
+    floor_adj_rate = calculate_dynamic_floor_rate(recent_comps)
+    recent_comps['Floor_Int'] = pd.to_numeric(recent_comps['Floor_Num'], errors='coerce').fillna(1)
+    
+    def apply_adjustment(row):
+        floor_multiplier = 1 + (target_floor - row['Floor_Int']) * floor_adj_rate
+        years_ago = (datetime.now() - row['Sale Date']).days / 365.0
+        time_multiplier = 1 + (market_annual_growth * years_ago)
+        return row['Unit Price ($ psf)'] * floor_multiplier * time_multiplier
+
+    recent_comps['Adj_PSF'] = recent_comps.apply(apply_adjustment, axis=1)
+    recent_comps['Days_Diff'] = (datetime.now() - recent_comps['Sale Date']).dt.days
+    recent_comps['Weight'] = 1 / (recent_comps['Days_Diff'] + 30)
+    
+    weighted_psf = (recent_comps['Adj_PSF'] * recent_comps['Weight']).sum() / recent_comps['Weight'].sum()
+    est_price = weighted_psf * est_area
+    extra_info = {'tenure': info_tenure, 'from': info_from, 'subtype': info_subtype, 'type': target_type, 'last_price': last_tx_price, 'last_date': last_tx_date}
+    return est_price, weighted_psf, extra_info, recent_comps, est_area, floor_adj_rate, market_annual_growth, used_threshold
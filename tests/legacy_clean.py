@@ -0,0 +1,79 @@
+import io
+import re
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from utils import COLUMN_RENAME_MAP, format_unit
+
+# 向量化之前 (V238 以前) load_data 的逐行清洗实现，原样保留作为 clean_data 的对照基准，不要修改
+
+def legacy_read(raw):
+    """原表头探测：前 20 行中第一个包含关键字的行作为表头"""
+    df_temp = pd.read_csv(io.BytesIO(raw), header=None, nrows=20)
+    header_row = -1
+    keywords = ["Sale Date", "Date of Sale", "BLK", "Block", "Transacted Price", "Sale Price", "Price"]
+    for i, row in df_temp.iterrows():
+        row_str = row.astype(str).str.cat(sep=',')
+        if any(k in row_str for k in keywords):
+            header_row = i; break
+    return pd.read_csv(io.BytesIO(raw), header=header_row if header_row != -1 else 0)
+
+def legacy_clean(df):
+    # 1. 基础清洗
+    df.columns = df.columns.str.strip()
+    df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
+
+    # 2. 数值清洗
+    for col in ['Sale Price', 'Unit Price ($ psf)', 'Area (sqft)']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(r'[$,]', '', regex=True)
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # 3. 日期清洗
+    if 'Sale Date' in df.columns:
+        df['Sale Date'] = pd.to_datetime(df['Sale Date'], errors='coerce')
+        df['Sale Year'] = df['Sale Date'].dt.year
+        df['Date_Ordinal'] = df['Sale Date'].map(datetime.toordinal)
+
+    # 4. 楼层/Stack 拆分
+    if ('Floor' not in df.columns or 'Stack' not in df.columns) and 'Stack' in df.columns:
+        sample = str(df['Stack'].iloc[0])
+        if '#' in sample or '-' in sample:
+            def split_unit(val):
+                s = str(val).replace('#', '')
+                parts = s.split('-')
+                if len(parts) >= 2: return parts[0], parts[1]
+                return np.nan, np.nan
+
+            if 'Floor' not in df.columns:
+                df['Floor'] = df['Stack'].apply(lambda x: split_unit(x)[0])
+            df['Stack_New'] = df['Stack'].apply(lambda x: split_unit(x)[1])
+            df['Stack'] = df['Stack_New']
+
+    # 5. 标准化核心字段
+    if 'BLK' in df.columns: df['BLK'] = df['BLK'].astype(str).str.strip()
+    else: df['BLK'] = "1"
+
+    if 'Stack' in df.columns: df['Stack'] = df['Stack'].astype(str).str.strip()
+    else: df['Stack'] = "01"
+
+    if 'Floor' in df.columns:
+        df['Floor_Num'] = pd.to_numeric(df['Floor'], errors='coerce')
+        mask_nan = df['Floor_Num'].isna() & df['Floor'].notna()
+        if mask_nan.any():
+            def extract_floor(val):
+                try: return int(re.search(r'\d+', str(val)).group())
+                except: return 1
+            df.loc[mask_nan, 'Floor_Num'] = df.loc[mask_nan, 'Floor'].apply(extract_floor)
+    else:
+        df['Floor'] = 1
+        df['Floor_Num'] = 1
+
+    # 6. 补全其他
+    for col in ['Type', 'Tenure', 'Tenure From', 'Sub Type']:
+        if col not in df.columns: df[col] = "N/A"
+
+    # 7. 生成标准 Unit 字符串
+    df['Unit'] = df.apply(lambda row: format_unit(row['Floor_Num'], row['Stack']), axis=1)
+    df['Unit_ID'] = df['BLK'].astype(str) + "-" + df['Stack'].astype(str) + "-" + df['Floor_Num'].astype(str)
+    return df
@@ -0,0 +1,29 @@
+# 向量化之前 (V251 以前) 的楼层溢价估计，原样保留作为 utils.get_dynamic_floor_premium 的对照基准，不要修改
+from datetime import timedelta
+import numpy as np
+
+def get_dynamic_floor_premium(df, category):
+    cat_df = df[df['Category'] == category].copy()
+    if cat_df.empty: return 0.005
+    recent_limit = cat_df['Sale Date'].max() - timedelta(days=365*5)
+    recent_df = cat_df[cat_df['Sale Date'] >= recent_limit]
+    if 'Stack' not in recent_df.columns: return 0.005
+    grouped = recent_df.groupby(['BLK', 'Stack'], observed=True)
+    rates = []
+    for _, group in grouped:
+        if len(group) < 2: continue
+        recs = group.to_dict('records')
+        for i in range(len(recs)):
+            for j in range(i + 1, len(recs)):
+                r1, r2 = recs[i], recs[j]
+                if abs((r1['Sale Date'] - r2['Sale Date']).days) > 540: continue
+                floor_diff = r1['Floor_Num'] - r2['Floor_Num']
+                if floor_diff == 0: continue
+                if r1['Floor_Num'] > r2['Floor_Num']: high, low, f_delta = r1, r2, floor_diff
+                else: high, low, f_delta = r2, r1, -floor_diff
+                rate = ((high['Sale PSF'] - low['Sale PSF']) / low['Sale PSF']) / f_delta
+                if -0.005 < rate < 0.03: rates.append(rate)
+    if len(rates) >= 3:
+        fitted_rate = float(np.median(rates))
+        return max(0.001, min(0.015, fitted_rate))
+    else: return 0.005
@@ -0,0 +1,52 @@
+# 向量化之前 (V250 以前) 的库存推定，原样保留作为 utils_units.estimate_inventory 的对照基准，不要修改
+
+def detect_block_step(blk_df):
+    if blk_df.empty or 'Stack' not in blk_df.columns: return 1
+    unique_stacks = blk_df['Stack'].unique()
+    if len(unique_stacks) == 0: return 1
+    votes_simplex, votes_maisonette = 0, 0
+    for stack in unique_stacks:
+        stack_df = blk_df[blk_df['Stack'] == stack]
+        floors = sorted(stack_df['Floor_Num'].dropna().unique())
+        if len(floors) < 2: continue
+        has_odd = any(f % 2 != 0 for f in floors)
+        has_even = any(f % 2 == 0 for f in floors)
+        if (has_odd and not has_even) or (not has_odd and has_even): votes_maisonette += 1
+        else: votes_simplex += 1
+    return 2 if votes_maisonette > votes_simplex else 1
+
+def get_stack_start_floor(stack_df, block_min_f, step):
+    if step == 1: return block_min_f
+    floors = sorted(stack_df['Floor_Num'].dropna().unique())
+    if not floors: return block_min_f
+    odd_count = sum(1 for f in floors if f % 2 != 0)
+    even_count = sum(1 for f in floors if f % 2 == 0)
+    is_odd_stack = odd_count > even_count
+    start = block_min_f
+    while True:
+        if (start % 2 != 0) == is_odd_stack: return start
+        start += 1
+
+def estimate_inventory(df, category_col='Category'):
+    if 'BLK' not in df.columns or 'Floor_Num' not in df.columns: 
+        return df[category_col].value_counts().to_dict() if category_col in df.columns else {}
+    if 'Stack' not in df.columns: return df[category_col].value_counts().to_dict()
+    df = df.dropna(subset=['Floor_Num']).copy()
+    final_totals = {cat: 0 for cat in df[category_col].unique()}
+    unique_blocks = df['BLK'].unique()
+    for blk in unique_blocks:
+        blk_df = df[df['BLK'] == blk]
+        step = detect_block_step(blk_df)
+        if blk_df['Floor_Num'].empty: continue
+        min_f, max_f = int(blk_df['Floor_Num'].min()), int(blk_df['Floor_Num'].max())
+        if min_f < 1: min_f = 1
+        for stack in blk_df['Stack'].unique():
+            stack_df = blk_df[blk_df['Stack'] == stack]
+            if not stack_df.empty:
+                dominant_cat = stack_df[category_col].mode()[0]
+                start_f = get_stack_start_floor(stack_df, min_f, step)
+                final_totals[dominant_cat] = final_totals.get(dominant_cat, 0) + len(range(start_f, max_f + 1, step))
+    observed_counts = df.groupby(category_col)['Unit_ID'].nunique().to_dict()
+    for cat in final_totals:
+        if final_totals[cat] < observed_counts.get(cat, 0): final_totals[cat] = observed_counts.get(cat, 0)
+    return final_totals
@@ -0,0 +1,17 @@
+# V252 以前的市场趋势 (每次调用对近 36 个月做 np.polyfit)，原样保留作为 utils.calculate_market_trend 的对照基准，不要修改
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+def calculate_market_trend(full_df):
+    limit_date = datetime.now() - pd.DateOffset(months=36)
+    trend_data = full_df[full_df['Sale Date'] >= limit_date].copy()
+    if len(trend_data) < 10: return 0.0
+    trend_data['Date_Ord'] = trend_data['Sale Date'].map(datetime.toordinal)
+    x, y = trend_data['Date_Ord'], trend_data['Unit Price ($ psf)']
+    try:
+        slope, intercept = np.polyfit(x, y, 1)
+        avg_price = y.mean()
+        if avg_price == 0: return 0.0
+        return max(-0.05, min(0.10, (slope / avg_price) * 365))
+    except: return 0.0
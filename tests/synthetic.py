@@ -0,0 +1,82 @@
+import io
+import numpy as np
+import pandas as pd
+
+# 测试 / 基准共用的合成数据：URA 导出格式 (列名、"$1,234" 金额、"17 May 2013" 日期)
+TYPES = np.array(["1 Bedroom", "2 Bedroom", "3 Bedroom", "4 Bedroom", "Penthouse"])
+
+def make_df(n, seed=0, style="unit", n_blocks=12, n_stacks=8):
+    """n 笔成交的原始表格：style='unit' 为 "#05-01" 单位号，'floor' 为 Floor Level (含 "01 to 05" 区间) + Stack 两列"""
+    rng = np.random.default_rng(seed)
+    blk = rng.integers(1, n_blocks + 1, n).astype(str)
+    blk = np.char.add(blk, np.where(rng.random(n) < 0.2, "A", ""))
+    stack = rng.integers(1, n_stacks + 1, n)
+    floor = rng.integers(1, 26, n)
+    floor = np.where(blk == "3", floor | 1, floor)    # 3 座只有单数楼层 (跃层)
+    area = np.round(rng.choice([646, 904, 1066, 1302, 1485, 1800, 2700], n) * (1 + rng.normal(0, 0.02, n)))
+    days = rng.integers(0, 365 * 15, n)
+    date = pd.Timestamp("2010-01-01") + pd.to_timedelta(days, unit="D")
+    psf = np.round(1000 + days * 0.1 + floor * 5 + rng.normal(0, 60, n), 0)
+    price = np.round(psf * area, -3)
+    d = {"Project Name": "TEST CONDO", "Block": blk}
+    if style == "unit":
+        d["Unit"] = [f"#{f:02d}-{s:02d}" for f, s in zip(floor, stack)]
+    else:
+        d["Floor Level"] = [f"{f:02d} to {f + 4:02d}" if i % 7 == 0 else str(f) for i, f in enumerate(floor)]
+        d["Stack"] = stack.astype(str)
+    d.update({
+        "Area (SQFT)": area, "Type": TYPES[np.clip((area // 400).astype(int) - 1, 0, 4)],
+        "Transacted Price ($)": [f"${p:,.0f}" for p in price],
+        "Unit Price ($ psf)": [f"${p:,.0f}" for p in psf],
+        "Sale Date": date.strftime("%d %b %Y"),
+        "Tenure": "99 yrs from 2008", "Property Type": "Condominium",
+    })
+    return pd.DataFrame(d)
+
+def make_csv(n, seed=0, style="unit", junk=True, **kw):
+    """CSV 字节串；junk=True 时表头前带两行说明文字 (同 URA 导出)"""
+    df = make_df(n, seed, style, **kw)
+    out = io.StringIO()
+    if junk:
+        pad = "," * (df.shape[1] - 1)
+        out.write(f"URA Private Residential Transactions{pad}\nGenerated 2024{pad}\n")
+    df.to_csv(out, index=False)
+    return out.getvalue().encode()
+
+def make_estate(n, n_blocks, n_stacks, seed=0, categorical=False):
+    """已清洗格式的楼盘 (库存推定用)：每隔两座为跃层 (偶数 Stack 只有双数楼层)，
+    含无楼层、半层与 <=0 的楼层；categorical=True 时文本列为有序分类 (同 compact_frame)"""
+    import utils
+    rng = np.random.default_rng(seed)
+    blk = rng.integers(1, n_blocks + 1, n).astype(str)
+    stack = rng.integers(1, n_stacks + 1, n).astype(str)
+    floor = rng.integers(-1, 30, n).astype(float)
+    maisonette = np.isin(blk, [str(b) for b in range(1, n_blocks + 1, 3)])
+    floor = np.where(maisonette, np.where(stack.astype(int) % 2 == 0, floor // 2 * 2, floor // 2 * 2 + 1), floor)
+    floor[rng.random(n) < 0.02] = np.nan
+    floor[rng.random(n) < 0.01] += 0.5
+    df = pd.DataFrame({
+        'BLK': blk, 'Stack': stack, 'Floor_Num': floor, 'Category': rng.choice(['2 BR', '10 BR', '3 BR', 'PH'], n),
+        'Type': rng.choice(TYPES[:4], n), 'Area (sqft)': rng.choice([646.0, 904.0, 1302.0], n),
+        'Sale Date': pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3000, n), unit="D"),
+        'Sale Price': rng.integers(8, 30, n) * 1e5,
+    })
+    df['Unit_ID'] = utils.make_unit_id(df)
+    if categorical:
+        for col in ['Category', 'BLK', 'Stack']: df[col] = utils.natural_categorical(df[col])
+    return df
+
+def make_repeat_sales(n_units=3000, seed=0, years=10):
+    """已知季度指数的转售数据 (只含 Unit_ID / Sale Date / Sale Price 三列)：
+    每个单位成交 2~4 次，价格 = 单位基准价 × 当季指数 × 对数正态噪声。返回 (df, 真实指数 Series，首季 = 100)"""
+    rng = np.random.default_rng(seed)
+    quarters = pd.period_range("2010Q1", periods=years * 4, freq="Q")
+    log_index = np.concatenate([[0.0], np.cumsum(rng.normal(0.01, 0.03, len(quarters) - 1))])
+    sales = rng.integers(2, 5, n_units)
+    unit = np.repeat(np.arange(n_units), sales)
+    days = rng.integers(0, years * 365, len(unit))
+    dates = pd.Timestamp("2010-01-01") + pd.to_timedelta(days, unit="D")
+    q = dates.to_period("Q").asi8 - quarters[0].ordinal
+    price = rng.uniform(0.8e6, 3e6, n_units)[unit] * np.exp(log_index[q] + rng.normal(0, 0.02, len(unit)))
+    df = pd.DataFrame({'Unit_ID': [f"U{u}" for u in unit], 'Sale Date': dates, 'Sale Price': np.round(price, -3)})
+    return df.sort_values('Sale Date', kind='stable').reset_index(drop=True), pd.Series(100 * np.exp(log_index), index=quarters)
@@ -0,0 +1,54 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+import utils_avm
+import utils_units
+from legacy_avm import calculate_avm as legacy_calculate_avm
+from synthetic import make_csv
+from tab3_avm import calculate_avm
+
+NOW = pd.Timestamp("2024-06-30 15:30")
+
+def test_batch_valuation_matches_single_unit_path():
+    """批量估值与逐个单位调用 AVMContext.value 逐行一致 (面积取单位主表的 float32 值，面积段边界与单个估值相同)"""
+    df = utils.load_data(io.BytesIO(make_csv(4000, seed=5)))
+    units = utils_units.unit_master(df).units
+    valued = utils_avm.value_units(df, units, now=NOW)
+    ctx = utils_avm.avm_context(df)
+    area, floors, types = units['Area (sqft)'].to_numpy(), units['Floor_Num'].to_numpy(), units['Type'].astype(str).to_numpy()
+    assert area.dtype == np.float32
+    expected = np.full(len(units), np.nan)
+    for i in range(len(units)):
+        result = ctx.value(floors[i], area[i], types[i], now=NOW)
+        if result is not None: expected[i] = result['psf']
+    assert np.isfinite(expected).sum() > len(units) // 2
+    np.testing.assert_array_equal(valued['Est_PSF'].to_numpy(), expected)
+    np.testing.assert_array_equal(valued['Est_Price'].to_numpy(), expected * area)
+
+def test_single_valuation_matches_legacy():
+    """基于 AVMContext 的 calculate_avm 与逐行 apply 的旧实现结果相同 (楼层回归改为闭式解，与 np.polyfit 只差舍入)"""
+    df = utils.load_data(io.BytesIO(make_csv(3000, seed=7)))
+    units = utils_units.unit_master(df).units
+    for i in np.random.default_rng(1).choice(len(units), 25, replace=False):
+        target = (str(units['BLK'].iat[i]), int(units['Floor_Num'].iat[i]), str(units['Stack'].iat[i]))
+        new, old = calculate_avm(df, *target), legacy_calculate_avm(df, *target)
+        assert (new[0] is None) == (old[0] is None)
+        if new[0] is None: continue
+        assert new[0] == pytest.approx(old[0], rel=1e-6) and new[5] == pytest.approx(old[5], rel=1e-6) and new[7] == old[7]
+        assert list(new[3].index) == list(old[3].index)
+
+def test_repeat_sales_time_adjustment():
+    """time_index 给定时按指数调整参考成交：指数平坦时等同于增长率为 0，估值日所在期指数翻倍时估值翻倍"""
+    df = utils.load_data(io.BytesIO(make_csv(3000, seed=9)))
+    ctx = utils_avm.avm_context(df)
+    unit = utils_units.unit_master(df).units.iloc[0]
+    args = (unit['Floor_Num'], unit['Area (sqft)'], str(unit['Type']))
+    now = pd.Timestamp("2026-01-15")    # 晚于全部成交
+    periods = pd.period_range("2000Q1", "2030Q4", freq="Q")
+    flat = pd.DataFrame({'Index': np.full(len(periods), 100.0), 'Pairs': 0}, index=periods)
+    base = ctx.value(*args, now=now, growth=0.0)
+    assert ctx.value(*args, now=now, time_index=flat)['psf'] == pytest.approx(base['psf'], rel=1e-12)
+    doubled = flat.assign(Index=np.where(periods >= now.to_period('Q'), 200.0, 100.0))
+    assert ctx.value(*args, now=now, time_index=doubled)['psf'] == pytest.approx(2 * base['psf'], rel=1e-12)
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import utils
+import utils_backtest
+import utils_cache
+import utils_fetch
+from synthetic import make_df
+
+def test_incremental_backtest_matches_full_run(tmp_path, monkeypatch):
+    """增量读取后的回测只重算最早新增成交日期及以后的成交，结果与整表重算逐位一致"""
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    df = make_df(2200, seed=11)
+    df = df.iloc[np.argsort(pd.to_datetime(df['Sale Date'], format='%d %b %Y').to_numpy(), kind='stable')]
+    # 新增 200 笔都在最近 300 笔的日期范围内，与其余 100 笔旧成交交错
+    tail = np.random.default_rng(0).permutation(np.arange(1900, 2200))
+    base, appended = df.iloc[np.concatenate([np.arange(1900), np.sort(tail[:100])])], df.iloc[np.sort(tail[100:])]
+    sheet = {'content': base.to_csv(index=False).encode()}
+    monkeypatch.setattr(utils_fetch, 'fetch', lambda url, **kw: utils_fetch.FetchResult(content=sheet['content']))
+    url = "https://example.invalid/backtest.csv"
+
+    first = utils.load_source(url, revalidate=True)
+    utils_backtest.backtest(first)
+    sheet['content'] += appended.to_csv(index=False, header=False).encode()
+    updated = utils.load_source(url, revalidate=True)
+    assert len(utils.delta_rows(updated)) == 200
+
+    since, prev = utils_backtest._reusable(updated)
+    assert len(prev) > 1500 and (prev['Sale Date'] < since).all()
+    incremental = utils_backtest.backtest(updated)
+    pd.testing.assert_frame_equal(incremental, utils_backtest.walk_forward(updated), check_exact=True)
@@ -0,0 +1,38 @@
+import io
+import numpy as np
+import utils
+import utils_cache
+import utils_trend
+from synthetic import make_csv
+
+def _load(n=3000, seed=1):
+    return utils.load_data(io.BytesIO(make_csv(n, seed=seed)))
+
+def test_derived_results_are_not_shared_between_subsets():
+    """行数与首末成交日期相同的两个子集 (attrs 都带整个数据集的指纹) 不能取到对方的派生结果"""
+    df = _load()
+    rng = np.random.default_rng(0)
+    inner = np.flatnonzero((df.index > df.index[0]) & (df.index < df.index[-1]))
+    first, last = np.flatnonzero(df.index == df.index[0])[:1], np.flatnonzero(df.index == df.index[-1])[-1:]
+    picks = [np.sort(np.concatenate([first, rng.choice(inner, 985, replace=False), last])) for _ in range(2)]
+    a, b = df.iloc[picks[0]], df.iloc[picks[1]]
+    assert len(a) == len(b) and a.index[0] == b.index[0] and a.index[-1] == b.index[-1]
+    assert utils_cache.dataset_token(a) != utils_cache.dataset_token(b)
+    trend_a, trend_b = utils_trend.market_trend(a), utils_trend.market_trend(b)
+    assert trend_a is not trend_b
+    assert np.array_equal(trend_b.dates, utils_trend.MarketTrend(b).dates)
+
+def test_views_and_reloads_share_the_dataset_token():
+    df = _load()
+    token = utils_cache.dataset_token(df)
+    assert utils_cache.dataset_token(utils_cache.shared_view(df)) == token
+    assert utils_cache.dataset_token(df.copy()) == token
+    assert utils_cache.dataset_token(df[df['Sale Price'] > 0]) == token
+    assert utils_cache.dataset_token(df.iloc[:100]) != token
+
+def test_derived_cache_evicts_by_bytes():
+    cache = utils_cache.DerivedCache(max_entries=100, max_bytes=3 * 8000 + 500)
+    for i in range(5): cache.get_or_build(i, lambda: np.zeros(1000))
+    stats = cache.stats()
+    assert stats['entries'] == 3 and stats['evictions'] == 2 and stats['bytes'] <= stats['max_bytes']
+    assert cache.get_or_build('big', lambda: np.zeros(10_000)) is not None and cache.stats()['entries'] == 3
@@ -0,0 +1,64 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+import utils
+import utils_cache
+import utils_fetch
+from synthetic import make_csv
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jul 2024 00:00:00 GMT"
+
+class _Sheet(BaseHTTPRequestHandler):
+    """本地替身服务器：按 ETag 应答条件请求，fail 次数内返回 503"""
+    content, fail, log = b'', 0, []
+
+    def do_GET(self):
+        cls = type(self)
+        if cls.fail > 0:
+            cls.fail -= 1
+            status, body = 503, b''
+        elif self.headers.get('If-None-Match') == ETAG:
+            status, body = 304, b''
+        else:
+            status, body = 200, cls.content
+        cls.log.append(status)
+        self.send_response(status)
+        if status != 503: self.send_header('ETag', ETAG); self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def sheet_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    _Sheet.content, _Sheet.fail, _Sheet.log = make_csv(500, seed=6), 0, []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Sheet)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/sheet.csv"
+    server.shutdown(); server.server_close()
+
+def test_200_stores_validators(sheet_url):
+    df = utils.load_source(sheet_url, revalidate=True)
+    assert len(df) == 500 and _Sheet.log == [200]
+    meta = utils_cache.read_meta(utils_cache.source_key(sheet_url, utils.CLEAN_VERSION))
+    assert meta['etag'] == ETAG and meta['last_modified'] == LAST_MODIFIED
+
+def test_304_reuses_cached_frame_without_parsing(sheet_url, monkeypatch):
+    first = utils.load_source(sheet_url, revalidate=True)
+    def fail(*args, **kwargs): raise AssertionError("304 时不应重新解析")
+    monkeypatch.setattr(utils, 'read_raw_frame', fail)
+    monkeypatch.setattr(utils, 'clean_data', fail)
+    again = utils.load_source(sheet_url, revalidate=True)
+    assert _Sheet.log == [200, 304]
+    pd.testing.assert_frame_equal(again, first)
+
+def test_5xx_is_retried_by_the_adapter(sheet_url):
+    _Sheet.fail = 2
+    result = utils_fetch.fetch(sheet_url)
+    assert _Sheet.log == [503, 503, 200] and result.content == _Sheet.content and result.etag == ETAG
@@ -0,0 +1,15 @@
+import io
+import pytest
+import utils
+from legacy_floor_premium import get_dynamic_floor_premium as legacy_floor_premium
+from synthetic import make_csv
+
+@pytest.mark.parametrize("seed, style", [(1, "unit"), (2, "floor"), (3, "unit")])
+def test_floor_premium_matches_legacy(seed, style):
+    """各分类的楼层溢价率与逐对比较的旧实现相同"""
+    df = utils.load_data(io.BytesIO(make_csv(1500, seed=seed, style=style)))
+    df['Category'] = df['Type'].astype(str)
+    legacy_df = df.assign(**{'Sale PSF': df['Unit Price ($ psf)']})
+    for category in df['Category'].unique():
+        assert utils.get_dynamic_floor_premium(df, category) == pytest.approx(legacy_floor_premium(legacy_df, category), rel=1e-12)
+    assert utils.get_dynamic_floor_premium(df, "no such category") == legacy_floor_premium(legacy_df, "no such category")
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+from legacy_inventory import estimate_inventory as legacy_estimate_inventory
+from synthetic import make_estate
+from utils_units import estimate_inventory
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("categorical", [False, True])
+def test_estimate_inventory_matches_legacy(seed, categorical):
+    """各分类的推定库存 (含字典键顺序) 与逐座逐 Stack 循环的旧实现一致"""
+    n = int(np.random.default_rng(seed).integers(5, 3000))
+    df = make_estate(n, 1 + seed % 9, 1 + seed % 7, seed, categorical)
+    expected = legacy_estimate_inventory(df.copy(), 'Category')
+    actual = estimate_inventory(df, 'Category')
+    assert actual == expected and list(actual) == list(expected)
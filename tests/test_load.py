@@ -0,0 +1,66 @@
+import io
+import pandas as pd
+import utils
+import utils_cache
+import utils_fetch
+from synthetic import make_csv, make_df
+
+class _Upload(io.BytesIO):
+    """模拟 st.file_uploader 返回的文件对象 (带文件名)"""
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+def test_schema_cache_is_keyed_by_content_not_name():
+    """同名但内容 / 列结构不同的上传文件不会沿用旧的列映射"""
+    first = make_csv(200, seed=1, style="unit")
+    second = make_csv(200, seed=2, style="floor", junk=False)
+    utils.read_raw_frame(first, utils._schema_id(_Upload(first, "export.csv"), first))
+    df, schema = utils.read_raw_frame(second, utils._schema_id(_Upload(second, "export.csv"), second))
+    assert schema['skiprows'] == 0
+    assert 'Floor Level' in df.columns and 'Unit' not in df.columns
+
+def test_chunked_load_matches_whole_load(tmp_path, monkeypatch):
+    """分块流式读取 (逐块压缩后拼接) 与整表读取的结果完全一致，包括分类的类别顺序与日期索引"""
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    for style in ("unit", "floor"):
+        raw = make_csv(3000, seed=3, style=style)
+        whole = utils.load_data(io.BytesIO(raw))
+        utils_cache.FRAME_CACHE.invalidate(); utils_cache.invalidate()
+        chunked = utils.load_data_chunked(io.BytesIO(raw), chunk_rows=700)
+        pd.testing.assert_frame_equal(chunked, whole)
+
+def test_chunked_load_without_cache_key(tmp_path, monkeypatch):
+    """无法生成缓存键时照常读取，不读写缓存"""
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(utils_cache, 'source_key', lambda *a: None)
+    df = utils.load_data_chunked(io.BytesIO(make_csv(500, seed=4)), chunk_rows=200)
+    assert len(df) == 500
+    assert utils_cache.FRAME_CACHE.get(None) is None and not list(tmp_path.iterdir())
+
+def test_delta_load_reports_new_row_positions(tmp_path, monkeypatch):
+    """云端表格末尾追加行后只清洗新增部分；按日期重排后 delta_rows 仍指向新增的成交，结果与整表重新读取一致"""
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    lines = make_df(2200, seed=8).to_csv(index=False).encode().splitlines(keepends=True)
+    sheet = {'content': b''.join(lines[:2001])}
+    monkeypatch.setattr(utils_fetch, 'fetch', lambda url, **kw: utils_fetch.FetchResult(content=sheet['content']))
+    url = "https://example.invalid/sheet.csv"
+
+    first = utils.load_source(url, revalidate=True)
+    assert len(utils.delta_rows(first)) == 0
+    sheet['content'] = b''.join(lines)
+    updated = utils.load_source(url, revalidate=True)
+    new = utils.delta_rows(updated)
+    assert len(updated) == 2200 and len(new) == 200
+    assert utils_cache.dataset_delta(updated)[0] == first.attrs['dataset_key']
+    # 新增行分散在日期序列中 (并非都在末尾)，内容即追加的 200 行
+    assert new.min() < 2000
+    appended = utils.load_data(io.BytesIO(b''.join(lines[:1] + lines[2001:])))
+    key = ['Sale Date', 'Sale Price', 'Unit_ID']
+    got = updated.iloc[new][key].astype(str).sort_values(key).to_numpy()
+    assert (got == appended[key].astype(str).sort_values(key).to_numpy()).all()
+    # 与整表重新读取一致
+    utils_cache.invalidate()
+    fresh = utils.load_source(url, revalidate=True)
+    pd.testing.assert_frame_equal(updated.drop(columns='Unit_ID').astype({'BLK': str, 'Stack': str}),
+                                  fresh.drop(columns='Unit_ID').astype({'BLK': str, 'Stack': str}), check_dtype=False, check_categorical=False)
@@ -0,0 +1,45 @@
+import pytest
+import utils
+import utils_cache
+from synthetic import make_csv
+from utils_prefetch import ProjectRefresher
+
+URL = "https://example.com/sheet.csv"
+
+def _read(raw):
+    df, schema = utils.read_raw_frame(raw, None)
+    if schema: df.rename(columns=schema['rename'], inplace=True)
+    return df
+
+@pytest.fixture
+def refresher(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(utils_cache, 'FRAME_CACHE', utils_cache.FrameLRU())
+    frame = utils.compact_frame(utils.clean_data(_read(make_csv(500, seed=2))))
+    calls = []
+    def loader(url, revalidate=False):
+        calls.append(url)
+        utils_cache.write_frame(utils_cache.source_key(url, utils.CLEAN_VERSION), frame)
+        return frame
+    r = ProjectRefresher({'P': URL}, loader=loader)
+    r.calls = calls
+    yield r
+    r._pool.shutdown()
+
+def test_refreshed_frames_live_in_the_frame_cache(refresher):
+    df, _ = refresher.get_entry(URL)
+    key = utils_cache.source_key(URL, utils.CLEAN_VERSION)
+    assert utils_cache.FRAME_CACHE.get(key) is df
+    assert refresher.get_entry(URL)[0] is df and refresher.calls == [URL]
+
+def test_evicted_frames_are_read_back_from_disk(refresher):
+    df, _ = refresher.get_entry(URL)
+    utils_cache.FRAME_CACHE.invalidate()
+    again, _ = refresher.get_entry(URL)
+    assert again is not None and len(again) == len(df) and refresher.calls == [URL]
+
+def test_clear_cache_drops_refreshed_frames(refresher):
+    refresher.get_entry(URL)
+    utils.clear_data_cache()
+    df, _ = refresher.get_entry(URL)
+    assert df is not None and refresher.calls == [URL, URL]
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+import utils
+import utils_resale
+from synthetic import make_repeat_sales
+
+def test_repeat_sales_index_recovers_known_index():
+    """合成数据的季度重复交易指数与真实指数的对数误差很小"""
+    df, truth = make_repeat_sales(3000, seed=4)
+    index = utils_resale.repeat_sales_index(df, 'Q')
+    assert index.index.equals(truth.index)
+    err = np.abs(np.log(index['Index'].to_numpy() / truth.to_numpy()))
+    assert np.median(err) < 0.01 and err.max() < 0.05
+
+def test_index_factor_is_the_index_ratio():
+    df, truth = make_repeat_sales(3000, seed=4)
+    index = utils_resale.repeat_sales_index(df, 'Q')
+    dates = pd.to_datetime(["2011-02-10", "2014-08-01", "2018-12-31"])
+    factors = utils_resale.index_factors(index, dates, "2019-06-30")
+    expected = index.loc[pd.Period('2019Q2'), 'Index'] / index.loc[dates.to_period('Q'), 'Index'].to_numpy()
+    np.testing.assert_allclose(factors, expected, rtol=1e-12)
+    assert utils_resale.index_factor(df, dates[1], "2019-06-30") == pytest.approx(factors[1], rel=1e-12)
+
+def _ssd_rate(buy, sell):
+    """逐笔计算的 SSD 税率 (口径同 utils.calculate_ssd_status，卖出日按 sell)"""
+    for start, lock_years, rates in utils.SSD_POLICIES:
+        if buy >= start:
+            if sell >= buy + relativedelta(years=lock_years): return 0.0
+            return rates.get(relativedelta(sell, buy).years, 0.0)
+    return 0.0
+
+def test_valid_resales_filter_short_holds_and_apply_ssd():
+    df, _ = make_repeat_sales(800, seed=5, years=16)
+    # 另加 40 笔持有不足 30 天的转手
+    quick = df.drop_duplicates('Unit_ID').head(40)
+    quick = quick.assign(**{'Sale Date': quick['Sale Date'] + pd.to_timedelta(np.arange(40) % 29 + 1, unit='D')})
+    df = pd.concat([df, quick]).sort_values('Sale Date', kind='stable').reset_index(drop=True)
+    pairs = utils_resale.resale_pairs(df)
+    valid = utils_resale.valid_resales(pairs)
+    assert (pairs['Hold_Days'] < utils_resale.MIN_HOLD_DAYS).sum() >= 40
+    assert len(valid) == (pairs['Hold_Days'] >= utils_resale.MIN_HOLD_DAYS).sum() and (valid['Hold_Days'] >= 30).all()
+    window = utils_resale.valid_resales(pairs, "2015-01-01", "2018-12-31")
+    assert window['Sale Date'].between("2015-01-01", "2018-12-31 23:59:59").all()
+    assert len(window) == valid['Sale Date'].between("2015-01-01", "2018-12-31 23:59:59").sum()
+
+    expected = [_ssd_rate(b, s) for b, s in zip(pairs['Prev_Date'], pairs['Sale Date'])]
+    np.testing.assert_array_equal(pairs['SSD_Rate'].to_numpy(), expected)
+    np.testing.assert_array_equal(pairs['SSD_Rate'].to_numpy(), utils.ssd_rate_at(pairs['Prev_Date'], pairs['Sale Date']))
+    assert (pairs['SSD_Rate'] > 0).any() and (pairs['Prev_Date'] >= "2025-07-04").any()
+
+def test_return_distribution_percentiles():
+    df, _ = make_repeat_sales(800, seed=6)
+    valid = utils_resale.valid_resales(utils_resale.resale_pairs(df))
+    dist = utils_resale.return_distribution(valid)
+    assert list(dist.index) == [f"P{p}" for p in utils_resale.PERCENTILES]
+    np.testing.assert_allclose(dist['持有年数'].to_numpy(), np.percentile(valid['Hold_Years'], utils_resale.PERCENTILES))
+    np.testing.assert_allclose(dist['年化回报 (%)'].to_numpy(), np.nanpercentile(valid['Annualized'], utils_resale.PERCENTILES))
@@ -0,0 +1,66 @@
+import io
+import os
+import pandas as pd
+import pytest
+import pyarrow.dataset as ds
+import utils
+import utils_cache
+import utils_store
+from synthetic import make_csv
+
+PROJECT = "TEST CONDO"
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils_store, 'STORE_DIR', str(tmp_path / 'store'))
+    monkeypatch.setattr(utils_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(utils_cache, 'FRAME_CACHE', utils_cache.FrameLRU())
+    return tmp_path
+
+def _sorted(df):
+    return df.sort_values(['Sale Date', 'Unit_ID', 'Sale Price'], kind='stable').reset_index(drop=True)
+
+def test_reimport_is_idempotent(store):
+    """同一文件重复导入不增加行数；与旧数据部分重叠的文件只增加新的成交"""
+    raw = make_csv(3000, seed=1)
+    assert utils_store.import_csv(io.BytesIO(raw), chunk_rows=700) == {PROJECT: 3000}
+    assert utils_store.import_csv(io.BytesIO(raw), chunk_rows=900) == {PROJECT: 3000}
+    assert utils_store.read_manifest()['projects'][PROJECT]['rows'] == 3000
+    assert utils_store.list_projects() == [PROJECT]
+
+def test_overlapping_import_adds_only_new_rows(store):
+    lines = make_csv(3000, seed=1, junk=False).splitlines(keepends=True)
+    assert utils_store.import_csv(io.BytesIO(b''.join(lines[:2001]))) == {PROJECT: 2000}
+    before = utils_store.store_version()
+    overlap = b''.join(lines[:1] + lines[1001:])          # 前 1000 行已入库，后 1000 行为新增
+    assert utils_store.import_csv(io.BytesIO(overlap)) == {PROJECT: 3000}
+    assert utils_store.read_manifest()['projects'][PROJECT]['rows'] == 3000
+    assert utils_store.store_version() != before
+    assert utils_store.list_projects() == [PROJECT]
+
+def test_load_project_matches_load_data(store):
+    """读出的列与类型同 load_data (compact_frame 的输出)，内容一致"""
+    raw = make_csv(3000, seed=2)
+    utils_store.import_csv(io.BytesIO(raw), chunk_rows=700)
+    stored = utils_store.load_project(PROJECT)
+    loaded = utils.load_data(io.BytesIO(raw))
+    assert stored.dtypes.to_dict() == loaded.dtypes.to_dict()
+    pd.testing.assert_frame_equal(_sorted(stored), _sorted(loaded))
+
+def test_start_is_pushed_down_to_the_store(store):
+    """start / end 只读取该范围内的年份分区与行组，结果同全量读取后按日期筛选"""
+    utils_store.import_csv(io.BytesIO(make_csv(3000, seed=3)))
+    full = utils_store.load_project(PROJECT)
+    start, end = pd.Timestamp("2018-03-15"), pd.Timestamp("2021-06-30")
+    part = utils_store.load_project(PROJECT, start=start, end=end)
+    expected = full.loc[(full['Sale Date'] >= start) & (full['Sale Date'] <= end)].copy()
+    for col in expected.select_dtypes('category').columns:          # 子集只带出现过的类别
+        expected[col] = expected[col].cat.remove_unused_categories()
+    pd.testing.assert_frame_equal(_sorted(part), _sorted(expected))
+    # 年份分区在目录层面裁剪：范围外的年份目录不被读取
+    fragments = list(utils_store._dataset().get_fragments(filter=(ds.field('project') == PROJECT) & (ds.field('year') >= start.year)))
+    assert 0 < len(fragments) < len(list(utils_store._dataset().get_fragments()))
+    assert all(int(f.path.split('year=')[1].split(os.sep)[0]) >= start.year for f in fragments)
+    assert utils_store.load_project(PROJECT, start=pd.Timestamp("2100-01-01")) is None
+    assert utils_store.range_start("全部 (All)") is None
+    assert utils_store.range_start("近3年") == pd.Timestamp.now().normalize() - pd.DateOffset(years=3)
@@ -0,0 +1,31 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+import utils_trend
+from legacy_trend import calculate_market_trend as legacy_market_trend
+from synthetic import make_csv
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_market_trend_matches_legacy(seed):
+    """calculate_market_trend (查询缓存的 MarketTrend) 与每次 polyfit 的旧实现一致 (旧实现以 float32 求均价，差异在 1e-8 以内)"""
+    df = utils.load_data(io.BytesIO(make_csv(4000, seed=seed)))
+    # 把成交日期整体平移到最近几年，近 36 个月内有足够成交
+    shift = pd.Timestamp.now().normalize() - df['Sale Date'].max() - pd.Timedelta(days=30)
+    df = utils.compact_frame(df.assign(**{'Sale Date': df['Sale Date'] + shift}).drop(columns='Date_Ordinal'))
+    assert utils.calculate_market_trend(df) == pytest.approx(legacy_market_trend(df), abs=1e-8)
+
+def test_monthly_series_matches_window_regression():
+    """月度序列 = 各月末前 36 个月 (含月末当天) 成交的回归，逐月查表与切片一致"""
+    df = utils.load_data(io.BytesIO(make_csv(4000, seed=4)))
+    trend = utils_trend.market_trend(df)
+    for month in trend.monthly.index[::17]:
+        end = month.to_timestamp(how='end')
+        window = df[(df['Sale Date'] >= end - pd.DateOffset(months=36)) & (df['Sale Date'] <= end)]
+        x, y = window['Sale Date'].map(pd.Timestamp.toordinal).to_numpy('float64'), window['Unit Price ($ psf)'].to_numpy('float64')
+        expected = 0.0 if len(window) < 10 else max(-0.05, min(0.10, np.polyfit(x, y, 1)[0] / y.mean() * 365))
+        assert trend.at_month(end) == pytest.approx(expected, abs=1e-9)
+    between = trend.monthly_between("2015-03-20", "2016-02-01")
+    assert list(between.index.astype(str)) == [str(p) for p in pd.period_range("2015-03", "2016-02", freq="M")]
+    assert trend.at_month("1990-01-01") == 0.0 and trend.at_month("2100-01-01") == trend.monthly.iat[-1]
@@ -1,10 +1,17 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import re
+import io
+import hashlib
+import threading
 import streamlit as st
 import plotly.graph_objects as go 
+import utils_cache
+import utils_trend
+import utils_time
+import utils_fetch
 
 # ==================== 1. 全局配置与常量 ====================
 
@@ -69,6 +76,13 @@ except Exception:
 if "📂 手动上传 CSV" not in PROJECTS:
     PROJECTS["📂 手动上传 CSV"] = None
 
+# [V251] 户型面积分箱 (sqft)：默认五档；可在 secrets 的 [area_bins] 中按项目覆盖，
+# 值为分界列表 (标签自动生成) 或 {edges = [...], labels = [...]}，"default" 键覆盖全局默认
+DEFAULT_AREA_BINS = {'edges': [800, 1200, 1600, 2500], 'labels': ["Small", "Medium", "Large", "X-Large", "Giant"]}
+
+try: AREA_BIN_CONFIG = dict(st.secrets["area_bins"])
+except Exception: AREA_BIN_CONFIG = {}
+
 # ==================== 2. 通用格式化工具 ====================
 
 def natural_key(text):
@@ -93,205 +107,619 @@ def format_unit_masked(floor):
 
 # ==================== 3. 数据加载与清洗 ====================
 
-@st.cache_data(ttl=300)
-def load_data(file_or_url):
-    try:
+# 清洗逻辑版本号：修改 clean_data 的输出时必须递增，旧的磁盘缓存会随之失效
+CLEAN_VERSION = "V256"
+
+HEADER_KEYWORDS = ["Sale Date", "Date of Sale", "BLK", "Block", "Transacted Price", "Sale Price", "Price"]
+HEADER_SCAN_LINES = 20
+
+# [V239] 每个数据源的表头结构缓存: {来源: {'skiprows', 'usecols', 'rename', 'dtype'}}
+_SCHEMA_CACHE = {}
+_SCHEMA_LOCK = threading.Lock()
+SCHEMA_PREFIX_BYTES = 4096   # 表头 (及其前的说明行) 所在的开头部分，内容变化即重新探测
+
+def _schema_id(file_or_url, raw):
+    """表头结构的缓存键：来源 + 开头部分的内容指纹；上传文件另带文件大小
+    (同名文件重新导出、内容不同时不会沿用旧的列映射 / 类型；云端表格只在末尾追加，开头不变即命中)"""
+    head = hashlib.blake2b(raw[:SCHEMA_PREFIX_BYTES], digest_size=16).hexdigest()
+    if isinstance(file_or_url, str): return (file_or_url, head)
+    name = getattr(file_or_url, 'name', None)
+    return (name, len(raw), head) if name else None
+
+def _read_source_bytes(file_or_url):
+    """把数据源完整读入内存 (URL 只下载一次)"""
+    if isinstance(file_or_url, str): return utils_fetch.fetch(file_or_url).content
+    if hasattr(file_or_url, 'getvalue'): data = file_or_url.getvalue()
+    else:
         if hasattr(file_or_url, 'seek'): file_or_url.seek(0)
+        data = file_or_url.read()
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+def _sniff_schema(raw):
+    """在内存缓冲区里定位表头行，并记录需要读取的列及其重命名映射"""
+    skiprows, seen = 0, 0
+    for i, line in enumerate(raw[:65536].decode('utf-8', errors='replace').splitlines()):
+        if not line.strip(): continue
+        if any(k in line for k in HEADER_KEYWORDS): skiprows = i; break
+        seen += 1
+        if seen >= HEADER_SCAN_LINES: break
+    columns = pd.read_csv(io.BytesIO(raw), skiprows=skiprows, nrows=0).columns
+    known = set(COLUMN_RENAME_MAP) | set(COLUMN_RENAME_MAP.values())
+    usecols = [c for c in columns if str(c).strip() in known]
+    rename = {c: COLUMN_RENAME_MAP[c.strip()] for c in usecols if c.strip() in COLUMN_RENAME_MAP}
+    return {'skiprows': skiprows, 'columns': list(columns), 'usecols': usecols or None, 'rename': rename, 'dtype': None}
+
+def read_raw_frame(raw, schema_id=None):
+    """按缓存的表头结构直接读取；结构失效 (列名/类型变化) 时重新探测"""
+    with _SCHEMA_LOCK: schema = _SCHEMA_CACHE.get(schema_id) if schema_id else None
+    if schema is not None:
         try:
-            df_temp = pd.read_csv(file_or_url, header=None, nrows=20)
-            header_row = -1
-            keywords = ["Sale Date", "Date of Sale", "BLK", "Block", "Transacted Price", "Sale Price", "Price"]
-            for i, row in df_temp.iterrows():
-                row_str = row.astype(str).str.cat(sep=',')
-                if any(k in row_str for k in keywords):
-                    header_row = i; break
-            if hasattr(file_or_url, 'seek'): file_or_url.seek(0)
-            df = pd.read_csv(file_or_url, header=header_row if header_row != -1 else 0)
-        except:
-            if hasattr(file_or_url, 'seek'): file_or_url.seek(0)
-            df = pd.read_csv(file_or_url)
-
-        # 1. 基础清洗
-        df.columns = df.columns.str.strip()
-        df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
-        
-        # 2. 数值清洗
-        for col in ['Sale Price', 'Unit Price ($ psf)', 'Area (sqft)']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(r'[$,]', '', regex=True)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # 3. 日期清洗
-        if 'Sale Date' in df.columns:
-            df['Sale Date'] = pd.to_datetime(df['Sale Date'], errors='coerce')
-            df['Sale Year'] = df['Sale Date'].dt.year
-            df['Date_Ordinal'] = df['Sale Date'].map(datetime.toordinal)
-
-        # 4. [V223 Fix] 智能楼层/Stack 提取 (解决 KeyError)
-        # 如果缺 Floor 或 Stack，但有类似 "#05-01" 的数据，尝试拆分
-        if ('Floor' not in df.columns or 'Stack' not in df.columns) and 'Stack' in df.columns: # 有时 Stack 列存的是完整 Unit
-            sample = str(df['Stack'].iloc[0])
-            if '#' in sample or '-' in sample:
-                # 尝试拆分
-                def split_unit(val):
-                    s = str(val).replace('#', '')
-                    parts = s.split('-')
-                    if len(parts) >= 2: return parts[0], parts[1]
-                    return np.nan, np.nan
-                
-                if 'Floor' not in df.columns:
-                    df['Floor'] = df['Stack'].apply(lambda x: split_unit(x)[0])
-                # 如果原本 Stack 就是 Unit，需要重写 Stack 为后缀
-                df['Stack_New'] = df['Stack'].apply(lambda x: split_unit(x)[1])
-                df['Stack'] = df['Stack_New']
-
-        # 5. 标准化核心字段
-        if 'BLK' in df.columns: df['BLK'] = df['BLK'].astype(str).str.strip()
-        else: df['BLK'] = "1" # 兜底，防止无 Block 报错
-        
-        if 'Stack' in df.columns: df['Stack'] = df['Stack'].astype(str).str.strip()
-        else: df['Stack'] = "01" # 兜底
-        
-        # 处理 Floor 逻辑
-        if 'Floor' in df.columns: 
-            df['Floor_Num'] = pd.to_numeric(df['Floor'], errors='coerce')
-            # 修复范围格式 (01-05)
-            mask_nan = df['Floor_Num'].isna() & df['Floor'].notna()
-            if mask_nan.any():
-                def extract_floor(val):
-                    try: return int(re.search(r'\d+', str(val)).group())
-                    except: return 1
-                df.loc[mask_nan, 'Floor_Num'] = df.loc[mask_nan, 'Floor'].apply(extract_floor)
+            return pd.read_csv(io.BytesIO(raw), skiprows=schema['skiprows'], usecols=schema['usecols'], dtype=schema['dtype']), schema
+        except Exception:
+            pass
+    try:
+        schema = _sniff_schema(raw)
+        df = pd.read_csv(io.BytesIO(raw), skiprows=schema['skiprows'], usecols=schema['usecols'])
+    except Exception:
+        return pd.read_csv(io.BytesIO(raw)), None
+    schema['dtype'] = df.dtypes.to_dict()
+    if schema_id:
+        with _SCHEMA_LOCK: _SCHEMA_CACHE[schema_id] = schema
+    return df, schema
+
+def load_data(file_or_url):
+    """[V247] 进程内 LRU (有内存上限，淘汰时溢出到磁盘) -> 磁盘 Parquet -> 重新读取清洗
+    [V248] 所有会话共享同一份数据，返回的是写时复制的视图而非完整副本"""
+    cache_key = utils_cache.source_key(file_or_url, CLEAN_VERSION)
+    max_age = utils_cache.URL_MAX_AGE if isinstance(file_or_url, str) else None
+    df = utils_cache.FRAME_CACHE.get(cache_key, max_age=max_age) if cache_key else None
+    if df is None:
+        df = load_source(file_or_url)
+        if df is None: return None
+        utils_cache.FRAME_CACHE.put(cache_key, df)
+    return utils_cache.shared_view(df)
+
+def load_source(file_or_url, revalidate=False):
+    """不经 st.cache_data 的加载入口 (后台刷新线程使用)。revalidate=True 时跳过磁盘副本有效期，直接向服务器校验"""
+    # [V238] 先查磁盘 Parquet 缓存 (重启 / TTL 过期后无需重新下载与清洗)
+    cache_key = utils_cache.source_key(file_or_url, CLEAN_VERSION)
+    max_age = utils_cache.URL_MAX_AGE if isinstance(file_or_url, str) else None
+    cached = None if revalidate else utils_cache.read_frame(cache_key, max_age=max_age)
+    if cached is not None: return cached
+    try:
+        validators = {}
+        if isinstance(file_or_url, str):
+            # [V243] 条件请求：表格未变化 (304) 时直接复用磁盘上已清洗好的数据帧
+            meta = utils_cache.read_meta(cache_key) or {}
+            result = utils_fetch.fetch(file_or_url, etag=meta.get('etag'), last_modified=meta.get('last_modified'))
+            if result.not_modified:
+                base = utils_cache.read_frame(cache_key)
+                if base is not None:
+                    utils_cache.touch(cache_key)
+                    return base
+                result = utils_fetch.fetch(file_or_url)
+            raw, validators = result.content, result.validators
+            # [V242] 云端表格只会在末尾追加新行：前缀未变时只清洗新增部分
+            df = _load_delta(raw, cache_key, validators)
+            if df is not None: return df
         else:
-            df['Floor'] = 1
-            df['Floor_Num'] = 1 # 兜底，防止 Tab2 崩溃
+            # [V239] 数据只读取一次，表头探测与正式解析共用同一个内存缓冲区
+            raw = _read_source_bytes(file_or_url)
+        df, schema = read_raw_frame(raw, _schema_id(file_or_url, raw))
+        if schema: df.rename(columns=schema['rename'], inplace=True)
+        date_format = guess_date_format(df['Sale Date']) if 'Sale Date' in df.columns else None
+        df = clean_data(df, date_format=date_format)
+        state = _ingest_state(raw, df, schema, date_format) if schema and isinstance(file_or_url, str) else None
+        df = compact_frame(df)
+        utils_cache.write_frame(cache_key, df)
+        if state: utils_cache.write_meta(cache_key, {**state, **validators})
+        return df
+    except Exception: return None
 
-        # 6. 补全其他
-        for col in ['Type', 'Tenure', 'Tenure From', 'Sub Type']:
-            if col not in df.columns: df[col] = "N/A"
+def _ingest_state(raw, df, schema, date_format):
+    """记录已读取的原始前缀 (字节数 + 内容指纹) 及解析口径，供下次增量读取"""
+    return {
+        'bytes': len(raw), 'digest': hashlib.blake2b(raw, digest_size=16).hexdigest(), 'rows': len(df),
+        'columns': schema['columns'], 'usecols': schema['usecols'], 'rename': schema['rename'],
+        'dtype': {c: str(t) for c, t in (schema['dtype'] or {}).items()},
+        'split_units': 'Stack_New' in df.columns, 'date_format': date_format,
+    }
 
-        # 7. 生成标准 Unit 字符串
-        df['Unit'] = df.apply(lambda row: format_unit(row['Floor_Num'], row['Stack']), axis=1)
-        df['Unit_ID'] = df['BLK'].astype(str) + "-" + df['Stack'].astype(str) + "-" + df['Floor_Num'].astype(str)
-            
-        return df
+def _load_delta(raw, cache_key, validators=None):
+    """原始数据以上次读取的内容为前缀时，只解析、清洗新增的行并追加到缓存数据帧；不满足条件时返回 None。
+    合并后按日期重排，新增行不一定在末尾：其位置随数据集版本记录 (见 delta_rows)"""
+    state = utils_cache.read_meta(cache_key)
+    if not state or len(raw) < state['bytes']: return None
+    if hashlib.blake2b(raw[:state['bytes']], digest_size=16).hexdigest() != state['digest']: return None
+    base = utils_cache.read_frame(cache_key)
+    if base is None or len(base) != state['rows']: return None
+
+    delta = raw[state['bytes']:]
+    if delta.strip():
+        try:
+            new_rows = pd.read_csv(io.BytesIO(delta), header=None, names=state['columns'], usecols=state['usecols'], dtype=state['dtype'] or None)
+            new_rows.rename(columns=state['rename'], inplace=True)
+            new_rows = clean_data(new_rows, split_units=state['split_units'], date_format=state['date_format'])
+        except Exception:
+            return None
+        merged = pd.concat([base, new_rows], ignore_index=True)
+        merged['_delta'] = np.arange(len(merged)) >= len(base)   # 随日期重排一起移动，排序后即新增行的位置
+        df = compact_frame(merged)
+        new_mask = df.pop('_delta').to_numpy()
+        utils_cache.write_frame(cache_key, df)
+        utils_cache.record_delta(df, base.attrs.get('dataset_key'), np.flatnonzero(new_mask))
+    else:
+        df = base
+        utils_cache.touch(cache_key)
+    state.update({'bytes': len(raw), 'digest': hashlib.blake2b(raw, digest_size=16).hexdigest(), 'rows': len(df), **(validators or {})})
+    utils_cache.write_meta(cache_key, state)
+    return df
+
+def delta_rows(df):
+    """[V242] 增量读取时新增的成交在 df 中的行号 (按日期排序后的位置，升序)；整表读取或没有新增时为空"""
+    delta = utils_cache.dataset_delta(df)
+    return np.empty(0, dtype=np.int64) if delta is None else delta[1]
+
+# [V240] 大文件流式读取：超过该大小的上传文件按块读取与清洗，峰值内存与文件大小无关
+STREAM_THRESHOLD_BYTES = 50 * 1024 * 1024
+STREAM_CHUNK_ROWS = 100_000
+NUMERIC_SOURCE_COLS = ['Sale Price', 'Unit Price ($ psf)', 'Area (sqft)']
+
+def iter_clean_chunks(file_obj, chunk_rows=STREAM_CHUNK_ROWS, progress=None, extra_cols=()):
+    """逐块读取 CSV 并按 clean_data 的同一规则清洗，尽早丢弃无用列；内存里始终只有一块。
+    extra_cols: 额外保留的原始列 (如全国数据里的项目名)。progress(fraction, text) 可选，用于显示进度。"""
+    file_obj.seek(0, io.SEEK_END); total_bytes = file_obj.tell(); file_obj.seek(0)
+    schema = _sniff_schema(file_obj.read(65536)); file_obj.seek(0)
+    usecols = schema['usecols']
+    if usecols is not None: usecols = usecols + [c for c in schema['columns'] if str(c).strip() in extra_cols and c not in usecols]
+    # 文本列统一按字符串读取，避免各块推断出的类型不一致
+    text_cols = [c for c in (usecols or []) if schema['rename'].get(c, c.strip()) not in NUMERIC_SOURCE_COLS]
+    reader = pd.read_csv(file_obj, skiprows=schema['skiprows'], usecols=usecols, dtype={c: str for c in text_cols}, chunksize=chunk_rows)
+
+    split_units, date_format, rows = None, None, 0
+    for chunk in reader:
+        chunk.rename(columns=schema['rename'], inplace=True)
+        # 拆分规则与日期格式只由首块决定，保证各块清洗口径一致
+        if split_units is None and 'Stack' in chunk.columns and len(chunk):
+            sample = str(chunk['Stack'].iloc[0])
+            split_units = '#' in sample or '-' in sample
+        if date_format is None and 'Sale Date' in chunk.columns:
+            date_format = guess_date_format(chunk['Sale Date'])
+        part = clean_data(chunk, split_units=split_units, date_format=date_format)
+        # 统一数值列类型 (各块可能分别推断为 int / float)，再据此生成 Unit_ID
+        for col in NUMERIC_SOURCE_COLS + ['Floor_Num', 'Sale Year']:
+            if col in part.columns: part[col] = part[col].astype('float64')
+        part['Unit_ID'] = make_unit_id(part)
+        rows += len(part)
+        if progress is not None: progress(min(file_obj.tell() / total_bytes, 1.0) if total_bytes else 1.0, f"已读取 {rows:,} 行")
+        yield part
+
+class ChunkCompactor:
+    """分块读取时逐块压缩列类型：文本列按各块共享的取值表编码 (编号在各块间一致)，数值列固定为最终类型，
+    最后 finish() 把各块直接拼接为紧凑数据帧，不再经过完整的未压缩数据帧"""
+
+    def __init__(self):
+        self._vocab = {}    # 列 -> ({取值: 编号}, 取值列表, 原始 dtype)
+        self._parts = []
+
+    def _encode(self, col, series):
+        index, values, _ = self._vocab.setdefault(col, ({}, [], series.dtype))
+        codes, uniques = pd.factorize(series)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, u in enumerate(uniques):
+            code = index.get(u)
+            if code is None: code = index[u] = len(values); values.append(u)
+            mapping[i] = code
+        return np.where(codes >= 0, mapping.take(np.maximum(codes, 0)) if len(mapping) else -1, -1).astype(np.int32)
+
+    def add(self, part):
+        part = part.drop(columns=[c for c in REDUNDANT_COLS if c in part.columns])
+        for col in part.columns:
+            if col in self._vocab or (col in CATEGORY_COLS and (part[col].dtype == object or pd.api.types.is_string_dtype(part[col].dtype))):
+                part[col] = self._encode(col, part[col])
+            elif col in FLOAT32_COLS or col in SMALL_INT_COLS: part[col] = part[col].astype(np.float32)   # 整数楼层 / 年份在 finish 时再收窄
+            elif col == 'Sale Price': part[col] = part[col].astype(np.float64)
+            elif col == 'Date_Ordinal': part[col] = part[col].astype(np.int32)
+        self._parts.append(part)
+
+    def finish(self):
+        if not self._parts: return None
+        df = pd.concat(self._parts, ignore_index=True)
+        self._parts = []
+        for col, (_, values, dtype) in self._vocab.items():
+            df[col] = pd.Categorical.from_codes(df[col].to_numpy(), categories=pd.Index(values, dtype=dtype))
+        return compact_frame(df)
+
+def load_data_chunked(file_obj, chunk_rows=STREAM_CHUNK_ROWS, progress=None):
+    """分块读取上传的 CSV：每块清洗后立即压缩为紧凑列类型 (ChunkCompactor)，内存里只有紧凑的各块，
+    全部读完后拼接并写入磁盘缓存。progress(fraction, text) 可选，用于显示进度。"""
+    cache_key = utils_cache.source_key(file_obj, CLEAN_VERSION)
+    if cache_key:
+        cached = utils_cache.FRAME_CACHE.get(cache_key)
+        if cached is None:
+            cached = utils_cache.read_frame(cache_key)
+            utils_cache.FRAME_CACHE.put(cache_key, cached)
+        if cached is not None: return utils_cache.shared_view(cached)
+    try:
+        compactor = ChunkCompactor()
+        for part in iter_clean_chunks(file_obj, chunk_rows, progress): compactor.add(part)
+        df = compactor.finish()
+        if df is None: return None
+        if cache_key:
+            utils_cache.write_frame(cache_key, df)
+            utils_cache.FRAME_CACHE.put(cache_key, df)
+        if progress is not None: progress(1.0, f"完成：共 {len(df):,} 行")
+        return utils_cache.shared_view(df)
     except Exception: return None
 
-def auto_categorize(df, method):
+def clear_data_cache(file_or_url=None):
+    """清除内存与磁盘上的数据缓存；指定来源时只清除该来源"""
+    if file_or_url is None:
+        utils_cache.FRAME_CACHE.invalidate()
+        utils_cache.invalidate()
+        utils_cache.DERIVED_CACHE.invalidate()
+    else:
+        cache_key = utils_cache.source_key(file_or_url, CLEAN_VERSION)
+        utils_cache.FRAME_CACHE.invalidate(cache_key)
+        utils_cache.invalidate(cache_key)
+
+def guess_date_format(series, samples=50):
+    """从多个不同取值中推断日期格式，取能解析最多样本的那个
+    (只看首个值时，"17 May 2013" 会被误判为 %B 全称月份，导致其余月份全部解析失败)"""
+    guess = getattr(getattr(pd.tseries, 'api', None), 'guess_datetime_format', None)
+    if guess is None or pd.api.types.is_datetime64_any_dtype(series): return None
+    uniques = pd.Series(series.dropna().unique()[:samples * 4], dtype=object).astype(str)
+    if uniques.empty: return None
+    candidates = {f for f in (guess(v) for v in uniques.iloc[:samples]) if f}
+    best, best_ok = None, -1
+    for fmt in candidates:
+        ok = pd.to_datetime(uniques, format=fmt, errors='coerce').notna().sum()
+        if ok > best_ok: best, best_ok = fmt, ok
+    return best
+
+def _parse_dates(series, date_format=None):
+    """成交日期重复度极高，只解析去重后的取值再按编码回填"""
+    if pd.api.types.is_datetime64_any_dtype(series): return series
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0: return pd.to_datetime(series, errors='coerce')
+    if date_format is None: date_format = guess_date_format(pd.Series(uniques))
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', format=date_format).to_numpy()
+    return pd.Series(parsed.take(codes), index=series.index).where(codes >= 0)
+
+def _split_unit_parts(series):
+    """把 "#05-01" 形式的 Unit 拆成 (楼层, Stack) 两列，无法拆分的记为 NaN (同样只处理去重后的取值)"""
+    codes, uniques = pd.factorize(series.astype(str))
+    parts = pd.Series(uniques).str.replace('#', '', regex=False).str.split('-', n=2, expand=True)
+    if parts.shape[1] < 2 or len(parts) == 0: return pd.Series(np.nan, index=series.index), pd.Series(np.nan, index=series.index)
+    valid = parts[1].notna()
+    floor_part, stack_part = parts[0].where(valid), parts[1].where(valid)
+    return (pd.Series(floor_part.to_numpy().take(codes), index=series.index).where(codes >= 0),
+            pd.Series(stack_part.to_numpy().take(codes), index=series.index).where(codes >= 0))
+
+def format_unit_series(floor_num, stack):
+    """format_unit 的列式版本 (与逐行调用结果一致)"""
+    f_val = pd.to_numeric(floor_num, errors='coerce').astype(float)
+    ok = np.isfinite(f_val)
+    f_int = pd.Series(np.trunc(f_val.where(ok, 0)).astype(np.int64), index=f_val.index)
+    f_fmt = f_int.astype(str)
+    f_fmt = f_fmt.where((f_int < 0) | (f_int > 9), "0" + f_fmt)
+    s_str = stack.astype(str).fillna('nan').str.strip()
+    s_fmt = s_str.where((s_str.str.len() != 1) | ~s_str.str.isdigit(), "0" + s_str)
+    units = "#" + f_fmt + "-" + s_fmt
+    if not ok.all():
+        # 非法楼层 (NaN/inf) 沿用 format_unit 的兜底写法，仅对少量异常行逐个处理
+        bad = ~ok
+        units[bad] = "#" + floor_num[bad].map(str) + "-" + stack[bad].map(str)
+    return units
+
+def clean_data(df, split_units=None, date_format=None):
+    """[V238] 列式清洗管道：全部使用 pandas 字符串 / NumPy 向量运算，不再逐行 apply
+    split_units / date_format: 为 None 时按本数据自动判断；分块读取时由首块决定后固定传入"""
+    # 1. 基础清洗
+    df.columns = df.columns.str.strip()
+    df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
+
+    # 2. 数值清洗 (已是数值列则无需再走字符串替换)
+    for col in ['Sale Price', 'Unit Price ($ psf)', 'Area (sqft)']:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(str).str.replace(r'[$,]', '', regex=True)
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # 3. 日期清洗 (NaT 的序数与 datetime.toordinal 的旧结果保持一致，记为 1)
+    if 'Sale Date' in df.columns:
+        df['Sale Date'] = _parse_dates(df['Sale Date'], date_format)
+        df['Sale Year'] = df['Sale Date'].dt.year
+        days = df['Sale Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        df['Date_Ordinal'] = np.where(df['Sale Date'].isna(), 1, days + 719163)
+
+    # 4. [V223 Fix] 智能楼层/Stack 提取 (解决 KeyError)
+    # 如果缺 Floor 或 Stack，但有类似 "#05-01" 的数据，尝试拆分
+    if ('Floor' not in df.columns or 'Stack' not in df.columns) and 'Stack' in df.columns: # 有时 Stack 列存的是完整 Unit
+        if split_units is None:
+            sample = str(df['Stack'].iloc[0])
+            split_units = '#' in sample or '-' in sample
+        if split_units:
+            floor_part, stack_part = _split_unit_parts(df['Stack'])
+            if 'Floor' not in df.columns:
+                df['Floor'] = floor_part
+            # 如果原本 Stack 就是 Unit，需要重写 Stack 为后缀
+            df['Stack_New'] = stack_part
+            df['Stack'] = df['Stack_New']
+
+    # 5. 标准化核心字段
+    if 'BLK' in df.columns: df['BLK'] = df['BLK'].astype(str).str.strip()
+    else: df['BLK'] = "1" # 兜底，防止无 Block 报错
+
+    if 'Stack' in df.columns: df['Stack'] = df['Stack'].astype(str).str.strip()
+    else: df['Stack'] = "01" # 兜底
+
+    # 处理 Floor 逻辑
+    if 'Floor' in df.columns:
+        df['Floor_Num'] = pd.to_numeric(df['Floor'], errors='coerce')
+        # 修复范围格式 (01-05)：取第一个数字，提取失败记为 1
+        mask_nan = df['Floor_Num'].isna() & df['Floor'].notna()
+        if mask_nan.any():
+            first_num = df.loc[mask_nan, 'Floor'].astype(str).str.extract(r'(\d+)', expand=False)
+            df.loc[mask_nan, 'Floor_Num'] = pd.to_numeric(first_num, errors='coerce').fillna(1)
+    else:
+        df['Floor'] = 1
+        df['Floor_Num'] = 1 # 兜底，防止 Tab2 崩溃
+
+    # 6. 补全其他
+    for col in ['Type', 'Tenure', 'Tenure From', 'Sub Type']:
+        if col not in df.columns: df[col] = "N/A"
+
+    # 7. 生成标准 Unit 字符串
+    df['Unit'] = format_unit_series(df['Floor_Num'], df['Stack'])
+    df['Unit_ID'] = make_unit_id(df)
+    return df
+
+def make_unit_id(df):
+    """BLK-Stack-楼层；整数楼层一律不带小数 (与 Floor_Num 存为 int 还是 float 无关，合并 / 增量追加后仍一致)"""
+    codes, uniques = pd.factorize(pd.to_numeric(df['Floor_Num'], errors='coerce'))
+    labels = np.array([str(int(v)) if float(v).is_integer() else str(v) for v in uniques] + ['nan'], dtype=object)
+    floor_str = pd.Series(labels[codes], index=df.index)
+    return df['BLK'].astype(str) + "-" + df['Stack'].astype(str) + "-" + floor_str
+
+# [V246] 紧凑列类型：文本列存为按自然顺序排列的有序分类 (排序 / 取唯一值无需再逐个调用 natural_key)，
+# 楼层 / 年份用小整数，面积与单价用 float32；总价可达数千万，超出 float32 的整数精度 (2^24)，统一为 float64
+CATEGORY_COLS = ['BLK', 'Stack', 'Unit', 'Unit_ID', 'Type', 'Sub Type', 'Tenure', 'Tenure From', 'Category']
+FLOAT32_COLS = ['Unit Price ($ psf)', 'Area (sqft)']
+SMALL_INT_COLS = ['Floor_Num', 'Sale Year']
+REDUNDANT_COLS = ['Floor', 'Stack_New']   # 清洗后与 Floor_Num / Stack 重复
+
+def natural_categorical(series):
+    """转为有序分类，类别按 natural_key 排列 (只对去重后的取值排序)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if series.cat.ordered: return series
+        # 无序分类 (如分块读取的结果)：类别本身即去重后的取值，只重排编号，不还原为逐行文本
+        series = series.cat.remove_unused_categories()
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    order = sorted(range(len(uniques)), key=lambda i: natural_key(uniques[i]))
+    rank = np.empty(len(uniques), dtype=np.int64)
+    rank[order] = np.arange(len(uniques))
+    new_codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1) if len(uniques) else codes
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=pd.Index(uniques).take(order), ordered=True), index=series.index, name=series.name)
+
+def sorted_uniques(series):
+    """出现过的取值，按自然顺序排列；有序分类列直接按类别顺序取出"""
+    if isinstance(series.dtype, pd.CategoricalDtype) and series.cat.ordered:
+        codes = series.cat.codes.to_numpy()
+        used = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)) > 0
+        return series.cat.categories[used].tolist()
+    return sorted(series.unique(), key=natural_key)
+
+def compact_frame(df):
+    """把清洗后的数据帧转为紧凑列类型 (见上)，内容与显示结果不变"""
+    df = df.drop(columns=[c for c in REDUNDANT_COLS if c in df.columns])
+    for col in CATEGORY_COLS:
+        if col in df.columns and (df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype) or isinstance(df[col].dtype, pd.CategoricalDtype)):
+            df[col] = natural_categorical(df[col])
+    for col in FLOAT32_COLS:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]): df[col] = df[col].astype(np.float32)
+    if 'Sale Price' in df.columns and pd.api.types.is_numeric_dtype(df['Sale Price']): df['Sale Price'] = df['Sale Price'].astype(np.float64)
+    for col in SMALL_INT_COLS:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]): continue
+        vals = df[col]
+        whole = vals.notna().all() and (vals == np.trunc(vals)).all() and vals.abs().max() < np.iinfo(np.int16).max
+        df[col] = vals.astype(np.int16 if whole else np.float32)
+    if 'Date_Ordinal' in df.columns: df['Date_Ordinal'] = df['Date_Ordinal'].astype(np.int32)
+    # [V256] 按成交日期排序并以日期为索引，日期范围查询走 utils_time.date_window
+    df = utils_time.sort_by_date(df)
+    # [V251] 数据集指纹随数据帧 (及其 Parquet 缓存) 一起保存，派生结果缓存据此判断数据是否变化
+    return utils_cache.stamp_dataset(df)
+
+# [V241] 多文件合并去重：按成交指纹 (楼座/Stack/楼层/日期/总价/面积) 判断重复
+DEDUP_KEY_COLS = ['BLK', 'Stack', 'Floor_Num', 'Sale Date', 'Sale Price', 'Area (sqft)']
+
+def transaction_fingerprint(df):
+    """每笔成交的 64 位哈希指纹 (向量化)；数值统一取整，兼容不同来源的 int/float 与小数误差"""
+    key = pd.DataFrame(index=df.index)
+    for col in DEDUP_KEY_COLS:
+        if col not in df.columns: key[col] = ""
+        elif col in ('BLK', 'Stack'): key[col] = df[col].astype(str).str.strip().str.upper()
+        elif col == 'Sale Date': key[col] = df[col].dt.normalize()
+        else: key[col] = pd.to_numeric(df[col], errors='coerce').astype('float64').round(0)
+    return pd.util.hash_pandas_object(key, index=False)
+
+def merge_datasets(named_frames):
+    """合并多个已清洗的数据集并去除重复成交 (保留最先出现的那条)。
+    named_frames: [(文件名, df), ...]；返回 (合并后的 df, 每个文件的统计列表)"""
+    frames = [(name, df) for name, df in named_frames if df is not None and not df.empty]
+    if not frames: return None, []
+    merged = pd.concat([df for _, df in frames], ignore_index=True)
+    source = np.repeat(np.arange(len(frames)), [len(df) for _, df in frames])
+    dup_mask = transaction_fingerprint(merged).duplicated(keep='first').to_numpy()
+    dropped = np.bincount(source[dup_mask], minlength=len(frames))
+    report = [{'file': name, 'rows': len(df), 'duplicates': int(dropped[i]), 'kept': len(df) - int(dropped[i])} for i, (name, df) in enumerate(frames)]
+    merged = compact_frame(merged.loc[~dup_mask].reset_index(drop=True))
+    return merged, report
+
+def _bin_label(v):
+    return f"{v:g}"
+
+def get_area_bins(project=None):
+    """取项目的面积分箱方案 {'edges': 升序分界, 'labels': 各档名称 (比分界多一个)}"""
+    cfg = AREA_BIN_CONFIG.get(project, AREA_BIN_CONFIG.get('default'))
+    if cfg is None: return DEFAULT_AREA_BINS
+    try:
+        if isinstance(cfg, (list, tuple)): edges, labels = cfg, None
+        else: edges, labels = cfg['edges'], cfg.get('labels')
+        edges = sorted(float(e) for e in edges)
+        if not edges: return DEFAULT_AREA_BINS
+        if labels is None or len(labels) != len(edges) + 1:
+            labels = [f"<{_bin_label(edges[0])}"] + [f"{_bin_label(a)}-{_bin_label(b)}" for a, b in zip(edges, edges[1:])] + [f"{_bin_label(edges[-1])}+"]
+        return {'edges': edges, 'labels': [str(l) for l in labels]}
+    except Exception:
+        return DEFAULT_AREA_BINS
+
+def bin_area(area, bins=None):
+    """按分界把面积分到各档 (左闭右开，缺失面积归入最大一档)，返回按档位排序的有序分类"""
+    bins = bins or DEFAULT_AREA_BINS
+    values = np.asarray(area, dtype='float64')
+    codes = np.digitize(values, bins['edges'])
+    codes[np.isnan(values)] = len(bins['edges'])
+    cat = pd.Categorical.from_codes(codes, categories=bins['labels'], ordered=True)
+    return pd.Series(cat, index=area.index if isinstance(area, pd.Series) else None)
+
+def auto_categorize(df, method, area_bins=None):
     if method == "按卧室数量 (Bedroom Type)":
         target_cols = ['Type', 'Bedroom Type', 'Bedrooms']
         found = next((c for c in df.columns if c in target_cols), None)
-        return df[found].astype(str).str.strip().str.upper() if found else pd.Series(["Unknown"] * len(df))
-    elif method == "按楼座 (Block)": return df['BLK']
-    else: return df['Area (sqft)'].apply(lambda x: "Small" if x<800 else "Medium" if x<1200 else "Large" if x<1600 else "X-Large" if x<2500 else "Giant")
+        return natural_categorical(df[found].astype(str).str.strip().str.upper() if found else pd.Series(["Unknown"] * len(df), index=df.index))
+    elif method == "按楼座 (Block)": return natural_categorical(df['BLK'])
+    # [V251] 面积分箱改为整列 np.digitize，不再逐行判断
+    else: return bin_area(df['Area (sqft)'], area_bins)
 
 def mark_penthouse(df):
-    if 'Area (sqft)' not in df.columns or 'Category' not in df.columns: return pd.Series([False] * len(df))
-    medians = df.groupby('Category')['Area (sqft)'].median()
-    return df.apply(lambda row: row['Area (sqft)'] > (medians.get(row['Category'], 0) * 1.4), axis=1)
+    if 'Area (sqft)' not in df.columns or 'Category' not in df.columns: return pd.Series([False] * len(df), index=df.index)
+    # [V251] 各分类面积中位数直接广播回每一行比较 (无分类的行按中位数 0 处理)
+    medians = df.groupby('Category', observed=True)['Area (sqft)'].transform('median')
+    return df['Area (sqft)'] > medians.fillna(0) * 1.4
 
 # ==================== 4. 业务逻辑与算法 ====================
 
-def calculate_market_trend(full_df):
-    limit_date = datetime.now() - pd.DateOffset(months=36)
-    trend_data = full_df[full_df['Sale Date'] >= limit_date].copy()
-    if len(trend_data) < 10: return 0.0
-    trend_data['Date_Ord'] = trend_data['Sale Date'].map(datetime.toordinal)
-    x, y = trend_data['Date_Ord'], trend_data['Unit Price ($ psf)']
-    try:
-        slope, intercept = np.polyfit(x, y, 1)
-        avg_price = y.mean()
-        if avg_price == 0: return 0.0
-        return max(-0.05, min(0.10, (slope / avg_price) * 365))
-    except: return 0.0
-
-def detect_block_step(blk_df):
-    if blk_df.empty or 'Stack' not in blk_df.columns: return 1
-    unique_stacks = blk_df['Stack'].unique()
-    if len(unique_stacks) == 0: return 1
-    votes_simplex, votes_maisonette = 0, 0
-    for stack in unique_stacks:
-        stack_df = blk_df[blk_df['Stack'] == stack]
-        floors = sorted(stack_df['Floor_Num'].dropna().unique())
-        if len(floors) < 2: continue
-        has_odd = any(f % 2 != 0 for f in floors)
-        has_even = any(f % 2 == 0 for f in floors)
-        if (has_odd and not has_even) or (not has_odd and has_even): votes_maisonette += 1
-        else: votes_simplex += 1
-    return 2 if votes_maisonette > votes_simplex else 1
-
-def get_stack_start_floor(stack_df, block_min_f, step):
-    if step == 1: return block_min_f
-    floors = sorted(stack_df['Floor_Num'].dropna().unique())
-    if not floors: return block_min_f
-    odd_count = sum(1 for f in floors if f % 2 != 0)
-    even_count = sum(1 for f in floors if f % 2 == 0)
-    is_odd_stack = odd_count > even_count
-    start = block_min_f
-    while True:
-        if (start % 2 != 0) == is_odd_stack: return start
-        start += 1
-
-def estimate_inventory(df, category_col='Category'):
-    if 'BLK' not in df.columns or 'Floor_Num' not in df.columns: 
-        return df[category_col].value_counts().to_dict() if category_col in df.columns else {}
-    if 'Stack' not in df.columns: return df[category_col].value_counts().to_dict()
-    df = df.dropna(subset=['Floor_Num']).copy()
-    final_totals = {cat: 0 for cat in df[category_col].unique()}
-    unique_blocks = df['BLK'].unique()
-    for blk in unique_blocks:
-        blk_df = df[df['BLK'] == blk]
-        step = detect_block_step(blk_df)
-        if blk_df['Floor_Num'].empty: continue
-        min_f, max_f = int(blk_df['Floor_Num'].min()), int(blk_df['Floor_Num'].max())
-        if min_f < 1: min_f = 1
-        for stack in blk_df['Stack'].unique():
-            stack_df = blk_df[blk_df['Stack'] == stack]
-            if not stack_df.empty:
-                dominant_cat = stack_df[category_col].mode()[0]
-                start_f = get_stack_start_floor(stack_df, min_f, step)
-                final_totals[dominant_cat] = final_totals.get(dominant_cat, 0) + len(range(start_f, max_f + 1, step))
-    observed_counts = df.groupby(category_col)['Unit_ID'].nunique().to_dict()
-    for cat in final_totals:
-        if final_totals[cat] < observed_counts.get(cat, 0): final_totals[cat] = observed_counts.get(cat, 0)
-    return final_totals
+def calculate_market_trend(full_df, as_of=None):
+    """截至 as_of (默认当前时间) 的近 36 个月年化增长率；[V252] 改由按数据集缓存的 MarketTrend 查询"""
+    return utils_trend.market_trend(full_df).as_of(as_of)
+
+def stack_floor_plan(df):
+    """[V250] 按 (BLK, Stack) 推定楼层分布：每个 Stack 的起始楼层、所在楼座的最高楼层与步长 (1=平层, 2=复式隔层)。
+    规则：楼座内有 ≥2 个不同楼层的 Stack 投票，只出现单一奇偶楼层的算复式票，复式票多于平层票则整栋步长为 2；
+    复式楼座中每个 Stack 取其多数楼层的奇偶，从楼座最低楼层 (不低于 1) 起找到第一个同奇偶的楼层作为起点。"""
+    keys = ['BLK', 'Stack']
+    floors = df.loc[df['Floor_Num'].notna(), keys + ['Floor_Num']].drop_duplicates()
+    floors['odd'] = np.mod(floors['Floor_Num'], 2) != 0
+    stacks = floors.groupby(keys, observed=True, sort=False).agg(n_floors=('Floor_Num', 'size'), n_odd=('odd', 'sum'))
+    stacks['n_even'] = stacks['n_floors'] - stacks['n_odd']
+
+    # 楼座步长 (平层 / 复式投票)
+    voting = stacks['n_floors'] >= 2
+    single_parity = (stacks['n_odd'] == 0) | (stacks['n_even'] == 0)
+    votes = pd.DataFrame({'maisonette': voting & single_parity, 'simplex': voting & ~single_parity}).groupby(level='BLK', observed=True, sort=False).sum()
+    blocks = floors.groupby('BLK', observed=True, sort=False)['Floor_Num'].agg(['min', 'max'])
+    blocks['step'] = np.where(votes['maisonette'].reindex(blocks.index) > votes['simplex'].reindex(blocks.index), 2, 1)
+    blocks['min_f'] = np.maximum(np.trunc(blocks['min']).astype(np.int64), 1)
+    blocks['max_f'] = np.trunc(blocks['max']).astype(np.int64)
+
+    # 每个 Stack 的起始楼层
+    plan = stacks.join(blocks[['step', 'min_f', 'max_f']], on='BLK')
+    is_odd_stack = plan['n_odd'] > plan['n_even']
+    parity_match = (plan['min_f'] % 2 != 0) == is_odd_stack
+    plan['start_f'] = np.where((plan['step'] == 1) | parity_match, plan['min_f'], plan['min_f'] + 1)
+    plan['n_units'] = np.maximum((plan['max_f'] + 1 - plan['start_f'] + plan['step'] - 1) // plan['step'], 0)
+    return plan[['step', 'start_f', 'max_f', 'n_units']]
+
+def dominant_values(df, keys, col):
+    """每组出现次数最多的取值 (并列时与 Series.mode()[0] 一致，取排序最前者)"""
+    counts = df.groupby(keys + [col], observed=True, sort=False).size().rename('n').reset_index()
+    counts = counts.sort_values(['n', col], ascending=[False, True], kind='stable').drop_duplicates(keys)
+    return counts.set_index(keys)[col]
+
+# [V251] 楼层溢价：同一 BLK/Stack 内相隔不超过 540 天、楼层不同的两笔成交折算为每层 psf 溢价率，取中位数
+FLOOR_PREMIUM_DEFAULT = 0.005
+FLOOR_PAIR_WINDOW = pd.Timedelta(days=540)
+FLOOR_LOOKBACK = pd.Timedelta(days=365*5)
+
+def _floor_pair_rates(groups, dates, floors, psf):
+    """输入已按 (分组, 日期) 排序的数组。第 k 轮同时比较每笔成交与其后第 k 笔，
+    跨组或超出 540 天的起点在之后各轮中剔除，因此总计算量与窗口内的配对数成正比。
+    返回 (起点下标, 溢价率)，只含落在 (-0.5%, 3%) 内的有效配对"""
+    n, window = len(dates), FLOOR_PAIR_WINDOW.value
+    idx, k = np.arange(n), 1
+    starts, rates = [], []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            idx = idx[idx + k < n]
+            j = idx + k
+            keep = (groups[j] == groups[idx]) & (dates[j] - dates[idx] <= window)
+            idx, j = idx[keep], j[keep]
+            if not len(idx): break
+            f_delta = floors[j] - floors[idx]
+            up = f_delta > 0
+            high, low = np.where(up, psf[j], psf[idx]), np.where(up, psf[idx], psf[j])
+            rate = ((high - low) / low) / np.abs(f_delta)
+            valid = (f_delta != 0) & (rate > -0.005) & (rate < 0.03)
+            starts.append(idx[valid]); rates.append(rate[valid])
+            k += 1
+    if not rates: return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(starts), np.concatenate(rates)
+
+def _build_floor_premiums(df):
+    if 'Stack' not in df.columns or 'Category' not in df.columns: return {}
+    # 各分类只取自身最近一笔成交前 5 年内的数据
+    dates = df['Sale Date']
+    recent = df.loc[(dates >= df.groupby('Category', observed=True)['Sale Date'].transform('max') - FLOOR_LOOKBACK).to_numpy()]
+    groups = recent.groupby(['Category', 'BLK', 'Stack'], observed=True, sort=False).ngroup().to_numpy()
+    recent, groups = recent.loc[groups >= 0], groups[groups >= 0]
+    date_ns = recent['Sale Date'].to_numpy('datetime64[ns]').view('int64')
+    order = np.lexsort((date_ns, groups))
+    starts, rates = _floor_pair_rates(groups[order], date_ns[order],
+                                      recent['Floor_Num'].to_numpy('float64')[order], recent['Unit Price ($ psf)'].to_numpy('float64')[order])
+    cat_codes, cats = pd.factorize(recent['Category'])
+    pair_cats = cat_codes[order][starts]
+    premiums = {}
+    for code, cat in enumerate(cats):
+        r = rates[pair_cats == code]
+        premiums[cat] = max(0.001, min(0.015, float(np.median(r)))) if len(r) >= 3 else FLOOR_PREMIUM_DEFAULT
+    return premiums
+
+def floor_premiums(df):
+    """各分类的楼层溢价率 {分类: 每层溢价}，按数据集与当前分类方式缓存"""
+    if 'Category' not in df.columns: return {}
+    return utils_cache.derived(df, 'floor_premiums', lambda: _build_floor_premiums(df), utils_cache.column_token(df['Category']))
 
 def get_dynamic_floor_premium(df, category):
-    cat_df = df[df['Category'] == category].copy()
-    if cat_df.empty: return 0.005
-    recent_limit = cat_df['Sale Date'].max() - timedelta(days=365*5)
-    recent_df = cat_df[cat_df['Sale Date'] >= recent_limit]
-    if 'Stack' not in recent_df.columns: return 0.005
-    grouped = recent_df.groupby(['BLK', 'Stack'])
-    rates = []
-    for _, group in grouped:
-        if len(group) < 2: continue
-        recs = group.to_dict('records')
-        for i in range(len(recs)):
-            for j in range(i + 1, len(recs)):
-                r1, r2 = recs[i], recs[j]
-                if abs((r1['Sale Date'] - r2['Sale Date']).days) > 540: continue
-                floor_diff = r1['Floor_Num'] - r2['Floor_Num']
-                if floor_diff == 0: continue
-                if r1['Floor_Num'] > r2['Floor_Num']: high, low, f_delta = r1, r2, floor_diff
-                else: high, low, f_delta = r2, r1, -floor_diff
-                rate = ((high['Sale PSF'] - low['Sale PSF']) / low['Sale PSF']) / f_delta
-                if -0.005 < rate < 0.03: rates.append(rate)
-    if len(rates) >= 3:
-        fitted_rate = float(np.median(rates))
-        return max(0.001, min(0.015, fitted_rate))
-    else: return 0.005
+    return floor_premiums(df).get(category, FLOOR_PREMIUM_DEFAULT)
+
+# SSD 政策 (按买入日期适用)：(生效日期, 锁定年数, {已持有整年数: 税率})，从新到旧排列
+SSD_POLICIES = [
+    (pd.Timestamp("2025-07-04"), 4, {0: 0.16, 1: 0.12, 2: 0.08, 3: 0.04}),
+    (pd.Timestamp("2017-03-11"), 3, {0: 0.12, 1: 0.08, 2: 0.04}),
+]
+
+def ssd_rate_at(purchase_dates, sale_dates):
+    """[V254] 向量化：按 purchase_dates 买入、在 sale_dates 卖出时适用的 SSD 税率 (口径同 calculate_ssd_status)"""
+    buy, sell = pd.Series(pd.to_datetime(purchase_dates)).reset_index(drop=True), pd.Series(pd.to_datetime(sale_dates)).reset_index(drop=True)
+    # 已持有整年数 (同 relativedelta(sell, buy).years)
+    full_years = sell.dt.year - buy.dt.year - ((sell.dt.month * 100 + sell.dt.day) < (buy.dt.month * 100 + buy.dt.day)).astype(int)
+    rate = np.zeros(len(buy))
+    pending = buy.notna() & sell.notna()
+    for start, lock_years, rates_map in SSD_POLICIES:
+        applies = pending & (buy >= start)
+        pending &= ~applies
+        locked = (applies & (sell < buy + pd.DateOffset(years=lock_years))).to_numpy()
+        rate[locked] = full_years[locked].map(rates_map).fillna(0.0).to_numpy()
+    return rate
 
 def calculate_ssd_status(purchase_date):
     """Returns: rate(float), emoji(str), text(str), months_left(int)"""
     if pd.isna(purchase_date): return 0.0, "", "", 0
     p_dt = pd.to_datetime(purchase_date)
     now = datetime.now()
-    POLICY_2017, POLICY_2025 = pd.Timestamp("2017-03-11"), pd.Timestamp("2025-07-04")
-    
-    if p_dt >= POLICY_2025: lock_years, rates_map = 4, {0: 0.16, 1: 0.12, 2: 0.08, 3: 0.04}
-    elif p_dt >= POLICY_2017: lock_years, rates_map = 3, {0: 0.12, 1: 0.08, 2: 0.04}
-    else: lock_years, rates_map = 0, {}
+    lock_years, rates_map = next(((lock, rates) for start, lock, rates in SSD_POLICIES if p_dt >= start), (0, {}))
 
     ssd_deadline = p_dt + relativedelta(years=lock_years)
     if now >= ssd_deadline: return 0.0, "🟩", "SSD Free", 0
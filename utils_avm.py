@@ -0,0 +1,218 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import utils_cache
+import utils_resale
+import utils_trend
+import utils_time
+import utils_units
+from utils import dominant_values, ssd_rate_at
+
+# [V258] 估值 (AVM) 上下文：每个数据集只建一次，按面积排序的数组 + 预先算好的楼层 / 日期 / psf 列，
+# 任意面积阈值的参考成交都是两次二分查找，单次估值只处理参考成交本身，不再复制或扫描整表。口径同原 calculate_avm
+REQUIRED_COMPS = 5
+AREA_THRESHOLDS = (0.05, 0.10, 0.15, 0.20)
+TYPE_FALLBACK_THRESHOLD = 9.99          # 面积匹配不足 2 笔时改用同户型全部成交
+LOOKBACK_MONTHS = (36, 60)              # 先取近 36 个月，没有再放宽到 60 个月
+FLOOR_RATE_DEFAULT = 0.005
+FLOOR_RATE_CLAMP = (-0.002, 0.015)
+INFO_COLS = ['Tenure', 'Tenure From', 'Sub Type']
+
+def floor_rate(floors, psf):
+    """参考成交的每层 psf 溢价率：psf 对楼层的线性回归斜率 / 平均 psf，限制在 [-0.2%, 1.5%]；
+    有效成交不足 3 笔或只有一个楼层时取默认 0.5% (口径同 calculate_dynamic_floor_rate)"""
+    ok = ~np.isnan(psf)
+    x, y = floors[ok].astype('float64'), psf[ok]
+    if len(y) < 3 or x.min() == x.max(): return FLOOR_RATE_DEFAULT
+    xc = x - x.mean()
+    slope = (xc * (y - y.mean())).sum() / (xc * xc).sum()
+    avg_psf = y.mean()
+    if avg_psf == 0 or not np.isfinite(slope): return FLOOR_RATE_DEFAULT
+    return float(max(FLOOR_RATE_CLAMP[0], min(FLOOR_RATE_CLAMP[1], slope / avg_psf)))
+
+@lru_cache(maxsize=64)
+def _day_lookback_starts(day):
+    return [np.datetime64(day - pd.DateOffset(months=m), 'ns') for m in LOOKBACK_MONTHS]
+
+def _lookback_starts(now):
+    """now 往前 36 / 60 个月的时刻。按月平移保留时分秒 (精确到微秒，同 DateOffset)，
+    只按日期缓存 (实时估值每次的 now 都不同)，再加回当天的时间"""
+    day = now.normalize()
+    offset = np.timedelta64((now - day).value // 1000, 'us')
+    return [start + offset for start in _day_lookback_starts(day)]
+
+def weighted_psf(adj, weight):
+    """按时间权重加权的 psf (每行一个单位)；无 psf 的参考成交只计入权重分母"""
+    return np.nansum(adj * weight, axis=1) / weight.sum()
+
+class AVMContext:
+    """构建后只读，可在会话间共享。行号均指数据集 (按成交日期排序) 中的位置"""
+
+    def __init__(self, df):
+        area = df['Area (sqft)'].to_numpy()
+        self._area_dtype = area.dtype
+        self.area = area.astype('float64')
+        self.area_order = np.argsort(self.area, kind='stable')          # NaN 排在最后
+        self.area_sorted = self.area[self.area_order]
+        self.n_area = int(np.count_nonzero(~np.isnan(self.area)))
+        self.dates = df['Sale Date'].to_numpy('datetime64[ns]')
+        self.date_sorted = utils_time.is_date_indexed(df)      # 数据集按日期排序时，日期范围即行号范围
+        self.psf = df['Unit Price ($ psf)'].to_numpy('float64')
+        floor_num = pd.to_numeric(df['Floor_Num'], errors='coerce')
+        self.floor_int = floor_num.fillna(0).to_numpy().astype(np.int64)   # 楼层回归用 (无楼层记为 0)
+        self.floor_adj = floor_num.fillna(1).to_numpy('float64')           # 楼层调整用 (无楼层按 1 楼)
+        codes, uniques = pd.factorize(df['Type'].astype(str))
+        self._type_rows = {t: np.flatnonzero(codes == i) for i, t in enumerate(uniques)}
+        self.trend = utils_trend.market_trend(df)
+
+        # 单位历史成交 / 楼座信息 / Stack 首笔成交信息
+        keys = pd.DataFrame({'BLK': df['BLK'].astype(str).to_numpy(), 'Floor_Int': self.floor_int, 'Stack': df['Stack'].astype(str).to_numpy()})
+        self._unit_rows = {k: np.asarray(v) for k, v in keys.groupby(['BLK', 'Floor_Int', 'Stack'], sort=False).indices.items()}
+        info = df[INFO_COLS].assign(BLK=keys['BLK'].to_numpy(), Stack=keys['Stack'].to_numpy())
+        self._block_info = {c: dominant_values(info, ['BLK'], c).to_dict() for c in INFO_COLS}
+        self._global_info = {c: info[c].mode()[0] if not info.empty else '-' for c in INFO_COLS}
+        first = info.drop_duplicates(['BLK', 'Stack'])
+        self._stack_info = {(b, s): tuple(str(x) for x in v) for b, s, *v in first[['BLK', 'Stack'] + INFO_COLS].itertuples(index=False)}
+
+    def area_band(self, est_area, t):
+        """面积在 [est_area*(1-t), est_area*(1+t)] 内的行号 (按面积排序)；比较精度同原逐行比较 (float32 列与标量)"""
+        bounds = [est_area * (1 - t), est_area * (1 + t)]
+        bounds = [np.asarray(b, dtype=np.result_type(self._area_dtype, b)).astype('float64') for b in bounds]
+        lo = np.searchsorted(self.area_sorted[:self.n_area], bounds[0], side='left')
+        hi = np.searchsorted(self.area_sorted[:self.n_area], bounds[1], side='right')
+        return self.area_order[lo:max(lo, hi)]
+
+    def type_rows(self, target_type):
+        """同户型全部成交的行号 (升序)"""
+        return self._type_rows.get(str(target_type), np.empty(0, dtype=np.int64))
+
+    def before(self, rows, as_of):
+        """rows 中成交日期早于 as_of (不含当天) 的行；as_of 为 None 时原样返回"""
+        if as_of is None: return rows
+        end = np.datetime64(pd.Timestamp(as_of), 'ns')
+        if self.date_sorted: return rows[rows < np.searchsorted(self.dates, end, side='left')]
+        return rows[self.dates[rows] < end]
+
+    def comps(self, est_area, target_type, as_of=None):
+        """参考成交行号 (未排序) 与所用面积阈值：由小到大放宽阈值直到 >= 5 笔 (最宽取 20%)，
+        仍不足 2 笔时改用同户型全部成交。[V260] as_of 给定时只看此前 (不含当天) 的成交，笔数也按此计"""
+        for t in AREA_THRESHOLDS:
+            rows = self.before(self.area_band(est_area, t), as_of)
+            if len(rows) >= REQUIRED_COMPS: break
+        if len(rows) < 2 and target_type != "N/A":
+            rows, t = self.before(self.type_rows(target_type), as_of), TYPE_FALLBACK_THRESHOLD
+        return rows, t
+
+    def recent(self, rows, now):
+        """参考成交中近 36 个月 (没有则 60 个月) 的行号 (按数据集顺序)"""
+        for start in _lookback_starts(pd.Timestamp(now)):
+            if self.date_sorted:
+                lo, hi = utils_time.date_bounds(self.dates, start)
+                picked = rows[(rows >= lo) & (rows < hi)]
+            else:
+                picked = rows[self.dates[rows] >= start]
+            if len(picked): return np.sort(picked)
+        return picked
+
+    def comp_terms(self, est_area, target_type, now, as_of=None):
+        """同一面积 / 户型的单位共用的部分：参考成交行号、楼层溢价率、距今天数与权重；没有参考成交时返回 None"""
+        rows, threshold = self.comps(est_area, target_type, as_of)
+        rows = self.recent(rows, now)
+        if not len(rows): return None
+        days = (np.datetime64(pd.Timestamp(now), 'ns') - self.dates[rows]) // np.timedelta64(1, 'D')   # 同 Timedelta.days (向下取整)
+        return {'rows': rows, 'threshold': threshold, 'floor_rate': floor_rate(self.floor_int[rows], self.psf[rows]),
+                'days': days, 'weight': 1 / (days + 30)}
+
+    def adjusted_psf(self, terms, target_floors, growth):
+        """各目标楼层 × 各参考成交的调整后 psf (行 = 楼层)，楼层与时间调整通过广播一次算完。
+        terms 带 time_factor (各参考成交的时间调整倍数) 时用它代替线性增长率"""
+        rows, days = terms['rows'], terms['days']
+        floors = np.asarray(target_floors, dtype='float64').reshape(-1, 1)
+        time_factor = terms['time_factor'] if 'time_factor' in terms else 1 + growth * (days / 365.0)
+        return self.psf[rows] * (1 + (floors - self.floor_adj[rows]) * terms['floor_rate']) * time_factor
+
+    def value(self, target_floor, est_area, target_type, now=None, as_of=None, growth=None, time_index=None):
+        """单个单位的估值；没有参考成交时返回 None。now 为计算时间调整与权重的基准时间 (默认当前时间)，
+        as_of 给定时只用此前 (不含当天) 的成交；growth 默认取截至 now 的市场年化增长率 (给定 as_of 时取其前 36 个月、不含当天)。
+        [V261] time_index 为重复交易指数 (utils_resale.repeat_sales_index) 时，时间调整改为按指数把各参考成交的价格调整到 now。
+        返回 dict：price / psf / rows (参考成交行号) / adj_psf / days / weight (与 rows 对应) / floor_rate / growth / threshold
+        (按指数调整时另有 time_factor)"""
+        now = pd.Timestamp(datetime.now() if now is None else now)
+        if growth is None: growth = self.trend.as_of(now) if as_of is None else float(self.trend.before([as_of])[0])
+        terms = self.comp_terms(est_area, target_type, now, as_of)
+        if terms is None: return None
+        if time_index is not None: terms['time_factor'] = utils_resale.index_factors(time_index, self.dates[terms['rows']], now)
+        adj = self.adjusted_psf(terms, [target_floor], growth)
+        psf = weighted_psf(adj, terms['weight'])[0]
+        return {'price': psf * est_area, 'psf': psf, 'adj_psf': adj[0], 'growth': growth, **terms}
+
+    def unit_rows(self, blk, floor, stack):
+        """某单位的全部成交行号 (按成交日期)"""
+        return self._unit_rows.get((str(blk), int(floor), str(stack)), np.empty(0, dtype=np.int64))
+
+    def block_info(self, blk):
+        """楼座最常见的 (Tenure, Tenure From, Sub Type)；楼座不存在时取全盘"""
+        return tuple(self._block_info[c].get(str(blk), self._global_info[c]) for c in INFO_COLS)
+
+    def stack_info(self, blk, stack):
+        """(BLK, Stack) 首笔成交的 (Tenure, Tenure From, Sub Type)；不存在时为 '-'"""
+        return self._stack_info.get((str(blk), str(stack)), ('-', '-', '-'))
+
+def avm_context(df):
+    """数据集的 AVMContext (按数据集版本缓存)"""
+    return utils_cache.derived(df, 'avm_context', lambda: AVMContext(df))
+
+# [V259] 批量估值：面积 / 户型相同的单位共用参考成交、楼层溢价率与时间权重，各单位只差楼层调整，
+# 以 (单位 × 参考成交) 矩阵广播一次算完；计算步骤与单个估值完全相同，结果一致
+BATCH_WORKERS = 4
+BATCH_CHUNK_CELLS = 2_000_000    # 单次广播矩阵的元素数上限 (约 16MB)
+
+def _value_groups(ctx, groups, now, growth):
+    """groups: [(面积, 户型, 单位位置, 楼层)]；返回有参考成交的组 [(单位位置, psf, 参考成交数, 楼层溢价率, 阈值)]"""
+    out = []
+    for est_area, target_type, pos, floors in groups:
+        terms = ctx.comp_terms(est_area, target_type, now)
+        if terms is None: continue
+        step = max(1, BATCH_CHUNK_CELLS // len(terms['rows']))
+        psf = np.concatenate([weighted_psf(ctx.adjusted_psf(terms, floors[i:i + step], growth), terms['weight']) for i in range(0, len(floors), step)])
+        out.append((pos, psf, len(terms['rows']), terms['floor_rate'], terms['threshold']))
+    return out
+
+def value_units(df, units=None, now=None, workers=None, executor='thread'):
+    """批量估值 (口径同 calculate_avm 不调整面积 / 户型时)：units 为单位主表 (utils_units.unit_master(df).units) 的若干行，默认全盘。
+    workers > 1 时各组分给线程池 (executor='thread') 或进程池 ('process') 并行计算。
+    返回 units 加上 Est_Price / Est_PSF / N_Comps / Floor_Rate / Threshold / Gain / Gain_Pct / SSD_Rate / Net_Gain / Net_Pct
+    (收益以最近成交价为成本，扣除按 now 卖出时的 SSD)；没有参考成交的单位估值为 NaN"""
+    if units is None: units = utils_units.unit_master(df).units
+    ctx = avm_context(df)
+    now = pd.Timestamp(datetime.now() if now is None else now)
+    growth = ctx.trend.as_of(now)
+    area, floors = units['Area (sqft)'].to_numpy(), units['Floor_Num'].to_numpy('float64')
+    keys = pd.DataFrame({'area': area, 'type': units['Type'].astype(str).to_numpy()})
+    groups = [(area[pos[0]], t, pos, floors[pos]) for (_, t), pos in keys.groupby(['area', 'type'], sort=False, dropna=False).indices.items()]
+
+    if workers and workers > 1 and len(groups) > 1:
+        pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        parts = [groups[i::workers] for i in range(workers)]
+        with pool_cls(max_workers=workers) as pool:
+            results = [r for part in pool.map(_value_groups, [ctx] * workers, parts, [now] * workers, [growth] * workers) for r in part]
+    else:
+        results = _value_groups(ctx, groups, now, growth)
+
+    est_psf, n_comps, rate, threshold = np.full(len(units), np.nan), np.zeros(len(units), dtype=np.int64), np.full(len(units), np.nan), np.full(len(units), np.nan)
+    for pos, psf, n, r, t in results:
+        est_psf[pos], n_comps[pos], rate[pos], threshold[pos] = psf, n, r, t
+    out = units.copy()
+    out['Est_PSF'] = est_psf
+    out['Est_Price'] = est_psf * area
+    out['N_Comps'], out['Floor_Rate'], out['Threshold'] = n_comps, rate, threshold
+    last_price = out['Last_Price'].to_numpy('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['Gain'] = out['Est_Price'] - last_price
+        out['Gain_Pct'] = out['Gain'] / last_price * 100
+        out['SSD_Rate'] = ssd_rate_at(out['Last_Date'], [now] * len(out))
+        out['Net_Gain'] = out['Gain'] - out['Est_Price'] * out['SSD_Rate']
+        out['Net_Pct'] = out['Net_Gain'] / last_price * 100
+    return out
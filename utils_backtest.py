@@ -0,0 +1,177 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import utils_avm
+import utils_cache
+from utils_avm import AREA_THRESHOLDS, REQUIRED_COMPS, TYPE_FALLBACK_THRESHOLD, LOOKBACK_MONTHS, FLOOR_RATE_DEFAULT, FLOOR_RATE_CLAMP
+
+# [V260] 估值回测 (walk-forward)：按时间顺序把每笔历史成交当作待估单位，只用其成交日之前 (不含当天) 的成交估值，
+# 与实际成交价比较。数据集按日期排序，"某日之前" 即行号前缀，各笔成交的参考成交都是同一组候选行号的一段连续区间；
+# 面积 / 户型相同的成交一起处理，区间内的楼层回归与加权平均按段 (reduceat) 一次算完。口径同 AVMContext.value(as_of=成交日)
+HIT_BAND = 10                     # 命中：误差在 ±10% 以内
+BACKTEST_WORKERS = min(4, os.cpu_count() or 1)   # 离线批量回测时的进程数；界面 (Streamlit) 中默认单进程
+# 进程池不用 fork：Streamlit 等多线程进程中 fork 可能复制到被其他线程持有的锁而死锁
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+CHUNK_ELEMENTS = 4_000_000        # 单批 (成交 × 参考成交) 元素数上限 (约 32MB / 列)
+_DAY = np.timedelta64(1, 'D')
+
+_ctx = None
+
+def _init_worker(ctx):
+    global _ctx
+    _ctx = ctx
+
+def _segments(rows, starts, ends):
+    """各段 rows[starts[i]:ends[i]] 首尾相接后的行号、段起点与每个元素所属的段"""
+    lens = ends - starts
+    offsets = np.cumsum(lens) - lens
+    seg = np.repeat(np.arange(len(lens)), lens)
+    return rows[starts[seg] + np.arange(lens.sum()) - offsets[seg]], offsets, seg
+
+def _value_segments(ctx, rows, starts, ends, floors, dates, growth):
+    """每笔成交以 rows[starts:ends] 为参考成交的估值 psf 与楼层溢价率 (同 floor_rate / weighted_psf，按段计算)"""
+    idx, offsets, seg = _segments(rows, starts, ends)
+    psf = ctx.psf[idx]
+    ok = ~np.isnan(psf)
+    n = np.add.reduceat(ok.astype(np.int64), offsets)
+    x, y = np.where(ok, ctx.floor_int[idx].astype('float64'), 0.0), np.where(ok, psf, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean, y_mean = np.add.reduceat(x, offsets) / n, np.add.reduceat(y, offsets) / n
+        xc = np.where(ok, x - x_mean[seg], 0.0)
+        sxx = np.add.reduceat(xc * xc, offsets)
+        slope = np.add.reduceat(xc * np.where(ok, y - y_mean[seg], 0.0), offsets) / sxx
+        rate = np.clip(slope / y_mean, *FLOOR_RATE_CLAMP)
+    # 有效成交不足 3 笔、只有一个楼层 (离差平方和为 0)、均价为 0 或无法回归时取默认溢价率
+    rate = np.where((n >= 3) & (sxx > 0) & (y_mean != 0) & np.isfinite(slope), rate, FLOOR_RATE_DEFAULT)
+
+    days = (dates[seg] - ctx.dates[idx]) // _DAY
+    weight = 1 / (days + 30)
+    adj = psf * (1 + (floors[seg] - ctx.floor_adj[idx]) * rate[seg]) * (1 + growth[seg] * (days / 365.0))
+    est = np.add.reduceat(np.where(ok, adj * weight, 0.0), offsets) / np.add.reduceat(weight, offsets)
+    return est, rate
+
+def _backtest_groups(groups, ctx=None):
+    """groups: [(面积, 户型, 成交行号, 楼层, 成交日期, 增长率, 回看起点行号 (36 / 60 个月), 成交日行号)]；
+    返回 [(成交行号, psf, 参考成交数, 楼层溢价率, 阈值)]，没有参考成交的成交不返回"""
+    ctx = ctx or _ctx
+    out = []
+    for est_area, target_type, pos, floors, dates, growth, lo36, lo60, hi in groups:
+        # 各面积阈值下成交日之前的笔数，选第一个 >= 5 笔的阈值；最宽仍不足 2 笔时改用同户型 (同 AVMContext.comps)
+        candidates = [np.sort(ctx.area_band(est_area, t)) for t in AREA_THRESHOLDS]
+        counts = np.stack([np.searchsorted(c, hi) for c in candidates])
+        enough = counts >= REQUIRED_COMPS
+        choice = np.where(enough.any(axis=0), enough.argmax(axis=0), len(AREA_THRESHOLDS) - 1)
+        if target_type != "N/A":
+            candidates.append(ctx.type_rows(target_type))
+            choice[counts[choice, np.arange(len(pos))] < 2] = len(AREA_THRESHOLDS)
+        thresholds = np.array(AREA_THRESHOLDS + (TYPE_FALLBACK_THRESHOLD,))
+
+        for k in np.unique(choice):
+            sel = np.flatnonzero(choice == k)
+            rows = candidates[k]
+            # 近 36 个月 (没有则 60 个月) 的参考成交：rows 升序，区间为 [起点, 成交日) 对应的一段
+            end = np.searchsorted(rows, hi[sel])
+            start = np.searchsorted(rows, lo36[sel])
+            start = np.where(start < end, start, np.searchsorted(rows, lo60[sel]))
+            has = start < end
+            sel, start, end = sel[has], start[has], end[has]
+            # 按累计元素数分批，控制单批内存
+            total = np.cumsum(end - start)
+            cuts = np.searchsorted(total, np.arange(1, total[-1] // CHUNK_ELEMENTS + 1) * CHUNK_ELEMENTS, side='right') if len(total) else []
+            for part in np.split(np.arange(len(sel)), cuts):
+                if not len(part): continue
+                s = sel[part]
+                psf, rate = _value_segments(ctx, rows, start[part], end[part], floors[s], dates[s], growth[s])
+                out.append((pos[s], psf, end[part] - start[part], rate, np.full(len(s), thresholds[k])))
+    return out
+
+def walk_forward(df, workers=None, reuse=None):
+    """逐笔回测：每笔有日期、成交价与面积的成交，以成交日为估值日、只用此前的成交估值 (面积 / 户型 / 楼层取该笔成交本身)。
+    workers > 1 时各组分给进程池并行计算。reuse=(since, prev) 时成交日早于 since 的成交不再计算，估值取自 prev
+    (已有的回测结果，Row 为本数据集中的行号)。返回每笔一行：Row (数据集中的行号) / Sale Date / BLK / Stack / Floor_Num / Type /
+    Area (sqft) / Sale Price / Est_Price / Est_PSF / N_Comps / Floor_Rate / Threshold / Error_Pct ((估值 - 成交价) / 成交价 × 100)；
+    此前没有参考成交的成交估值为 NaN"""
+    ctx = utils_avm.avm_context(df)
+    if not ctx.date_sorted: raise ValueError("回测需要按成交日期排序的数据集 (compact_frame 的输出)")
+    price = df['Sale Price'].to_numpy('float64')
+    targets = np.flatnonzero(~np.isnat(ctx.dates) & (price > 0) & ~np.isnan(ctx.area))
+    work = targets if reuse is None else targets[ctx.dates[targets] >= reuse[0]]   # 需要计算的成交
+    dates = ctx.dates[work]
+    day = pd.DatetimeIndex(dates)
+    lo36, lo60 = [np.searchsorted(ctx.dates, (day - pd.DateOffset(months=m)).to_numpy('datetime64[ns]'), side='left') for m in LOOKBACK_MONTHS]
+    hi = np.searchsorted(ctx.dates, dates, side='left')
+    growth = ctx.trend.before(dates)
+    floors = ctx.floor_adj[work]
+
+    area = df['Area (sqft)'].to_numpy()
+    keys = pd.DataFrame({'area': area[work], 'type': df['Type'].astype(str).to_numpy()[work]})
+    groups = [(area[work[i[0]]], t, work[i], floors[i], dates[i], growth[i], lo36[i], lo60[i], hi[i])
+              for (_, t), i in keys.groupby(['area', 'type'], sort=False).indices.items()]
+
+    if workers and workers > 1 and len(groups) > 1:
+        # 组按成交笔数从多到少轮流分配，各进程工作量大致相当；上下文每个进程只传一次
+        groups.sort(key=lambda g: -len(g[2]))
+        parts = [groups[i::workers * 4] for i in range(workers * 4)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD), initializer=_init_worker, initargs=(ctx,)) as pool:
+            results = [r for part in pool.map(_backtest_groups, parts) for r in part]
+    else:
+        results = _backtest_groups(groups, ctx)
+
+    n = len(df)
+    est_psf, n_comps, rate, threshold = np.full(n, np.nan), np.zeros(n, dtype=np.int64), np.full(n, np.nan), np.full(n, np.nan)
+    if reuse is not None:
+        prev = reuse[1]
+        results.append((prev['Row'].to_numpy(), prev['Est_PSF'].to_numpy(), prev['N_Comps'].to_numpy(), prev['Floor_Rate'].to_numpy(), prev['Threshold'].to_numpy()))
+    for pos, psf, c, r, t in results:
+        est_psf[pos], n_comps[pos], rate[pos], threshold[pos] = psf, c, r, t
+    rows = df.iloc[targets]
+    out = pd.DataFrame({
+        'Row': targets, 'Sale Date': rows['Sale Date'].to_numpy(), 'BLK': rows['BLK'].to_numpy(), 'Stack': rows['Stack'].to_numpy(),
+        'Floor_Num': rows['Floor_Num'].to_numpy(), 'Type': rows['Type'].to_numpy(), 'Area (sqft)': area[targets], 'Sale Price': price[targets],
+        'Est_Price': est_psf[targets] * area[targets], 'Est_PSF': est_psf[targets], 'N_Comps': n_comps[targets],
+        'Floor_Rate': rate[targets], 'Threshold': threshold[targets],
+    })
+    out['Error_Pct'] = (out['Est_Price'] - out['Sale Price']) / out['Sale Price'] * 100
+    return out
+
+def _reusable(df):
+    """[V261] 增量读取的数据集 (见 utils.delta_rows)：追加前版本的回测结果仍在缓存中时，成交日早于最早一笔新增成交的
+    各笔只用到更早的成交，结果不变，返回 (since, 换算到本数据集行号的旧结果)；否则为 None"""
+    delta = utils_cache.dataset_delta(df)
+    if delta is None: return None
+    base_key, rows = delta
+    prev = utils_cache.DERIVED_CACHE.peek(('avm_backtest', (base_key, len(df) - len(rows))))
+    if prev is None: return None
+    new_dates = df['Sale Date'].to_numpy('datetime64[ns]')[rows]
+    new_dates = new_dates[~np.isnat(new_dates)]
+    since = new_dates.min() if len(new_dates) else np.datetime64(pd.Timestamp.max, 'ns')
+    # 合并后按日期稳定排序，旧行之间的先后不变：旧数据集第 i 行即本数据集第 i 个旧行
+    is_new = np.zeros(len(df), dtype=bool)
+    is_new[rows] = True
+    old_rows = np.flatnonzero(~is_new)
+    prev = prev[prev['Sale Date'].to_numpy('datetime64[ns]') < since]
+    return since, prev.assign(Row=old_rows[prev['Row'].to_numpy()])
+
+def backtest(df, workers=None):
+    """数据集的逐笔回测结果 (按数据集版本缓存，只读)；默认单进程，离线批量时可传 workers=BACKTEST_WORKERS。
+    增量读取的新版本只重算新增成交最早日期及以后的成交"""
+    return utils_cache.derived(df, 'avm_backtest', lambda: walk_forward(df, workers, _reusable(df)))
+
+def accuracy(results, by=None):
+    """回测精度：N (有估值的笔数) / Coverage (有估值的比例 %) / MAPE / Median_Error (误差中位数，正为高估) /
+    Median_APE / Hit_Rate (误差在 ±10% 内的比例 %)；by 为 results 中的列名时按其分组，否则为全体一行"""
+    err = results['Error_Pct']
+    stats = pd.DataFrame({'valued': err.notna(), 'err': err, 'ape': err.abs(), 'hit': (err.abs() <= HIT_BAND).astype('float64').where(err.notna())})
+    grouped = stats.groupby(results[by].to_numpy() if by else np.zeros(len(stats), dtype=np.int64), observed=True)
+    out = pd.DataFrame({
+        'N': grouped['valued'].sum().astype(np.int64),
+        'Coverage': grouped['valued'].mean() * 100,
+        'MAPE': grouped['ape'].mean(),
+        'Median_Error': grouped['err'].median(),
+        'Median_APE': grouped['ape'].median(),
+        'Hit_Rate': grouped['hit'].mean() * 100,
+    })
+    if by: return out.rename_axis(by).reset_index()
+    return out.reset_index(drop=True)
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import sys
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# 磁盘缓存目录与容量上限
+CACHE_DIR = '.data_cache'
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # 超出后按最近最少使用淘汰
+URL_MAX_AGE = 300                     # 云端表格的磁盘副本在此时间内直接使用，之后向服务器条件请求校验 (秒)；上传文件按内容哈希，永不过期
+MEMORY_MAX_BYTES = 1024 * 1024 * 1024  # 进程内数据集缓存的内存预算，超出后按最近最少使用溢出到磁盘
+HASH_BLOCK_BYTES = 1024 * 1024        # 计算上传文件内容哈希时每次读取的字节数
+
+def source_key(file_or_url, version):
+    """生成缓存键：URL 按地址，上传文件按内容哈希，并带上清洗逻辑版本号"""
+    if isinstance(file_or_url, str):
+        raw = f"url|{file_or_url}"
+    elif hasattr(file_or_url, 'getvalue') or hasattr(file_or_url, 'read'):
+        try:
+            digest = hashlib.sha1()
+            if hasattr(file_or_url, 'getvalue'):
+                data = file_or_url.getvalue()
+                digest.update(data.encode('utf-8') if isinstance(data, str) else data)
+            else:
+                # 磁盘上的大文件按块哈希，不整体读入内存
+                file_or_url.seek(0)
+                while block := file_or_url.read(HASH_BLOCK_BYTES):
+                    digest.update(block.encode('utf-8') if isinstance(block, str) else block)
+                file_or_url.seek(0)
+            raw = f"file|{digest.hexdigest()}"
+        except Exception:
+            return None
+    else:
+        return None
+    return hashlib.sha1(f"{version}|{raw}".encode('utf-8')).hexdigest()
+
+def _path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+def read_frame(key, max_age=None):
+    """读取已清洗好的数据帧 (内存映射)；不存在、过期或损坏时返回 None"""
+    if not key: return None
+    path = _path(key)
+    try:
+        stat = os.stat(path)
+        if max_age is not None and time.time() - stat.st_mtime > max_age: return None
+        df = pd.read_parquet(path, memory_map=True)
+        # atime 记录最近访问 (LRU 依据)，mtime 保留写入时间 (有效期依据)
+        os.utime(path, (time.time(), stat.st_mtime))
+        return df
+    except Exception:
+        return None
+
+def write_frame(key, df):
+    """写入 Parquet；写入失败 (如混合类型列) 时静默跳过，不影响正常加载"""
+    if not key or df is None: return False
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        return False
+    enforce_size_cap()
+    return True
+
+def _meta_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def read_meta(key):
+    """读取与缓存条目配套的元数据 (如增量读取所需的前缀指纹)"""
+    if not key: return None
+    try:
+        with open(_meta_path(key), 'r', encoding='utf-8') as f: return json.load(f)
+    except Exception:
+        return None
+
+def write_meta(key, meta):
+    if not key: return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_meta_path(key), 'w', encoding='utf-8') as f: json.dump(meta, f, ensure_ascii=False)
+
+def touch(key):
+    """把缓存条目的写入时间刷新为当前时间 (内容未变、重新计入有效期)"""
+    try: os.utime(_path(key), None)
+    except OSError: pass
+
+def _remove(path):
+    for p in (path, path[:-len('.parquet')] + '.json'):
+        try: os.remove(p)
+        except OSError: pass
+
+def _entries():
+    if not os.path.isdir(CACHE_DIR): return []
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.parquet'): continue
+        path = os.path.join(CACHE_DIR, name)
+        try: stat = os.stat(path)
+        except OSError: continue
+        entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+    return entries
+
+def enforce_size_cap(max_bytes=None):
+    """总大小超过上限时，从最久未访问的条目开始删除"""
+    limit = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= limit: break
+        _remove(path); total -= size
+
+def invalidate(key=None):
+    """删除指定缓存条目；key 为 None 时清空全部"""
+    if key is not None:
+        _remove(_path(key))
+        return
+    for _, _, path in _entries():
+        _remove(path)
+
+def cache_stats():
+    entries = _entries()
+    return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': CACHE_MAX_BYTES}
+
+class FrameLRU:
+    """[V247] 进程内数据集缓存：按实际占用字节数计入预算，超出时淘汰最久未使用的条目。
+    被淘汰的条目溢出到磁盘 Parquet 缓存 (已在磁盘上的不重复写)，再次访问时以内存映射方式读回。"""
+
+    def __init__(self, max_bytes=MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (df, 字节数, 写入时间)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'spills': 0}
+
+    def get(self, key, max_age=None):
+        """命中时返回共享的数据帧 (调用方负责复制)；不存在或超过 max_age 秒时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and max_age is not None and time.time() - entry[2] > max_age:
+                self._drop(key); entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key, df):
+        if not key or df is None: return
+        size = int(df.memory_usage(deep=True).sum())
+        evicted = []
+        with self._lock:
+            if key in self._entries: self._drop(key)
+            if size <= self.max_bytes:
+                self._entries[key] = (df, size, time.time())
+                self._bytes += size
+            else:
+                evicted.append((key, df))   # 单个数据集超出预算：不常驻内存，直接落盘
+            while self._bytes > self.max_bytes and self._entries:
+                old_key, (old_df, _, _) = next(iter(self._entries.items()))
+                self._drop(old_key)
+                self._stats['evictions'] += 1
+                evicted.append((old_key, old_df))
+        # 落盘在锁外进行，不阻塞其他会话读取
+        for old_key, old_df in evicted:
+            if not os.path.exists(_path(old_key)) and write_frame(old_key, old_df):
+                with self._lock: self._stats['spills'] += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear(); self._bytes = 0
+            elif key in self._entries:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {**self._stats, 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hit_rate': self._stats['hits'] / lookups if lookups else None}
+
+FRAME_CACHE = FrameLRU()
+
+def shared_view(df):
+    """共享数据帧的会话视图：不复制任何列，会话新增的派生列 (如 Category) 只存在于视图上，
+    对已有列的修改由写时复制隔离，不会影响共享数据"""
+    if df is None: return None
+    if 'dataset_key' not in df.attrs: stamp_dataset(df)   # 旧版缓存读回的数据帧没有指纹
+    view = df.copy(deep=False)
+    view.attrs = dict(df.attrs)
+    return view
+
+# ---------- [V251] 派生结果缓存 ----------
+# 楼层溢价、趋势、指数等只依赖数据本身的结果，按数据集版本只计算一次，各会话 / 各调用方共享
+DERIVED_MAX_ENTRIES = 256
+DERIVED_MAX_BYTES = 256 * 1024 * 1024   # 派生结果的内存预算 (按估算字节数)，超出后淘汰最久未使用的
+FINGERPRINT_COLS = ['Sale Date', 'Sale Price', 'Unit_ID', 'Area (sqft)']
+
+def frame_fingerprint(df):
+    """数据内容指纹 (成交日期/总价/单位/面积逐行哈希)，数据变化即改变"""
+    cols = [c for c in FINGERPRINT_COLS if c in df.columns]
+    digest = hashlib.sha1(f"{len(df)}|{cols}".encode('utf-8'))
+    if cols and len(df): digest.update(pd.util.hash_pandas_object(df[cols], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# 已确认版本标记的行集合：(索引缓冲区地址, 行数, 步长) -> (索引底层数组的弱引用, 标记)。
+# 会话视图与整表共享索引缓冲区，查表即可；切片 / 筛选 / 排序得到新的缓冲区 (或不同的起点 / 行数)，按内容重新计算
+_TOKENS = {}
+_TOKENS_LOCK = threading.Lock()
+
+def _index_buffer(df):
+    """(缓冲区键, 底层数组)；索引没有可用的 ndarray 缓冲区 (如 RangeIndex) 时为 None"""
+    if isinstance(df.index, pd.RangeIndex): return None
+    values = df.index.asi8 if isinstance(df.index, pd.DatetimeIndex) else df.index.to_numpy()
+    root = values
+    while isinstance(root.base, np.ndarray): root = root.base
+    return (values.__array_interface__['data'][0], len(values), values.strides), root
+
+def _remember_token(df, token):
+    buffer = _index_buffer(df)
+    if buffer is None: return
+    key, root = buffer
+    # 底层数组释放后地址可能被复用，条目随之删除
+    ref = weakref.ref(root, lambda r, key=key: _TOKENS.pop(key) if _TOKENS.get(key, (None,))[0] is r else None)
+    with _TOKENS_LOCK: _TOKENS[key] = (ref, token)
+
+def stamp_dataset(df):
+    """在数据集产出时记下指纹 (attrs 随会话视图与切片一起传递)"""
+    df.attrs['dataset_key'] = frame_fingerprint(df)
+    _remember_token(df, (df.attrs['dataset_key'], len(df)))
+    return df
+
+def dataset_token(df):
+    """数据帧的版本标记：整个数据集 (及其会话视图) 为 (指纹, 行数)；切片 / 筛选后的子集另带自身各行的内容指纹，
+    不同子集即使行数与首末日期相同也不会混用。attrs 会随子集传递，故不能只凭 dataset_key 判断"""
+    key = df.attrs.get('dataset_key')
+    if key is None: key = stamp_dataset(df).attrs['dataset_key']
+    buffer = _index_buffer(df)
+    if buffer is not None:
+        with _TOKENS_LOCK: entry = _TOKENS.get(buffer[0])
+        if entry is not None and entry[0]() is buffer[1] and entry[1][0] == key: return entry[1]
+    rows = frame_fingerprint(df)
+    token = (key, len(df)) if rows == key else (key, len(df), rows)
+    _remember_token(df, token)
+    return token
+
+# [V242] 增量读取的来历：数据集指纹 -> (追加前数据集的指纹, 新增行在数据集中的位置)。
+# 按版本记录而不放进 attrs (attrs 会随每次运算深复制，且随 Parquet 缓存保存)
+DELTA_HISTORY = 64
+_DELTAS = OrderedDict()
+_DELTAS_LOCK = threading.Lock()
+
+def record_delta(df, base_key, rows):
+    """记录 df (已 stamp_dataset) 由指纹为 base_key 的数据集追加 rows 这些行而来"""
+    rows = np.asarray(rows, dtype=np.int64)
+    rows.flags.writeable = False
+    with _DELTAS_LOCK:
+        _DELTAS[df.attrs['dataset_key']] = (base_key, len(df), rows)
+        _DELTAS.move_to_end(df.attrs['dataset_key'])
+        while len(_DELTAS) > DELTA_HISTORY: _DELTAS.popitem(last=False)
+
+def dataset_delta(df):
+    """(追加前数据集的指纹, 新增行号)；df 不是增量读取的完整数据集时为 None"""
+    with _DELTAS_LOCK: entry = _DELTAS.get(df.attrs.get('dataset_key'))
+    if entry is None or entry[1] != len(df): return None
+    return entry[0], entry[2]
+
+def column_token(series):
+    """会话派生列 (如 Category) 的内容标记；分类列只哈希编码，代价很小"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        digest = hashlib.sha1(repr(list(series.cat.categories)).encode('utf-8'))
+        digest.update(series.cat.codes.to_numpy().tobytes())
+    else:
+        digest = hashlib.sha1(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def estimate_bytes(value, _seen=None):
+    """派生结果大致占用的内存：数据帧 / 数组按缓冲区大小，容器与一般对象逐项累加 (共享的对象只计一次)"""
+    seen = set() if _seen is None else _seen
+    if id(value) in seen: return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame): return int(value.memory_usage(index=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)): return int(value.memory_usage())
+    if isinstance(value, np.ndarray): return value.nbytes
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(estimate_bytes(k, seen) + estimate_bytes(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)): return sys.getsizeof(value) + sum(estimate_bytes(v, seen) for v in value)
+    if hasattr(value, '__dict__') and not isinstance(value, type): return sys.getsizeof(value) + estimate_bytes(vars(value), seen)
+    return sys.getsizeof(value)
+
+class DerivedCache:
+    """键 -> 派生结果，条目数或估算字节数超出上限时淘汰最久未使用的。结果为共享对象，调用方只读使用"""
+
+    def __init__(self, max_entries=DERIVED_MAX_ENTRIES, max_bytes=DERIVED_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (结果, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._entries[key][0]
+            self._stats['misses'] += 1
+        # 计算在锁外进行；并发首次计算时可能重复计算一次，结果相同
+        value = build()
+        size = estimate_bytes(value)
+        with self._lock:
+            if key in self._entries: self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes: return value   # 单个结果超出预算：不缓存
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+                self._stats['evictions'] += 1
+        return value
+
+    def peek(self, key):
+        """已缓存的结果 (不计入命中统计、不计算)；没有时为 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear(); self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {**self._stats, 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hit_rate': self._stats['hits'] / lookups if lookups else None}
+
+DERIVED_CACHE = DerivedCache()
+
+def derived(df, name, build, *parts):
+    """取 df 的派生结果 name (parts 为影响结果的其他参数)，未缓存时调用 build() 计算"""
+    return DERIVED_CACHE.get_or_build((name, dataset_token(df)) + parts, build)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import utils_cache
+
+# [V255] Tab 1 的月度聚合立方体：按 (月份, BLK, Stack, 层段, 户型) 汇总成交笔数 / psf 合计 / 总价合计，每个数据集只建一次。
+# 任意日期范围 = 范围内整月的格子直接取用 + 首尾不满一个月的零散成交逐笔补上，再向上汇总为年 / 季 / 月及各维度排行
+MEASURES = ['n_rows', 'n_price', 'n_psf', 'psf_sum', 'price_sum']
+
+def floor_zone(floor_num):
+    """层段：<=5 为 Low，<=15 为 Mid，其余 (含无楼层) 为 High"""
+    f = pd.to_numeric(floor_num, errors='coerce').to_numpy('float64')
+    return pd.Series(np.select([f <= 5, f <= 15], ['Low', 'Mid'], 'High'), index=floor_num.index)
+
+class PeriodCube:
+    """构建后只读，可在会话间共享。window() 返回各格子在日期范围内的汇总 (dict: 度量 -> 数组)，
+    trend() / top() 在此基础上用 bincount 汇总，耗时与格子数 (而非成交笔数) 成正比"""
+
+    def __init__(self, df, cat_col=None):
+        valid = df['Sale Date'].notna().to_numpy()
+        order = np.flatnonzero(valid)[np.argsort(df['Sale Date'].to_numpy('datetime64[ns]')[valid], kind='stable')]
+        rows = df.iloc[order]
+        keys = pd.DataFrame({'Month': rows['Sale Date'].dt.to_period('M').array.asi8}, index=rows.index)
+        for col in ['BLK', 'Stack']:
+            if col in rows.columns: keys[col] = rows[col]
+        if 'Floor_Num' in rows.columns: keys['Floor_Zone'] = floor_zone(rows['Floor_Num'])
+        if cat_col and cat_col in rows.columns: keys[cat_col] = rows[cat_col]
+
+        # 格子按月份排序 (ngroup 的首个键为月份)，同一月份的格子连续存放
+        cell = keys.groupby(list(keys.columns), observed=True, dropna=False, sort=True).ngroup().to_numpy()
+        self.n_cells = int(cell.max()) + 1 if len(cell) else 0
+        cells = keys.iloc[np.unique(cell, return_index=True)[1]]
+        self.months, self._cell_month = np.unique(cells['Month'].to_numpy(), return_inverse=True)
+        # 各维度：格子 -> 取值编号 (缺失为 -1)，取值按 groupby 的顺序排列
+        self.dims = {col: pd.factorize(cells[col], sort=True) for col in keys.columns if col != 'Month'}
+
+        # 逐笔数据 (按日期排序) 只保留首尾零散成交补算所需的几列
+        self.dates = rows['Sale Date'].to_numpy('datetime64[ns]')
+        self.row_cell = cell
+        price = rows['Sale Price'].to_numpy('float64')
+        psf = rows['Unit Price ($ psf)'].to_numpy('float64')
+        self.row_price_ok, self.row_psf_ok = ~np.isnan(price), ~np.isnan(psf)
+        self.row_price, self.row_psf = np.where(self.row_price_ok, price, 0.0), np.where(self.row_psf_ok, psf, 0.0)
+        self.totals = self._aggregate(slice(None))
+
+    def _aggregate(self, rows):
+        cell, n = self.row_cell[rows], self.n_cells
+        return {
+            'n_rows': np.bincount(cell, minlength=n),
+            'n_price': np.bincount(cell[self.row_price_ok[rows]], minlength=n),
+            'n_psf': np.bincount(cell[self.row_psf_ok[rows]], minlength=n),
+            'psf_sum': np.bincount(cell, weights=self.row_psf[rows], minlength=n),
+            'price_sum': np.bincount(cell, weights=self.row_price[rows], minlength=n),
+        }
+
+    def window(self, start, end):
+        """成交日期在 [start, end] (按日，含两端) 内的各格子汇总"""
+        start, end_excl = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+        first_full = start.to_period('M') + (0 if start.day == 1 else 1)
+        last_full = (end_excl - pd.Timedelta(days=1)).to_period('M') - (0 if end_excl.day == 1 else 1)
+        measures = {m: np.zeros(self.n_cells, dtype=v.dtype) for m, v in self.totals.items()}
+        if first_full <= last_full:
+            lo, hi = np.searchsorted(self.months, [first_full.ordinal, last_full.ordinal + 1])
+            lo, hi = np.searchsorted(self._cell_month, [lo, hi])
+            for m in MEASURES: measures[m][lo:hi] = self.totals[m][lo:hi]
+            edges = [(start, first_full.start_time), ((last_full + 1).start_time, end_excl)]
+        else:
+            edges = [(start, end_excl)]
+        for a, b in edges:
+            i, j = np.searchsorted(self.dates, [np.datetime64(a, 'ns'), np.datetime64(b, 'ns')])
+            if j > i:
+                for m, v in self._aggregate(slice(i, j)).items(): measures[m] += v
+        return measures
+
+    def trend(self, w, freq):
+        """按年 / 季 / 月汇总：Period (文字标签) / Avg PSF / Volume (有 psf 的笔数)"""
+        n_months = len(self.months)
+        rows = np.bincount(self._cell_month, weights=w['n_rows'], minlength=n_months)
+        per_month = pd.DataFrame({'psf_sum': np.bincount(self._cell_month, weights=w['psf_sum'], minlength=n_months),
+                                  'n_psf': np.bincount(self._cell_month, weights=w['n_psf'], minlength=n_months)})
+        months = pd.PeriodIndex.from_ordinals(self.months, freq='M')
+        labels = np.asarray((months.asfreq(freq) if freq != 'M' else months).astype(str))
+        agg = per_month.loc[rows > 0].groupby(labels[rows > 0]).sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({'Period': agg.index.astype(str), 'Avg PSF': agg['psf_sum'].to_numpy() / agg['n_psf'].to_numpy(), 'Volume': agg['n_psf'].to_numpy().astype(np.int64)})
+
+    def top(self, w, col):
+        """某一维度成交笔数最多的取值：(取值, 笔数, 平均 psf)，口径同逐笔 groupby"""
+        if col not in self.dims: return "N/A", 0, 0
+        codes, uniques = self.dims[col]
+        ok = codes >= 0
+        sums = {m: np.bincount(codes[ok], weights=w[m][ok], minlength=len(uniques)) for m in ['n_rows', 'n_price', 'n_psf', 'psf_sum']}
+        present = sums['n_rows'] > 0
+        if not present.any(): return "N/A", 0, 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats = pd.DataFrame({col: uniques[present], 'Sale Price': sums['n_price'][present].astype(np.int64),
+                                  'Unit Price ($ psf)': sums['psf_sum'][present] / sums['n_psf'][present]})
+        top = stats.sort_values('Sale Price', ascending=False).iloc[0]
+        return top[col], top['Sale Price'], top['Unit Price ($ psf)']
+
+def period_cube(df, cat_col=None):
+    """数据集的 PeriodCube；cat_col 为会话派生列 (Category) 时按其内容区分缓存"""
+    token = utils_cache.column_token(df[cat_col]) if cat_col == 'Category' and cat_col in df.columns else None
+    return utils_cache.derived(df, 'period_cube', lambda: PeriodCube(df, cat_col), cat_col, token)
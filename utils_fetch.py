@@ -0,0 +1,52 @@
+import threading
+from dataclasses import dataclass
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 连接池与重试设置
+POOL_SIZE = 16
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+
+@dataclass
+class FetchResult:
+    content: bytes = None          # 304 时为 None
+    not_modified: bool = False
+    etag: str = None
+    last_modified: str = None
+    status: int = 200
+
+    @property
+    def validators(self):
+        return {'etag': self.etag, 'last_modified': self.last_modified}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """进程内共享的 HTTP 会话：keep-alive 连接池 + 自动重试 (gzip 由 requests 默认协商并解压)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(['GET']))
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+            _session = session
+        return _session
+
+def fetch(url, etag=None, last_modified=None):
+    """下载 URL；带上 ETag / Last-Modified 做条件请求，未变化时返回 not_modified=True"""
+    headers = {}
+    if etag: headers['If-None-Match'] = etag
+    if last_modified: headers['If-Modified-Since'] = last_modified
+    resp = get_session().get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    if resp.status_code == 304:
+        return FetchResult(not_modified=True, etag=etag, last_modified=last_modified, status=304)
+    resp.raise_for_status()
+    return FetchResult(content=resp.content, etag=resp.headers.get('ETag'), last_modified=resp.headers.get('Last-Modified'), status=resp.status_code)
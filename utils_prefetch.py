@@ -0,0 +1,133 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+import utils_cache
+from utils import PROJECTS, CLEAN_VERSION, load_source
+
+# 后台刷新设置
+REFRESH_INTERVAL = 300   # 每个项目的定时刷新间隔 (秒)，与磁盘缓存的 URL_MAX_AGE 一致
+REFRESH_WORKERS = 8
+
+def _new_stats():
+    return {'hits': 0, 'misses': 0, 'stale_hits': 0, 'refreshes': 0, 'errors': 0, 'last_refresh_secs': None, 'last_refresh_at': None, 'max_wait_secs': 0.0}
+
+class ProjectRefresher:
+    """后台预热并定时刷新所有云端项目 (stale-while-revalidate)：
+    读取时立即返回最近一次成功加载的数据，过期则在后台刷新，刷新失败继续保留旧数据。
+    数据帧本身放在 FRAME_CACHE (与 load_data 同一缓存键，受同一内存预算约束、可溢出到磁盘、随清除缓存一起清除)，这里只记加载时间"""
+
+    def __init__(self, sources, interval=REFRESH_INTERVAL, loader=load_source):
+        self.sources = dict(sources)   # 项目名 -> URL
+        self.interval = interval
+        self._loader = loader
+        self._loaded = {}            # url -> (FRAME_CACHE 键, 加载完成时间, 行数)
+        self._inflight = {}          # url -> Future
+        self._stats = {url: _new_stats() for url in self.sources.values()}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="project-refresh")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="project-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 启动时立即预热，之后按间隔刷新
+            for url in self.sources.values(): self.refresh_async(url)
+            self._stop.wait(self.interval)
+
+    def refresh_async(self, url):
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is None or future.done():
+                future = self._pool.submit(self._refresh, url)
+                self._inflight[url] = future
+            return future
+
+    def _refresh(self, url):
+        started = time.perf_counter()
+        try: df = self._loader(url, revalidate=True)
+        except Exception: df = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats.setdefault(url, _new_stats())
+            stats['refreshes'] += 1
+            stats['last_refresh_secs'] = elapsed
+            if df is None:
+                stats['errors'] += 1
+            else:
+                key = utils_cache.source_key(url, CLEAN_VERSION)
+                utils_cache.FRAME_CACHE.put(key, df)
+                self._loaded[url] = (key, time.time(), len(df))
+                stats['last_refresh_at'] = datetime.now()
+        return df
+
+    def _cached(self, key):
+        """FRAME_CACHE 中的数据帧；已被淘汰时从磁盘副本读回 (不论新旧，过期由后台刷新处理)，磁盘上也没有 (已清除缓存) 时为 None"""
+        df = utils_cache.FRAME_CACHE.get(key)
+        if df is None:
+            df = utils_cache.read_frame(key)
+            if df is not None: utils_cache.FRAME_CACHE.put(key, df)
+        return df
+
+    def get(self, url):
+        """取最近一次成功加载的数据 (写时复制视图)；从未加载过时才同步等待"""
+        df, _ = self.get_entry(url)
+        return utils_cache.shared_view(df)
+
+    def get_entry(self, url):
+        """同 get，但返回共享的 (df, 加载时间) 不做复制，调用方只能只读使用"""
+        with self._lock:
+            loaded = self._loaded.get(url)
+            stats = self._stats.setdefault(url, _new_stats())
+        df = self._cached(loaded[0]) if loaded else None
+        if df is not None:
+            stale = time.time() - loaded[1] > self.interval
+            with self._lock:
+                stats['hits'] += 1
+                if stale: stats['stale_hits'] += 1
+            if stale: self.refresh_async(url)
+            return df, loaded[1]
+
+        started = time.perf_counter()
+        df = self.refresh_async(url).result()
+        wait = time.perf_counter() - started
+        with self._lock:
+            stats['misses'] += 1
+            stats['max_wait_secs'] = max(stats['max_wait_secs'], wait)
+            loaded = self._loaded.get(url)
+        if df is None or loaded is None: return None, None
+        return df, loaded[1]
+
+    def stats_frame(self):
+        now = time.time()
+        rows = []
+        with self._lock:
+            name_of = {url: name for name, url in self.sources.items()}
+            for url, stats in self._stats.items():
+                loaded = self._loaded.get(url)
+                rows.append({
+                    '项目': name_of.get(url, url), '命中': stats['hits'], '未命中 (等待)': stats['misses'], '过期命中': stats['stale_hits'],
+                    '刷新次数': stats['refreshes'], '失败': stats['errors'],
+                    '最近刷新耗时 (s)': round(stats['last_refresh_secs'], 2) if stats['last_refresh_secs'] is not None else None,
+                    '最长等待 (s)': round(stats['max_wait_secs'], 2),
+                    '数据年龄 (s)': int(now - loaded[1]) if loaded else None,
+                    '行数': loaded[2] if loaded else 0,
+                })
+        return pd.DataFrame(rows)
+
+@st.cache_resource
+def get_refresher():
+    """进程级单例：首次调用时启动后台线程预热全部云端项目"""
+    sources = {name: url for name, url in PROJECTS.items() if url}
+    return ProjectRefresher(sources).start()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import utils_cache
+import utils_time
+from utils import ssd_rate_at
+
+# [V253] 转售配对与重复交易价格指数 (Case-Shiller)
+MIN_HOLD_DAYS = 30            # 持有不足 30 天的配对视为异常 (与 Tab 1 口径一致)
+MIN_ANNUALIZE_DAYS = 180      # 持有不足 6 个月不计年化回报
+PERCENTILES = (10, 25, 50, 75, 90)
+INDEX_FREQS = {'M': "月度", 'Q': "季度"}
+
+def _build_pairs(df):
+    """同一 Unit_ID 按成交日期排序后，每笔成交与其上一笔组成一个配对 (首次成交没有配对)。
+    [V254] 同时算好 收益 / 持有年数 / 年化回报 (%) / 卖出时适用的 SSD 税率，整表按卖出日期排序"""
+    codes = pd.factorize(df['Unit_ID'])[0] if not isinstance(df['Unit_ID'].dtype, pd.CategoricalDtype) else df['Unit_ID'].cat.codes.to_numpy()
+    dates = df['Sale Date'].to_numpy('datetime64[ns]')
+    date_key = dates.view('int64').copy()
+    date_key[np.isnat(dates)] = np.iinfo(np.int64).max   # 与 sort_values 一致：无日期的成交排在各单位最后
+    order = np.lexsort((date_key, codes))
+    order = order[codes[order] >= 0]
+    prev, cur = order[:-1], order[1:]
+    same = codes[prev] == codes[cur]
+    prev, cur = prev[same], cur[same]
+    price = df['Sale Price'].to_numpy('float64')
+    pairs = pd.DataFrame({
+        'Unit_ID': df['Unit_ID'].iloc[cur].array,
+        'Prev_Date': dates[prev], 'Sale Date': dates[cur],
+        'Prev_Price': price[prev], 'Sale Price': price[cur],
+    }, index=df.index[cur])
+    pairs['Hold_Days'] = (pairs['Sale Date'] - pairs['Prev_Date']).dt.days
+    pairs['Gain'] = pairs['Sale Price'] - pairs['Prev_Price']
+    pairs['Hold_Years'] = pairs['Hold_Days'] / 365.0
+    pairs['Annualized'] = np.where(pairs['Hold_Days'] >= MIN_ANNUALIZE_DAYS, ((pairs['Sale Price'] / pairs['Prev_Price']) ** (365 / pairs['Hold_Days']) - 1) * 100, np.nan)
+    pairs['SSD_Rate'] = ssd_rate_at(pairs['Prev_Date'], pairs['Sale Date'])
+    return pairs.sort_values('Sale Date', kind='stable')
+
+def resale_pairs(df):
+    """数据集的全部转售配对 (索引为卖出那笔成交在 df 中的索引)，按数据集版本缓存，只读"""
+    return utils_cache.derived(df, 'resale_pairs', lambda: _build_pairs(df))
+
+def valid_resales(pairs, start=None, end=None):
+    """Tab 1 口径的有效转售：卖出日期在 [start, end] (按日，含两端) 内、有上一笔成交价、持有 >= 30 天。
+    表已按卖出日期排序，日期范围用二分查找切片，不扫描整表"""
+    if end is not None: end = pd.Timestamp(end) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')   # end 当天全天
+    lo, hi = utils_time.date_bounds(pairs['Sale Date'].to_numpy(), start, end)
+    window = pairs.iloc[lo:hi]
+    return window.loc[(window['Prev_Price'].notna() & (window['Hold_Days'] >= MIN_HOLD_DAYS)).to_numpy()]
+
+def return_distribution(resales, percentiles=PERCENTILES):
+    """年化回报 / 总回报 / 持有年数的分位数表 (行为分位数)"""
+    cols = {'年化回报 (%)': resales['Annualized'], '总回报 (%)': (resales['Gain'] / resales['Prev_Price']) * 100, '持有年数': resales['Hold_Years']}
+    return pd.DataFrame({name: np.nanpercentile(col.to_numpy('float64'), percentiles) if col.notna().any() else np.full(len(percentiles), np.nan) for name, col in cols.items()},
+                        index=[f"P{p}" for p in percentiles])
+
+def _solve_index(pairs, freq, weighted):
+    from scipy import sparse
+    from scipy.sparse.linalg import lsqr
+    ok = pairs['Hold_Days'].ge(MIN_HOLD_DAYS) & (pairs['Prev_Price'] > 0) & (pairs['Sale Price'] > 0)
+    pairs = pairs.loc[ok.to_numpy()]
+    # 期间用整数序号表示 (Period.ordinal)，避免逐个生成 Period 对象
+    buy = pairs['Prev_Date'].dt.to_period(freq).array.asi8
+    sell = pairs['Sale Date'].dt.to_period(freq).array.asi8
+    cross = buy != sell                       # 同一期内买卖的配对对指数没有信息
+    buy, sell, pairs = buy[cross], sell[cross], pairs.loc[cross]
+    if pairs.empty: return pd.DataFrame(columns=['Index', 'Pairs'])
+
+    ordinals = np.union1d(buy, sell)
+    periods = pd.PeriodIndex.from_ordinals(ordinals, freq=freq)
+    b, s = np.searchsorted(ordinals, buy), np.searchsorted(ordinals, sell)
+    y = np.log(pairs['Sale Price'].to_numpy() / pairs['Prev_Price'].to_numpy())
+    n, k = len(y), len(periods) - 1           # 首期为基期 (对数指数固定为 0)，不进入未知数
+    rows = np.concatenate([np.arange(n)[b > 0], np.arange(n)[s > 0]])
+    cols = np.concatenate([b[b > 0], s[s > 0]]) - 1
+    vals = np.concatenate([-np.ones((b > 0).sum()), np.ones((s > 0).sum())])
+    X = sparse.csr_matrix((vals, (rows, cols)), shape=(n, k))
+
+    def solve(w):
+        return lsqr(sparse.diags(w) @ X, w * y, atol=1e-12, btol=1e-12, iter_lim=10 * max(k, 100))[0]
+
+    beta = solve(np.ones(n))
+    if weighted and n > k + 2:
+        # Case-Shiller 第二步：残差平方对持有天数回归，持有越久噪声越大，按估计方差的倒数加权
+        resid2 = (y - X @ beta) ** 2
+        a, c = np.polyfit(pairs['Hold_Days'].to_numpy('float64'), resid2, 1)
+        var = a * pairs['Hold_Days'].to_numpy('float64') + c
+        if np.all(var > 0): beta = solve(1 / np.sqrt(var))
+
+    index = pd.DataFrame({'Index': 100 * np.exp(np.concatenate([[0.0], beta]))}, index=periods)
+    # 只在有配对覆盖的期间之间给出指数；两端以外或无交易期间由 index_factor 插值
+    index['Pairs'] = np.bincount(s, minlength=len(periods))
+    index.index.name = 'Period'
+    return index
+
+def repeat_sales_index(df, freq='Q', weighted=True):
+    """重复交易价格指数 (首期 = 100)：每个转售配对给出 log(卖价/买价) = 卖出期 - 买入期的对数指数之差，
+    以稀疏最小二乘求解全部期间；weighted=True 时按 Case-Shiller 方法对长持有期配对降权。
+    返回以 Period 为索引的 DataFrame (Index, Pairs = 该期卖出的配对数)，按数据集版本缓存"""
+    if freq not in INDEX_FREQS: raise ValueError(f"freq 只支持 {list(INDEX_FREQS)}")
+    return utils_cache.derived(df, 'repeat_sales_index', lambda: _solve_index(resale_pairs(df), freq, weighted), freq, weighted)
+
+def index_factors(index, from_dates, to_date):
+    """[V261] 按指数表 (repeat_sales_index 的结果) 把 from_dates 各日的价格调整到 to_date 的倍数 (指数之比，对数空间按期插值)；
+    超出指数覆盖范围时取最近一期，指数为空时全为 1。from_dates 为数组，返回同长度数组"""
+    from_dates = pd.DatetimeIndex(np.atleast_1d(from_dates))
+    if index.empty: return np.ones(len(from_dates))
+    freq = index.index.freqstr
+    ordinals = index.index.asi8
+    log_index = np.log(index['Index'].to_numpy())
+    start = np.interp(from_dates.to_period(freq).asi8, ordinals, log_index)
+    return np.exp(np.interp(pd.Timestamp(to_date).to_period(freq).ordinal, ordinals, log_index) - start)
+
+def index_factor(df, from_date, to_date, freq='Q'):
+    """把 from_date 的价格调整到 to_date 的倍数 (指数之比)；超出指数覆盖范围时取最近一期，无指数时为 1"""
+    return float(index_factors(repeat_sales_index(df, freq), [from_date], to_date)[0])
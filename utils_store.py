@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import itertools
+import pandas as pd
+import utils_cache
+from utils import STREAM_CHUNK_ROWS, REDUNDANT_COLS, iter_clean_chunks, compact_frame, transaction_fingerprint
+
+# [V249] 本地分区成交库：全国 URA 成交按 项目 / 成交年份 分区存为 Parquet (hive 目录结构)
+# 读取单个项目时只扫描该项目的目录，日期范围先裁剪年份分区，再按行组统计过滤
+STORE_DIR = 'txn_store'
+PROJECT_SOURCE_COLS = ['Project Name', 'Project']   # 原始 CSV 中的项目名列
+MANIFEST = '_manifest.json'
+STAGE_ROWS_PER_GROUP = 16_384   # 导入时每个分区攒够该行数才写出一个行组
+
+# 侧边栏 "加载范围" 选项 -> 向前回溯的年数 (None 为全部)
+LOAD_RANGES = {"全部 (All)": None, "近3年": 3, "近5年": 5, "近10年": 10}
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([('project', pa.string()), ('year', pa.int32())]), flavor='hive')
+
+def _dataset():
+    import pyarrow.dataset as ds
+    if not os.path.isdir(STORE_DIR): return None
+    try: return ds.dataset(STORE_DIR, format='parquet', partitioning=_partitioning())
+    except Exception: return None
+
+def read_manifest():
+    try:
+        with open(os.path.join(STORE_DIR, MANIFEST), 'r', encoding='utf-8') as f: return json.load(f)
+    except Exception:
+        return {'projects': {}, 'updated_at': None}
+
+def list_projects():
+    return sorted(read_manifest()['projects'])
+
+def store_version():
+    """成交库的版本标记 (每次导入后变化)，用作内存缓存键的一部分"""
+    try: return os.stat(os.path.join(STORE_DIR, MANIFEST)).st_mtime_ns
+    except OSError: return None
+
+# ---------- 导入 ----------
+
+def _merge_partition(target_dir, staged_dir):
+    """把新导入的分区并入正式目录：原先没有该分区时直接移入；
+    已有时与旧数据合并去重 (保留先入库的记录)，按成交日期排序后重写为单个文件"""
+    if not os.path.isdir(target_dir):
+        os.replace(staged_dir, target_dir)
+        return
+    df = pd.concat([pd.read_parquet(target_dir), pd.read_parquet(staged_dir)], ignore_index=True)
+    df = df.loc[~transaction_fingerprint(df).duplicated(keep='first').to_numpy()]
+    df = df.sort_values('Sale Date', kind='stable')
+    tmp_dir = os.path.join(os.path.dirname(target_dir), f".{os.path.basename(target_dir)}.tmp")   # "." 开头的目录不会被扫描
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    df.to_parquet(os.path.join(tmp_dir, 'part-0.parquet'), index=False)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(tmp_dir, target_dir)
+
+def _chunk_table(part, project):
+    """给清洗后的一块数据加上分区列 (项目 / 年份)"""
+    import pyarrow as pa
+    source_col = next((c for c in PROJECT_SOURCE_COLS if c in part.columns), None)
+    if source_col is not None:
+        names = part.pop(source_col).astype(str).str.strip()
+        if project: names = names.where(names.ne('') & names.ne('nan'), project)
+    elif project:
+        names = pd.Series(project, index=part.index)
+    else:
+        raise ValueError("CSV 中没有项目名列，请指定 project")
+    part = part.drop(columns=[c for c in REDUNDANT_COLS if c in part.columns])
+    part['project'] = names
+    part['year'] = part['Sale Date'].dt.year.fillna(0).astype('int32')
+    return pa.Table.from_pandas(part, preserve_index=False)
+
+def import_csv(file_obj, project=None, chunk_rows=STREAM_CHUNK_ROWS, progress=None):
+    """把 CSV (现有导出格式) 分块清洗后写入成交库，内存里始终只有一块。
+    文件含项目名列时按其分区 (全国数据)；否则全部记入 project。返回 {项目: 入库后总行数}"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    staging = os.path.join(STORE_DIR, f".staging-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    touched = set()
+    try:
+        tables = (_chunk_table(part, project) for part in iter_clean_chunks(file_obj, chunk_rows, progress, extra_cols=PROJECT_SOURCE_COLS))
+        first = next(tables, None)
+        if first is None: return {}
+        schema = first.schema
+
+        def batches():
+            for table in itertools.chain([first], tables):
+                touched.update(table.column('project').unique().to_pylist())
+                # 各块统一按首块的列类型写入 (某列在一块中全为空时会被推断为 null 类型)
+                yield from table.cast(schema).to_batches()
+
+        # 所有块写入同一个数据集写入器：每个 项目/年份 分区各自缓冲到一定行数再成组写出，避免大量碎片行组
+        ds.write_dataset(pa.RecordBatchReader.from_batches(schema, batches()), staging, format='parquet',
+                         partitioning=_partitioning(), min_rows_per_group=STAGE_ROWS_PER_GROUP, existing_data_behavior='overwrite_or_ignore')
+
+        # 逐个分区并入正式目录 (每个 项目/年份 分区的替换是原子的)
+        for project_dir in sorted(os.listdir(staging)):
+            os.makedirs(os.path.join(STORE_DIR, project_dir), exist_ok=True)
+            for year_dir in sorted(os.listdir(os.path.join(staging, project_dir))):
+                _merge_partition(os.path.join(STORE_DIR, project_dir, year_dir), os.path.join(staging, project_dir, year_dir))
+
+        # 更新清单中各项目的行数与年份范围
+        manifest = read_manifest()
+        counts = _dataset().to_table(columns=['project', 'year']).to_pandas().groupby('project', observed=True)['year'].agg(['size', 'min', 'max'])
+        manifest['projects'] = {name: {'rows': int(r['size']), 'first_year': int(r['min']), 'last_year': int(r['max'])} for name, r in counts.iterrows()}
+        manifest['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(os.path.join(STORE_DIR, MANIFEST), 'w', encoding='utf-8') as f: json.dump(manifest, f, ensure_ascii=False, indent=1)
+        return {name: manifest['projects'][name]['rows'] for name in touched if name in manifest['projects']}
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+# ---------- 读取 ----------
+
+def load_project(project, start=None, end=None):
+    """读取单个项目 (可选成交日期范围，含两端)，输出与 load_data 相同的列与类型。
+    项目与年份在目录层面裁剪，日期条件下推到 Parquet 行组过滤；结果进入进程内共享缓存。"""
+    import pyarrow.dataset as ds
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    cache_key = hashlib.sha1(f"store|{store_version()}|{project}|{start}|{end}".encode('utf-8')).hexdigest()
+    cached = utils_cache.FRAME_CACHE.get(cache_key)
+    if cached is not None: return utils_cache.shared_view(cached)
+
+    dataset = _dataset()
+    if dataset is None: return None
+    cond = ds.field('project') == project
+    if start is not None: cond &= (ds.field('year') >= start.year) & (ds.field('Sale Date') >= start)
+    if end is not None: cond &= (ds.field('year') <= end.year) & (ds.field('Sale Date') <= end)
+    columns = [c for c in dataset.schema.names if c not in ('project', 'year')]
+    try: table = dataset.to_table(columns=columns, filter=cond)
+    except Exception: return None
+    if table.num_rows == 0: return None
+    df = compact_frame(table.to_pandas())
+    utils_cache.FRAME_CACHE.put(cache_key, df)
+    return utils_cache.shared_view(df)
+
+def range_start(label):
+    years = LOAD_RANGES.get(label)
+    return pd.Timestamp.now().normalize() - pd.DateOffset(years=years) if years else None
+
+# ---------- 命令行 ----------
+
+def main(argv=None):
+    global STORE_DIR
+    parser = argparse.ArgumentParser(description="URA 成交库工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="导入 CSV (现有导出格式)")
+    p_import.add_argument('csv', nargs='+')
+    p_import.add_argument('--project', help="CSV 无项目名列时使用的项目名")
+    p_import.add_argument('--store', default=STORE_DIR)
+    p_list = sub.add_parser('list', help="列出库中项目")
+    p_list.add_argument('--store', default=STORE_DIR)
+    args = parser.parse_args(argv)
+
+    STORE_DIR = args.store
+    if args.command == 'import':
+        for path in args.csv:
+            started = time.perf_counter()
+            with open(path, 'rb') as f:
+                result = import_csv(f, project=args.project, progress=lambda frac, text: print(f"\r{path}: {text} ({frac:.0%})", end='', flush=True))
+            print(f"\n{path}: {len(result)} 个项目，用时 {time.perf_counter() - started:.1f}s")
+    for name, info in read_manifest()['projects'].items():
+        print(f"{name}\t{info['rows']:,} 笔\t{info['first_year']}-{info['last_year']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
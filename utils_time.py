@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+# [V256] 成交日期索引：数据集在产出时按成交日期稳定排序，并以成交日期作为 DatetimeIndex (列 'Sale Date' 保留)。
+# 无日期的成交排在最后，索引中记为 DATE_SENTINEL，保证索引单调，任意日期范围都是两次二分查找 + 一个切片
+DATE_SENTINEL = pd.Timestamp.max
+
+def sort_by_date(df):
+    """按成交日期 (稳定) 排序并设置日期索引；日期相同的成交保持原有先后"""
+    if 'Sale Date' not in df.columns: return df
+    dates = df['Sale Date']
+    key = dates.to_numpy('datetime64[ns]').view('int64').copy()
+    key[dates.isna().to_numpy()] = np.iinfo(np.int64).max
+    df = df.take(np.argsort(key, kind='stable'))
+    df.index = pd.DatetimeIndex(df['Sale Date'].fillna(DATE_SENTINEL).to_numpy(), name=None)
+    return df
+
+def is_date_indexed(df):
+    """df 的索引是否为单调的成交日期索引 (Index 会缓存单调性判断，重复调用不再扫描)"""
+    return isinstance(df.index, pd.DatetimeIndex) and df.index.is_monotonic_increasing
+
+def date_bounds(dates, start=None, end=None):
+    """已排序的日期数组 (DatetimeIndex / datetime64 数组) 中 [start, end] 对应的位置区间 (lo, hi)；
+    两端为 None 时不设限，但总是排除无日期 (NaT / DATE_SENTINEL) 的记录"""
+    if isinstance(dates, pd.Index): dates = dates.to_numpy()
+    unit = np.datetime_data(dates.dtype)[0]
+    valid = np.searchsorted(dates, np.datetime64(DATE_SENTINEL, unit), side='left')   # NaT 在排序与查找中都视为最大
+    lo = 0 if start is None else np.searchsorted(dates[:valid], np.datetime64(pd.Timestamp(start), unit), side='left')
+    hi = valid if end is None else np.searchsorted(dates[:valid], np.datetime64(pd.Timestamp(end), unit), side='right')
+    return int(lo), int(max(lo, hi))
+
+def date_window(df, start=None, end=None):
+    """成交日期在 [start, end] 内 (两端含，None 为不设限) 的行。
+    df 为日期索引时直接切片 (不复制数据)；否则退回按列逐行比较"""
+    if is_date_indexed(df):
+        lo, hi = date_bounds(df.index, start, end)
+        return df.iloc[lo:hi]
+    dates = df['Sale Date']
+    mask = dates.notna()
+    if start is not None: mask &= dates >= pd.Timestamp(start)
+    if end is not None: mask &= dates <= pd.Timestamp(end)
+    return df.loc[mask.to_numpy()]
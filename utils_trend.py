@@ -0,0 +1,90 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import utils_cache
+import utils_time
+
+# [V252] 市场趋势：近 36 个月 psf 对成交日期的线性回归斜率，折算为年化增长率并限制在 [-5%, 10%]
+TREND_WINDOW_MONTHS = 36
+TREND_MIN_ROWS = 10
+TREND_CLAMP = (-0.05, 0.10)
+
+class MarketTrend:
+    """按成交日期排序后保存 日序数 / psf 的前缀和，任意日期窗口的回归只需两次二分查找；
+    另预先算好每个月末的滚动年化增长率 (monthly)，按月份查询为 O(1)。构建后只读，可在会话间共享。"""
+
+    def __init__(self, df):
+        valid = df['Sale Date'].notna() & df['Unit Price ($ psf)'].notna()
+        dates = df.loc[valid, 'Sale Date']
+        ordinals = df.loc[valid, 'Date_Ordinal'] if 'Date_Ordinal' in df.columns else dates.map(datetime.toordinal)
+        order = np.argsort(dates.to_numpy('datetime64[ns]'), kind='stable')
+        self.dates = dates.to_numpy('datetime64[ns]')[order]
+        x = ordinals.to_numpy('float64')[order]
+        y = df.loc[valid, 'Unit Price ($ psf)'].to_numpy('float64')[order]
+        # 以首笔成交的日期 / psf 为原点再累加，避免平方和过大带来的精度损失。
+        # [V261] 原点只取决于最早的成交：追加较晚的成交后，此前各窗口的前缀和不变 (增量回测沿用旧结果时逐位一致)
+        self._x0 = x[0] if len(x) else 0.0
+        self._y0 = y[0] if len(y) else 0.0
+        x, y = x - self._x0, y - self._y0
+        zero = np.zeros(1)
+        self._sx, self._sy = np.concatenate([zero, np.cumsum(x)]), np.concatenate([zero, np.cumsum(y)])
+        self._sxx, self._sxy = np.concatenate([zero, np.cumsum(x * x)]), np.concatenate([zero, np.cumsum(x * y)])
+        self.monthly = self._monthly_series()
+        self._first_month = self.monthly.index[0].ordinal if len(self.monthly) else 0
+
+    def _growth(self, lo, hi):
+        """第 lo 至 hi-1 笔 (已排序) 成交的年化增长率，lo / hi 可为数组"""
+        lo, hi = np.asarray(lo), np.asarray(hi)
+        n = (hi - lo).astype('float64')
+        sx, sy = self._sx[hi] - self._sx[lo], self._sy[hi] - self._sy[lo]
+        sxx, sxy = self._sxx[hi] - self._sxx[lo], self._sxy[hi] - self._sxy[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (sxy - sx * sy / n) / (sxx - sx * sx / n)
+            avg_price = sy / n + self._y0
+            growth = np.clip(slope / avg_price * 365, *TREND_CLAMP)
+        # 样本不足、同一天成交 (无法回归) 或均价为 0 时记为 0
+        return np.where((n >= TREND_MIN_ROWS) & np.isfinite(growth) & (avg_price != 0), growth, 0.0)
+
+    def growth_since(self, start, end=None):
+        """成交日期在 [start, end] 内 (end 为 None 时不设上限) 的年化增长率"""
+        return float(self._growth(*utils_time.date_bounds(self.dates, start, end)))
+
+    def as_of(self, date=None):
+        """截至 date (默认当前时间) 的年化增长率：取此前 36 个月内的成交"""
+        date = pd.Timestamp(datetime.now() if date is None else date)
+        return self.growth_since(date - pd.DateOffset(months=TREND_WINDOW_MONTHS), date)
+
+    def before(self, dates):
+        """[V260] 各日期之前 36 个月内、不含当天的成交的年化增长率 (dates 为数组，回测时避免用到当天及以后的成交)"""
+        ends = pd.DatetimeIndex(dates)
+        starts = ends - pd.DateOffset(months=TREND_WINDOW_MONTHS)
+        lo = np.searchsorted(self.dates, starts.to_numpy('datetime64[ns]'), side='left')
+        hi = np.maximum(lo, np.searchsorted(self.dates, ends.to_numpy('datetime64[ns]'), side='left'))
+        return self._growth(lo, hi)
+
+    def _monthly_series(self):
+        if not len(self.dates): return pd.Series(dtype='float64')
+        months = pd.period_range(pd.Timestamp(self.dates[0]).to_period('M'), pd.Timestamp(self.dates[-1]).to_period('M'), freq='M')
+        ends = months.to_timestamp(how='end')
+        starts = ends - pd.DateOffset(months=TREND_WINDOW_MONTHS)
+        lo = np.searchsorted(self.dates, starts.to_numpy('datetime64[ns]'), side='left')
+        hi = np.maximum(lo, np.searchsorted(self.dates, ends.to_numpy('datetime64[ns]'), side='right'))
+        return pd.Series(self._growth(lo, hi), index=months, name='Annual Growth')
+
+    def monthly_between(self, start=None, end=None):
+        """[V261] start / end 所在月份之间 (含两端) 的月度滚动年化增长率 (monthly 的一段，按月序号切片)"""
+        if not len(self.monthly): return self.monthly
+        lo = 0 if start is None else max(0, pd.Timestamp(start).to_period('M').ordinal - self._first_month)
+        hi = len(self.monthly) if end is None else max(0, pd.Timestamp(end).to_period('M').ordinal - self._first_month + 1)
+        return self.monthly.iloc[lo:hi]
+
+    def at_month(self, date):
+        """date 所在月份月末的滚动年化增长率 (O(1))；早于首月为 0，晚于末月取末月"""
+        if not len(self.monthly): return 0.0
+        i = pd.Timestamp(date).to_period('M').ordinal - self._first_month
+        if i < 0: return 0.0
+        return float(self.monthly.iat[min(i, len(self.monthly) - 1)])
+
+def market_trend(df):
+    """数据集的 MarketTrend (按数据集版本缓存)"""
+    return utils_cache.derived(df, 'market_trend', lambda: MarketTrend(df))
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import utils_cache
+from utils import stack_floor_plan, dominant_values
+
+# [V257] 单位主表：全盘推定单位 (BLK × Stack × 楼层) 每个一行，含面积 / 户型、最近一次成交与成交次数。
+# 每个数据集只建一次 (只读，会话间共享)；库存估算、楼宇透视网格、估值的单位规格都按键直接取值，不再逐次筛选整表
+INVALID_TYPES = ['-', 'nan', 'NaN', '', '0', 'N/A']
+
+class UnitMaster:
+    """stacks: 每个 (BLK, Stack) 一行 — 众数面积 / 户型、成交笔数及楼层推定 (step / start_f / max_f / n_units)；
+    units: 每个单位一行 — BLK / Stack / Floor_Num (整数楼层) / Unit_ID、面积与户型 (有成交取最近一笔，否则取 Stack 众数)、
+    Source ('History' / 'Stack Inference')、Last_Price / Last_Date (最近一笔有日期的成交) / Tx_Count。
+    两表均按 BLK、Stack 的自然顺序及楼层排列"""
+
+    def __init__(self, df):
+        keys = ['BLK', 'Stack']
+        # Stack 众数：户型先排除无效取值，全部无效时取原始众数；面积众数缺失时取均值 (口径同原 get_unit_specs / 楼宇透视)
+        stacks = df.groupby(keys, observed=True, sort=True).size().rename('Tx_Count').to_frame()
+        valid_types = df.loc[~df['Type'].astype(str).isin(INVALID_TYPES).to_numpy(), keys + ['Type']]
+        stack_type = dominant_values(valid_types, keys, 'Type').reindex(stacks.index).astype(object)
+        stack_type = stack_type.fillna(dominant_values(df, keys, 'Type').reindex(stacks.index).astype(object)).fillna("N/A")
+        stack_area = dominant_values(df, keys, 'Area (sqft)').reindex(stacks.index)
+        stacks['Area (sqft)'] = stack_area.fillna(df.groupby(keys, observed=True)['Area (sqft)'].mean().reindex(stacks.index))
+        stacks['Type'] = stack_type
+        floored = df.loc[df['Floor_Num'].notna()]
+        self.stacks = stacks.join(stack_floor_plan(floored))
+
+        observed = self._observed_units(floored)
+        self.units = self._merge_planned(observed)
+        self.default_area = df['Area (sqft)'].median() if not df.empty else 1000
+        self.default_type = df['Type'].mode()[0] if not df.empty else "3 Bedroom"
+
+        # 键 -> 行号，查询为 O(1)；各列另存为数组，逐个单位取值不经过 DataFrame 行对象
+        blks, stks = self.units['BLK'].astype(str).tolist(), self.units['Stack'].astype(str).tolist()
+        self._unit_pos = {k: i for i, k in enumerate(zip(blks, self.units['Floor_Num'].tolist(), stks))}
+        self._stack_pos = {(str(b), str(s)): i for i, (b, s) in enumerate(self.stacks.index)}
+        self._cols = {c: self.units[c].to_numpy() for c in ['Area (sqft)', 'Type', 'Last_Price', 'Last_Date', 'Tx_Count']}
+        self._stack_cols = {c: self.stacks[c].to_numpy() for c in ['Area (sqft)', 'Type']}
+        self._blocks = {}
+        for b, s in self.stacks.index: self._blocks.setdefault(str(b), ([], []))[0].append(str(s))
+        sold = self.units.loc[self.units['Tx_Count'].to_numpy() > 0]
+        for b, floors in sold.groupby(sold['BLK'].astype(str), sort=False)['Floor_Num']:
+            self._blocks[b][1].extend(sorted(floors.unique().tolist(), reverse=True))
+
+    @staticmethod
+    def _observed_units(floored):
+        """有成交的单位：按 (BLK, Stack, 整数楼层) 分组，取最近一笔有日期的成交 (全部无日期时取最后一笔)"""
+        dates = floored['Sale Date'].to_numpy('datetime64[ns]')
+        key = dates.view('int64').copy()
+        key[np.isnat(dates)] = np.iinfo(np.int64).min   # 无日期的成交排在最前，每组最后一行即最近一笔
+        rows = floored.iloc[np.argsort(key, kind='stable')]
+        floor = np.trunc(rows['Floor_Num'].to_numpy('float64')).astype(np.int64)
+        codes = pd.DataFrame({'BLK': rows['BLK'].array, 'Stack': rows['Stack'].array, 'Floor_Num': floor}).groupby(['BLK', 'Stack', 'Floor_Num'], observed=True, sort=True).ngroup().to_numpy()
+        first_rev = np.unique(codes[::-1], return_index=True)[1]
+        last = rows.iloc[len(codes) - 1 - first_rev]
+        return pd.DataFrame({
+            'BLK': last['BLK'].array, 'Stack': last['Stack'].array, 'Floor_Num': floor[len(codes) - 1 - first_rev],
+            'Unit_ID': last['Unit_ID'].astype(str).to_numpy(), 'Area (sqft)': last['Area (sqft)'].to_numpy(), 'Type': last['Type'].astype(object).to_numpy(),
+            'Source': 'History', 'Last_Price': last['Sale Price'].to_numpy('float64'), 'Last_Date': last['Sale Date'].to_numpy(),
+            'Tx_Count': np.bincount(codes),
+        })
+
+    def _merge_planned(self, observed):
+        """按楼层推定补上尚无成交的单位 (面积 / 户型取 Stack 众数)"""
+        plan = self.stacks.loc[self.stacks['n_units'].fillna(0).to_numpy() > 0]
+        n = plan['n_units'].to_numpy(np.int64)
+        offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        floor = np.repeat(plan['start_f'].to_numpy(np.int64), n) + offset * np.repeat(plan['step'].to_numpy(np.int64), n)
+        blk, stack = plan.index.get_level_values('BLK').repeat(n), plan.index.get_level_values('Stack').repeat(n)
+        planned = pd.DataFrame({
+            'BLK': blk, 'Stack': stack, 'Floor_Num': floor,
+            'Unit_ID': pd.Series(blk.astype(str)) + "-" + pd.Series(stack.astype(str)) + "-" + pd.Series(floor).astype(str),
+            'Area (sqft)': plan['Area (sqft)'].to_numpy().repeat(n), 'Type': plan['Type'].to_numpy().repeat(n),
+            'Source': 'Stack Inference', 'Last_Price': np.nan, 'Last_Date': pd.NaT, 'Tx_Count': 0,
+        })
+        units = pd.concat([observed, planned], ignore_index=True).drop_duplicates(['BLK', 'Stack', 'Floor_Num'], keep='first')
+        units['Last_Date'] = units['Last_Date'].astype(observed['Last_Date'].dtype)
+        return units.sort_values(['BLK', 'Stack', 'Floor_Num'], kind='stable').reset_index(drop=True)
+
+    def spec(self, blk, floor, stack):
+        """单位规格 (面积, 户型, 来源, 最近成交价, 最近成交日期)：有成交记录取最近一笔，
+        否则取同 Stack 众数，楼座 / Stack 都不存在时取全盘中位数面积与最常见户型 (口径同原 get_unit_specs)"""
+        i = self._unit_pos.get((str(blk), int(floor), str(stack)))
+        if i is not None and self._cols['Tx_Count'][i] > 0:
+            c = self._cols
+            return c['Area (sqft)'][i], c['Type'][i], 'History', c['Last_Price'][i], pd.Timestamp(c['Last_Date'][i])
+        j = self._stack_pos.get((str(blk), str(stack)))
+        if j is not None: return self._stack_cols['Area (sqft)'][j], self._stack_cols['Type'][j], 'Stack Inference', 0, None
+        return self.default_area, self.default_type, 'Global Default', 0, None
+
+    def block_layout(self, blk):
+        """楼座的 Stack 列表 (自然顺序) 与有成交的楼层 (从高到低)"""
+        stacks, floors = self._blocks.get(str(blk), ([], []))
+        return list(stacks), list(floors)
+
+def unit_master(df):
+    """数据集的 UnitMaster (按数据集版本缓存)"""
+    return utils_cache.derived(df, 'unit_master', lambda: UnitMaster(df))
+
+def estimate_inventory(df, category_col='Category'):
+    """[V250] 按 Stack 推定的楼层数估算各分类的总单位数 (至少为已成交的单位数)；
+    [V257] 楼层推定取自单位主表，每次只按会话的分类列重新归属 Stack"""
+    if 'BLK' not in df.columns or 'Floor_Num' not in df.columns:
+        return df[category_col].value_counts().to_dict() if category_col in df.columns else {}
+    if 'Stack' not in df.columns: return df[category_col].value_counts().to_dict()
+    stacks = unit_master(df).stacks
+    df = df.loc[df['Floor_Num'].notna(), list(dict.fromkeys(['BLK', 'Stack', 'Floor_Num', 'Unit_ID', category_col]))]
+    category = dominant_values(df, ['BLK', 'Stack'], category_col).reindex(stacks.index)
+    estimated = stacks['n_units'].fillna(0).astype(np.int64).groupby(category, observed=True).sum()
+    observed_counts = df.groupby(category_col, observed=True)['Unit_ID'].nunique()
+    return {cat: int(max(estimated.get(cat, 0), observed_counts.get(cat, 0))) for cat in df[category_col].unique()}